@@ -1,6 +1,7 @@
 # app.py — NES ROM Lab (version pédagogique complète sans upload)
 import streamlit as st
-import hashlib, zlib, os
+import html
+import os
 from utils import (
     edu_helpers,
     chr,
@@ -10,7 +11,10 @@ from utils import (
     ppu_scroll,
     ppu_viewer,
     nes_emulator,
+    rom_image,
+    display,
 )
+from utils.artifacts import ARTIFACT_CACHE
 
 # === CONFIGURATION GLOBALE ===
 st.set_page_config(
@@ -20,22 +24,26 @@ st.set_page_config(
 )
 
 st.title("🧬 NES ROM Lab — Exploration pédagogique des ROMs Nintendo")
+display.inject_pixel_css()  # images NES envoyées en taille native, agrandies sans lissage
 
-# === CHARGEMENT AUTOMATIQUE DE LA ROM PAR DÉFAUT ===
-DEFAULT_ROM_PATH = os.path.join("roms", "SMB3.nes")
+# === BIBLIOTHÈQUE DE ROMS (dossier /roms) ===
+ROMS_DIR = "roms"
+DEFAULT_ROM_PATH = os.path.join(ROMS_DIR, "SMB3.nes")
+DEFAULT_ROM_NAME = "Super Mario Bros 3 (démo)"
 
 # --- Initialisation de l’état global ---
 if "rom_loaded" not in st.session_state:
     st.session_state.rom_loaded = False
     st.session_state.rom_name = None
-    st.session_state.header = {}
-    st.session_state.prg_data = b""
-    st.session_state.chr_data = b""
+    st.session_state.rom_path = None
+    st.session_state.rom_member = None
+    st.session_state.rom_sha1 = None
 
 # --- BANDEAU LATÉRAL ---
 st.sidebar.header("📂 Chargement de la ROM")
-if not os.path.exists(DEFAULT_ROM_PATH):
-    st.sidebar.error("❌ Aucune ROM détectée.\nPlace `SMB3.nes` dans le dossier `/roms` pour lancer la démo.")
+catalog = rom_image.list_roms(ROMS_DIR)
+if not catalog:
+    st.sidebar.error("❌ Aucune ROM détectée.\nPlace `SMB3.nes` (ou une archive `.zip`) dans le dossier `/roms` pour lancer la démo.")
     st.stop()
 
 # ✅ Supprimer tout composant d’upload
@@ -47,46 +55,58 @@ st.sidebar.markdown("""
     border-radius:8px;
     border-left:4px solid #00cc66;
     margin-bottom:10px;">
-    🎮 <b>Mode démo activé :</b><br>
-    Chargement automatique de <b>Super Mario Bros 3</b>.<br>
-    <i>(Chargement verrouillé — aucun import possible)</i>
+    🎮 <b>Bibliothèque locale :</b><br>
+    Choisis une ROM parmi celles du dossier <b>/roms</b> (fichiers .nes et archives .zip).<br>
+    <i>(Aucun import possible depuis le navigateur)</i>
 </div>
 """, unsafe_allow_html=True)
 
-# --- Chargement automatique de la ROM ---
-if not st.session_state.rom_loaded:
-    with open(DEFAULT_ROM_PATH, "rb") as f:
-        rom_data = f.read()
-
-    header = rom_data[:16]
-    prg_size = header[4] * 16384
-    chr_size = header[5] * 8192
+labels = [label for label, _, _ in catalog]
+default_label = os.path.relpath(DEFAULT_ROM_PATH, ROMS_DIR).replace(os.sep, "/")
+choice = st.sidebar.selectbox(
+    "🎮 ROM à explorer",
+    labels,
+    index=labels.index(default_label) if default_label in labels else 0,
+    key="rom_choice",
+)
+_, rom_path, rom_member = catalog[labels.index(choice)]
 
-    prg_data = rom_data[16:16 + prg_size]
-    chr_data = rom_data[16 + prg_size:16 + prg_size + chr_size]
+# --- Chargement de la ROM choisie ---
+# Chaque ROM est mappée une seule fois pour tout le processus : chaque session ne garde
+# qu’une référence à l’instance partagée (aucune copie de PRG/CHR par étudiant). Les ROMs
+# récemment ouvertes restent dans un LRU avec leurs artefacts décodés : y revenir est immédiat.
+is_default = rom_member is None and os.path.abspath(rom_path) == os.path.abspath(DEFAULT_ROM_PATH)
+rom = rom_image.open_rom(rom_path, name=DEFAULT_ROM_NAME if is_default else None, member=rom_member)
+st.session_state.rom = rom
 
+if (st.session_state.rom_path, st.session_state.rom_member) != (rom_path, rom_member):
     st.session_state.rom_loaded = True
-    st.session_state.rom_name = "Super Mario Bros 3 (démo)"
-    st.session_state.header = header
-    st.session_state.prg_data = prg_data
-    st.session_state.chr_data = chr_data
+    st.session_state.rom_name = rom.name
+    st.session_state.rom_path = rom_path
+    st.session_state.rom_member = rom_member
+    st.session_state.rom_sha1 = rom.sha1
 
-st.sidebar.success("🎮 ROM chargée : Super Mario Bros 3 (mode démo)")
+st.sidebar.success(f"🎮 ROM chargée : {rom.name}")
 
 # === Données globales ===
 rom_name = st.session_state.rom_name
-header = st.session_state.header
-prg_data = st.session_state.prg_data
-chr_data = st.session_state.chr_data
+header = rom.header
+prg_data = rom.prg
+chr_data = rom.chr
 
-# --- Calcul des empreintes ---
-sha1 = hashlib.sha1(prg_data + chr_data).hexdigest()
-crc32 = f"{zlib.crc32(prg_data + chr_data) & 0xffffffff:08X}"
+# --- Calcul des empreintes (une passe mmap, en cache par chemin/taille/mtime) ---
+digests = rom.digests
+sha1 = digests["headerless"]["sha1"]
+crc32 = digests["headerless"]["crc32"].upper()
+
+with st.sidebar.expander("🗄️ Cache d’artefacts"):
+    st.json(ARTIFACT_CACHE.stats())
+    st.json(display.PNG_CACHE.stats())
+    st.json(rom_image.registry_stats())
 
 # --- Paramètres du header ---
-prg_size = header[4] * 16384 if header else 0
-chr_size = header[5] * 8192 if header else 0
-trainer = bool(header[6] & 0b100) if header else False
+prg_size = rom.prg_size
+chr_size = rom.chr_size
 
 # === BANDEAU D’INFORMATION ROM ===
 st.markdown(f"""
@@ -157,15 +177,15 @@ with tabs[3]:
     with subtab1:
         ppu_viewer.show_ppu_viewer(chr_data)
     with subtab2:
-        ppu_scroll.show_ppu_scroller(chr_data)
+        ppu_scroll.show_ppu_scroller(chr_data, rom.ines.mirroring)
 
 # -----------------------------------------------------------------
 # 📦 ONGLET 5 — STRUCTURE iNES
 # -----------------------------------------------------------------
 with tabs[4]:
     st.header("📦 Structure interne du format iNES")
-    edu_helpers.explain_ines_header(prg_size, chr_size, trainer, header)
-    edu_helpers.explain_integrity(sha1, crc32)
+    edu_helpers.explain_ines_header(header, rom.size)
+    edu_helpers.explain_integrity(sha1, crc32, digests)
 
 # -----------------------------------------------------------------
 # 🗺️ ONGLET 6 — MINIMAP
@@ -307,9 +327,9 @@ st.markdown(
     
     
 # === FOOTER RETRO NES ===
-st.markdown("""
+st.markdown(f"""
 <style>
-.footer {
+.footer {{
     position: fixed;
     bottom: 0;
     left: 0;
@@ -323,18 +343,18 @@ st.markdown("""
     border-top: 1px solid #00ff66;
     box-shadow: 0 -2px 8px rgba(0,255,100,0.2);
     z-index: 100;
-}
-.footer a {
+}}
+.footer a {{
     color: #00ff99;
     text-decoration: none;
-}
-.footer a:hover {
+}}
+.footer a:hover {{
     text-decoration: underline;
-}
+}}
 </style>
 
 <div class="footer">
-    🕹️ <b>NES ROM Lab</b> — Mode démo actif : <b>Super Mario Bros 3</b> | 
+    🕹️ <b>NES ROM Lab</b> — ROM chargée : <b>{html.escape(rom.name)}</b> | 
     © 2025 <a href="https://github.com/cdupasquier" target="_blank">Christophe Dupasquier</a>
 </div>
 """, unsafe_allow_html=True)
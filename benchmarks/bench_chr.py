@@ -0,0 +1,50 @@
+# benchmarks/bench_chr.py — débit du décodeur CHR 2bpp
+# Usage : python benchmarks/bench_chr.py [rom.nes]
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.chr import ChrRam, decode_chr_tiles  # noqa: E402
+
+
+def load_chr(path=None):
+    """CHR-ROM d'une ROM iNES, ou 256 Ko aléatoires si aucun fichier n'est fourni."""
+    if not path:
+        return np.random.randint(0, 256, 256 * 1024, dtype=np.uint8).tobytes()
+    with open(path, "rb") as f:
+        rom = f.read()
+    prg_size = rom[4] * 16384
+    return rom[16 + prg_size:16 + prg_size + rom[5] * 8192]
+
+
+def bench_decode(chr_bytes, repeat=20):
+    decode_chr_tiles(chr_bytes)  # échauffement
+    start = time.perf_counter()
+    for _ in range(repeat):
+        tiles = decode_chr_tiles(chr_bytes)
+    elapsed = (time.perf_counter() - start) / repeat
+    return tiles.shape[0], elapsed
+
+
+def bench_stream(chr_bytes, tiles_per_frame=32, frames=2000):
+    """Mises à jour de CHR-RAM « à la frame » : quelques tuiles réécrites puis re-décodées sur place."""
+    ram = ChrRam(data=chr_bytes[:8 * 1024])
+    chunk = tiles_per_frame * 16
+    start = time.perf_counter()
+    for frame in range(frames):
+        offset = (frame * chunk) % (8 * 1024 - chunk + 1)
+        ram.write(offset, chr_bytes[offset:offset + chunk])
+    return (time.perf_counter() - start) / frames
+
+
+if __name__ == "__main__":
+    data = load_chr(sys.argv[1] if len(sys.argv) > 1 else None)
+    n_tiles, elapsed = bench_decode(data)
+    pixels = n_tiles * 64
+    print(f"{n_tiles} tuiles ({len(data) // 1024} Ko) — {elapsed * 1000:.2f} ms/décodage — "
+          f"{pixels / elapsed / 1e6:.1f} Mpixels/s")
+    per_frame = bench_stream(data)
+    print(f"CHR-RAM en flux (32 tuiles/frame) — {per_frame * 1e6:.1f} µs/frame")
@@ -0,0 +1,122 @@
+# benchmarks/bench_ppu.py — images/s du fond PPU (boucle par tuile vs framebuffer d'indices), du scroll, des sprites et de l'effet CRT
+# Usage : python benchmarks/bench_ppu.py [rom.nes]
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.bench_chr import load_chr  # noqa: E402
+from utils.chr import decode_chr_tiles  # noqa: E402
+from utils.nes_palette import DEMO_PALETTES, NES_PALETTE  # noqa: E402
+from utils.ppu_framebuilder import build_attribute_table, build_name_table  # noqa: E402
+from utils.ppu_render import BackgroundLayer, sub_palettes  # noqa: E402
+from utils.ppu_incremental import IncrementalRenderer  # noqa: E402
+from utils.ppu_scanline import ScanlineRenderer, split_writes  # noqa: E402
+from utils.ppu_sprites import build_oam, composite, render_sprites  # noqa: E402
+from utils.nes_crt_view import CrtSettings, crt_frame  # noqa: E402
+
+
+def legacy_frame(tiles, name_table, attribute_table, base_palette):
+    """Ancien rendu de ppu_framebuilder : np.roll + palette[tile] pour chacune des 960 tuiles."""
+    h, w = name_table.shape
+    frame = np.zeros((h * 8, w * 8, 3), dtype=np.uint8)
+    for ty in range(h):
+        for tx in range(w):
+            tile = tiles[int(name_table[ty, tx]) % len(tiles)]
+            local_palette = np.roll(base_palette, attribute_table[ty // 2, tx // 2], axis=0)
+            frame[ty * 8:(ty + 1) * 8, tx * 8:(tx + 1) * 8] = local_palette[tile]
+    return frame
+
+
+def legacy_sprites(frame, tiles, sprites):
+    """Ancienne couche sprites : une tuile 8×8 copiée par sprite, sans miroir, priorité ni limite."""
+    for x, y, tile_id, attr in sprites:
+        tile = tiles[tile_id % len(tiles)]
+        mask = tile > 0
+        frame[y:y + 8, x:x + 8][mask] = (tile | (attr & 3) << 2)[mask]
+    return frame
+
+
+def legacy_crt(rgb, intensity=0.4):
+    """Ancien nes_crt_view.apply_crt_effect : une ligne sur deux en boucle Python, ImageEnhance, GaussianBlur."""
+    arr = rgb.copy()
+    for y in range(0, arr.shape[0], 2):
+        arr[y, :, :] = (arr[y, :, :] * (1 - intensity)).astype(np.uint8)
+    img = ImageEnhance.Color(Image.fromarray(arr, "RGB")).enhance(1.2)
+    return img.filter(ImageFilter.GaussianBlur(radius=0.6))
+
+
+def fps(fn, seconds=1.0):
+    fn()  # échauffement
+    count, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    tiles = decode_chr_tiles(load_chr(sys.argv[1] if len(sys.argv) > 1 else None))
+    name_table = build_name_table(total_tiles=len(tiles))
+    attribute_table = build_attribute_table()
+    tile_palettes = attribute_table.repeat(2, axis=0).repeat(2, axis=1)
+    palettes = [sub_palettes(indices) for indices in DEMO_PALETTES.values()]
+    base_palette = NES_PALETTE[list(DEMO_PALETTES.values())[0]]
+
+    layer = BackgroundLayer(tiles, name_table, tile_palettes, palettes[0])
+    cycle = iter(range(10 ** 9))
+    scrolled = [np.roll(name_table, i, axis=1) for i in range(32)]
+
+    results = {
+        "avant (boucle par tuile)": fps(lambda: legacy_frame(tiles, name_table, attribute_table, base_palette)),
+        "après (composition complète)": fps(lambda: BackgroundLayer(tiles, name_table, tile_palettes, palettes[0]).rgb()),
+        "après (changement de palette)": fps(lambda: layer.set_palette(palettes[next(cycle) % len(palettes)])),
+        "après (name table décalée)": fps(lambda: layer.set_tiles(scrolled[next(cycle) % 32])),
+    }
+    vram = bytes(np.random.default_rng(1).integers(0, 256, 2048, dtype=np.uint8))
+    scanline = ScanlineRenderer(vram, tiles, "vertical")
+    splits = {100: split_writes(0, 0, 1), 200: split_writes(0, 16, 2)}
+    results.update({
+        "scroll (image sans coupure)": fps(lambda: scanline.render(37, 90)),
+        "scroll (deux coupures)": fps(lambda: scanline.render(37, 90, line_writes=splits)),
+    })
+
+    rng = np.random.default_rng(0)
+    sprites = np.stack([rng.integers(0, 248, 64), rng.integers(0, 232, 64),
+                        rng.integers(0, 256, 64), rng.integers(0, 256, 64)], axis=1)
+    oam = build_oam(sprites)
+    results.update({
+        "sprites avant (64, boucle)": fps(lambda: legacy_sprites(layer.indices.copy(), tiles, sprites)),
+        "sprites après (64 × 8×8)": fps(lambda: composite(layer.indices, render_sprites(oam, tiles))),
+        "sprites après (64 × 8×16)": fps(lambda: composite(layer.indices, render_sprites(oam, tiles, tall=True))),
+    })
+
+    # Image suivante d'une animation : 64 sprites qui bougent d'un pixel, fond et scroll inchangés
+    incremental = IncrementalRenderer(vram[:1024], tiles)
+    moves = [build_oam(np.column_stack([(sprites[:, 0] + i) % 248, sprites[:, 1:]])) for i in range(8)]
+    results.update({
+        "image complète (fond + sprites)": fps(lambda: composite(
+            BackgroundLayer(tiles, name_table, tile_palettes, palettes[0]).indices, render_sprites(moves[next(cycle) % 8], tiles))),
+        "image incrémentale (sprites)": fps(lambda: incremental.update(None, moves[next(cycle) % 8])),
+    })
+
+    # Une case de name table animée (tuile qui change), scroll inchangé : pixels de la case seulement
+    background = IncrementalRenderer(vram[:1024], tiles)
+    background.update(vram[:1024])
+    animated = [bytes(vram[:5]) + bytes([i]) + bytes(vram[6:1024]) for i in range(8)]
+    results.update({
+        "fond complet (plan + scanlines)": fps(lambda: ScanlineRenderer(animated[next(cycle) % 8], tiles).render(0, 0)),
+        "fond incrémental (1 case)": fps(lambda: background.update(animated[next(cycle) % 8])),
+    })
+
+    # Effet CRT sur chaque image (256×240 → 256·s × 240·s, masque, flou et halo)
+    frame_palette = NES_PALETTE[[i for indices in list(DEMO_PALETTES.values())[:4] for i in indices]]
+    results["CRT avant (256×240, PIL)"] = fps(lambda: legacy_crt(frame_palette[layer.indices]))
+    for scale in (2, 3, 4):
+        settings = CrtSettings(scale=scale)
+        results[f"CRT après (×{scale})"] = fps(lambda: crt_frame(layer.indices, frame_palette, settings))
+    for label, value in results.items():
+        print(f"{label:<32} {value:10.1f} images/s  ({1000 / value:.3f} ms)")
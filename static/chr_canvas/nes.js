@@ -0,0 +1,124 @@
+// static/chr_canvas/nes.js
+// Décodage NES côté navigateur, mêmes règles que utils/chr.py, utils/ppu_render.py et
+// utils/ppu_scanline.py : tuiles 2 bpp, name tables + attributs, mirroring, scroll.
+// Fonctions pures (aucun accès au DOM) : chargées par index.html, testables avec Node.
+(function (root) {
+  "use strict";
+
+  const NAMETABLE_SIZE = 1024;
+  const PLANE_SIZE = 512;          // 4 name tables logiques (2×2) de 256×256 (lignes 240–255 comprises)
+  const SCREEN_W = 256;
+  const SCREEN_H = 240;
+
+  // Tuiles 8×8 (N × 64 pixels 0..3) à partir de la CHR brute : 16 octets par tuile, plan bas puis plan haut.
+  function decodeChr(chr) {
+    const count = chr.length >> 4;
+    const tiles = new Uint8Array(count * 64);
+    for (let t = 0; t < count; t++) {
+      for (let row = 0; row < 8; row++) {
+        const lo = chr[t * 16 + row];
+        const hi = chr[t * 16 + 8 + row];
+        const base = t * 64 + row * 8;
+        for (let col = 0; col < 8; col++) {
+          const bit = 7 - col;
+          tiles[base + col] = ((lo >> bit) & 1) | (((hi >> bit) & 1) << 1);
+        }
+      }
+    }
+    return tiles;
+  }
+
+  // Name table physique (1 Ko) en indices 256×256 : sous-palette << 2 | pixel, comme compose_indices.
+  function nametableIndices(vram, physical, tiles, patternTable) {
+    const out = new Uint8Array(256 * 256);
+    const count = tiles.length >> 6;
+    if (!count) return out;
+    const start = physical * NAMETABLE_SIZE;
+    const byte = (i) => (start + i < vram.length ? vram[start + i] : 0);
+    for (let cy = 0; cy < 32; cy++) {
+      for (let cx = 0; cx < 32; cx++) {
+        const tile = (byte(cy * 32 + cx) + 256 * patternTable) % count;
+        const attr = byte(960 + (cy >> 2) * 8 + (cx >> 2));
+        const shift = ((cy & 2) << 1) | (cx & 2);
+        const pal = ((attr >> shift) & 3) << 2;
+        for (let row = 0; row < 8; row++) {
+          const src = tile * 64 + row * 8;
+          const dst = (cy * 8 + row) * 256 + cx * 8;
+          for (let col = 0; col < 8; col++) out[dst + col] = tiles[src + col] | pal;
+        }
+      }
+    }
+    return out;
+  }
+
+  // Plan 512×512 des 4 name tables logiques ; mapping = physique de chaque logique (MIRRORING).
+  function buildPlane(vram, tiles, mapping, patternTable) {
+    const plane = new Uint8Array(PLANE_SIZE * PLANE_SIZE);
+    const physical = {};
+    mapping.forEach((index, logical) => {
+      if (!(index in physical)) physical[index] = nametableIndices(vram, index, tiles, patternTable || 0);
+      const top = (logical >> 1) * 256;
+      const left = (logical & 1) * 256;
+      const src = physical[index];
+      for (let y = 0; y < 256; y++) {
+        plane.set(src.subarray(y * 256, y * 256 + 256), (top + y) * PLANE_SIZE + left);
+      }
+    });
+    return plane;
+  }
+
+  // Table RGBA (Uint32, ordre mémoire R, G, B, A) des 16 couleurs de fond : l'entrée 0 de
+  // chaque sous-palette affiche la couleur universelle $3F00 (ppu_palette_rgb).
+  function paletteLut(master, ram) {
+    const lut = new Uint32Array(16);
+    for (let i = 0; i < 16; i++) {
+      const color = (i & 3 ? ram[i] : ram[0]) & 0x3f;
+      const [r, g, b] = [master[color * 3], master[color * 3 + 1], master[color * 3 + 2]];
+      lut[i] = (0xff << 24) | (b << 16) | (g << 8) | r;
+    }
+    return lut;
+  }
+
+  // Colorie une image d'indices dans un tampon RGBA (Uint32Array de même taille).
+  function colorize(indices, lut, out) {
+    for (let i = 0; i < indices.length; i++) out[i] = lut[indices[i]];
+    return out;
+  }
+
+  // Tranches du plan à copier pour un scroll (x 0..511, y 0..479) : au plus 2 × 2 rectangles.
+  // Verticalement, le PPU reboucle après la ligne 239 d'une name table vers la suivante.
+  function viewportRects(x, y) {
+    x = ((x % PLANE_SIZE) + PLANE_SIZE) % PLANE_SIZE;
+    y = ((y % 480) + 480) % 480;
+    const rows = [];
+    let line = 0;
+    while (line < SCREEN_H) {
+      const pos = (y + line) % 480;
+      const top = pos >= SCREEN_H ? 256 + pos - SCREEN_H : pos;
+      const height = Math.min(SCREEN_H - line, SCREEN_H - (pos % SCREEN_H));
+      rows.push([top, line, height]);
+      line += height;
+    }
+    const cols = [[x, 0, Math.min(PLANE_SIZE - x, SCREEN_W)]];
+    if (cols[0][2] < SCREEN_W) cols.push([0, cols[0][2], SCREEN_W - cols[0][2]]);
+    const rects = [];
+    for (const [sy, dy, h] of rows) for (const [sx, dx, w] of cols) rects.push({ sx, sy, dx, dy, w, h });
+    return rects;
+  }
+
+  // Fenêtre d'indices (240×256) : même résultat que ScanlineRenderer.render(x, y) sans écritures en cours d'image.
+  function viewport(plane, x, y) {
+    const out = new Uint8Array(SCREEN_W * SCREEN_H);
+    for (const r of viewportRects(x, y)) {
+      for (let j = 0; j < r.h; j++) {
+        const src = (r.sy + j) * PLANE_SIZE + r.sx;
+        out.set(plane.subarray(src, src + r.w), (r.dy + j) * SCREEN_W + r.dx);
+      }
+    }
+    return out;
+  }
+
+  const api = { PLANE_SIZE, SCREEN_W, SCREEN_H, decodeChr, nametableIndices, buildPlane, paletteLut, colorize, viewportRects, viewport };
+  if (typeof module !== "undefined" && module.exports) module.exports = api;
+  else root.NES = api;
+})(this);
@@ -0,0 +1,152 @@
+# utils/animation.py
+"""
+Animations pré-rendues : N images calculées dans un thread, livrées en un seul fichier.
+
+Au lieu d'envoyer une image par frame (st.image + time.sleep), les frames d'indices
+de palette sont rendues en arrière-plan puis encodées en APNG (ou GIF) indexé, avec
+une table de couleurs partagée. Le navigateur joue le fichier à la cadence demandée
+(60 i/s en APNG), le script Streamlit n'est pas bloqué image par image et une seule
+ressource passe par le websocket.
+
+L'animation encodée est mise en cache par (contenu, paramètres) dans ARTIFACT_CACHE ;
+deux sessions qui demandent la même animation partagent le même rendu en cours.
+"""
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import streamlit as st
+from PIL import Image
+
+from utils.artifacts import ARTIFACT_CACHE
+from utils.ppu_render import indexed_image
+
+ANIMATION_FORMATS = {"APNG (jusqu'à 60 i/s)": "apng", "GIF (50 i/s max)": "gif"}
+GIF_MIN_FRAME_MS = 20           # GIF : délais en centièmes, les navigateurs ralentissent < 2 cs
+MAX_WORKERS = 2
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="nes-animation")
+_JOBS = {}                      # (empreinte, paramètres) -> AnimationJob en cours
+_JOBS_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Animation:
+    """Animation encodée, prête à être envoyée au navigateur."""
+    data: bytes
+    fmt: str                    # "apng" ou "gif"
+    fps: float
+    frame_count: int
+    size: tuple                 # (largeur, hauteur)
+    info: dict = field(default_factory=dict)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data)
+
+
+@dataclass
+class AnimationJob:
+    """Rendu en cours : avancement mis à jour par le thread de rendu."""
+    total: int
+    done: int = 0
+    stage: str = "rendu"
+    future: object = None
+    result: Animation = None
+
+    @property
+    def progress(self) -> float:
+        return 1.0 if self.result is not None else min(1.0, self.done / max(1, self.total))
+
+
+def frame_durations(count: int, fps: float, fmt: str = "apng") -> list:
+    """Durée de chaque image (ms entières) ; les arrondis se compensent pour tenir la cadence moyenne."""
+    if fmt == "gif":
+        step = max(GIF_MIN_FRAME_MS, round(1000 / fps / 10) * 10)
+        return [step] * count
+    ticks = [round(i * 1000 / fps) for i in range(count + 1)]
+    return [b - a for a, b in zip(ticks, ticks[1:])]
+
+
+def encode_animation(frames, palette_rgb, fps: float = 60, fmt: str = "apng") -> bytes:
+    """
+    Encode des images d'indices (H, W) en APNG ou GIF indexé, palette commune, en boucle.
+    palette_rgb=None : images RGB (H, W, 3) déjà colorées (effet CRT), en couleurs vraies ;
+    compression zlib rapide, le niveau par défaut doublerait l'encodage pour ~5 % de gain.
+    """
+    if palette_rgb is None:
+        images = [Image.fromarray(frame, "RGB") for frame in frames]
+        options = {"compress_level": 1}
+    else:
+        images = [indexed_image(frame, palette_rgb) for frame in frames]
+        options = {}
+    if not images:
+        raise ValueError("Animation vide")
+    buf = io.BytesIO()
+    images[0].save(
+        buf, format="GIF" if fmt == "gif" else "PNG", save_all=True, append_images=images[1:],
+        duration=frame_durations(len(images), fps, fmt), loop=0, **options,
+    )
+    return buf.getvalue()
+
+
+def _render(job: AnimationJob, key, produce, palette_rgb, fps, fmt) -> Animation:
+    """Thread de rendu : produce(job) -> (frames, info), puis encodage et mise en cache."""
+    digest, params = key
+    try:
+        frames, info = produce(job)
+        job.stage = "encodage"
+        data = encode_animation(frames, palette_rgb, fps, fmt)
+        height, width = frames[0].shape[:2]
+        job.result = ARTIFACT_CACHE.put(
+            digest, "animation", Animation(data, fmt, fps, len(frames), (width, height), info), params,
+        )
+        return job.result
+    finally:
+        with _JOBS_LOCK:
+            _JOBS.pop(key, None)
+
+
+def start_animation(digest: str, params: tuple, produce, frame_count: int, palette_rgb,
+                    fps: float = 60, fmt: str = "apng") -> AnimationJob:
+    """
+    Lance (ou retrouve) le rendu d'une animation. `produce(job)` calcule les frames
+    d'indices (ou RGB si palette_rgb est None) dans le thread de rendu (sans appel
+    Streamlit), en incrémentant job.done, et renvoie (frames, info). Une animation déjà
+    en cache est renvoyée terminée.
+    """
+    params = tuple(params) + (fps, fmt)
+    cached = ARTIFACT_CACHE.get(digest, "animation", params)
+    if cached is not None:
+        return AnimationJob(total=cached.frame_count, done=cached.frame_count, result=cached)
+    key = (digest, params)
+    with _JOBS_LOCK:
+        job = _JOBS.get(key)
+        if job is None:
+            job = AnimationJob(total=frame_count)
+            job.future = _EXECUTOR.submit(_render, job, key, produce, palette_rgb, fps, fmt)
+            _JOBS[key] = job
+    return job
+
+
+def wait_animation(job: AnimationJob, poll: float = 0.1) -> Animation:
+    """Attend la fin du rendu en affichant son avancement (une barre, pas une image par frame)."""
+    if job.result is not None:
+        return job.result
+    bar = st.progress(0.0)
+    while not job.future.done():
+        bar.progress(job.progress, text=f"⏳ {job.stage.capitalize()} : {job.done}/{job.total} images")
+        time.sleep(poll)
+    bar.empty()
+    return job.future.result()
+
+
+def show_animation(animation: Animation, caption: str = None, zoom: int = None, target=None):
+    """Affiche l'animation (fichier unique) ; à placer dans un display.pixel_area(), sauf en couleurs vraies (zoom=1)."""
+    target = target if target is not None else st
+    if zoom:
+        target.image(animation.data, caption=caption, width=animation.size[0] * zoom)
+    else:
+        target.image(animation.data, caption=caption, width="stretch")
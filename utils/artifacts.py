@@ -0,0 +1,153 @@
+# utils/artifacts.py
+"""
+Cache d'artefacts décodés, partagé par tout le processus Streamlit.
+
+Chaque artefact (tuiles CHR, mosaïque sans palette, désassemblage, empreintes,
+correspondance No-Intro…) est indexé par le SHA-1 du contenu dont il dérive,
+son type et ses paramètres. Le cache est borné en mémoire et évince les
+entrées les moins récemment utilisées (LRU).
+"""
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_BUDGET_MB = int(os.environ.get("NES_LAB_CACHE_MB", "256"))
+
+_MISSING = object()
+
+
+def _sizeof(value) -> int:
+    """Estimation (en octets) de l'empreinte mémoire d'un artefact."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_sizeof(k) + _sizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if hasattr(value, "size") and hasattr(value, "getbands"):  # PIL.Image
+        w, h = value.size
+        return w * h * len(value.getbands())
+    return sys.getsizeof(value)
+
+
+class ArtifactCache:
+    """Cache LRU borné en octets, indexé par (SHA-1, type d'artefact, paramètres)."""
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # clé -> (valeur, taille)
+        self._lock = threading.RLock()
+
+    def get(self, digest: str, kind: str, params=(), default=None):
+        key = (digest, kind, params)
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, digest: str, kind: str, value, params=()):
+        """Ajoute un artefact ; les tableaux NumPy sont figés en lecture seule (partagés entre sessions)."""
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+        size = _sizeof(value)
+        key = (digest, kind, params)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.used_bytes -= old[1]
+            if size > self.budget_bytes:
+                return value  # trop gros pour le cache : renvoyé sans être conservé
+            self._entries[key] = (value, size)
+            self.used_bytes += size
+            self._evict()
+        return value
+
+    def get_or_build(self, digest: str, kind: str, builder, params=()):
+        """Renvoie l'artefact en cache ou le construit via builder() puis le mémorise."""
+        value = self.get(digest, kind, params, default=_MISSING)
+        if value is _MISSING:
+            value = self.put(digest, kind, builder(), params)
+        return value
+
+    def set_budget(self, budget_bytes: int):
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            self._evict()
+
+    def invalidate(self, digest: str = None):
+        """Supprime les artefacts d'un contenu donné (ou tout le cache)."""
+        with self._lock:
+            for key in [k for k in self._entries if digest is None or k[0] == digest]:
+                self.used_bytes -= self._entries.pop(key)[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "used_mb": round(self.used_bytes / (1024 * 1024), 2),
+                "budget_mb": round(self.budget_bytes / (1024 * 1024), 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _evict(self):
+        while self.used_bytes > self.budget_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.used_bytes -= size
+            self.evictions += 1
+
+
+ARTIFACT_CACHE = ArtifactCache(DEFAULT_BUDGET_MB * 1024 * 1024)
+
+
+# --- SHA-1 des buffers déjà vus (évite de re-hacher la même ROM à chaque rerun) ---
+_DIGESTS = OrderedDict()  # id(buffer) -> (buffer, sha1) ; la référence garde l'id valide
+_DIGESTS_MAX = 64
+_DIGESTS_LOCK = threading.Lock()
+
+
+def content_key(data) -> str:
+    """SHA-1 hexadécimal d'un buffer, mémorisé pour les objets réutilisés d'un rerun à l'autre."""
+    with _DIGESTS_LOCK:
+        entry = _DIGESTS.get(id(data))
+        if entry is not None and entry[0] is data:
+            _DIGESTS.move_to_end(id(data))
+            return entry[1]
+    digest = hashlib.sha1(data).hexdigest()
+    with _DIGESTS_LOCK:
+        _DIGESTS[id(data)] = (data, digest)
+        while len(_DIGESTS) > _DIGESTS_MAX:
+            _DIGESTS.popitem(last=False)
+    return digest
+
+
+def release(data):
+    """
+    Oublie la référence à un buffer (ROM évincée). Ses artefacts restent en cache : une
+    autre ROM ouverte peut partager le même contenu (révision, hack) ; le budget LRU les évince.
+    """
+    with _DIGESTS_LOCK:
+        entry = _DIGESTS.get(id(data))
+        if entry is not None and entry[0] is data:
+            del _DIGESTS[id(data)]
@@ -1,22 +1,169 @@
 # utils/chr.py
+import threading
+
 import numpy as np
+from utils.artifacts import ARTIFACT_CACHE, content_key
+
+TILE_BYTES = 16  # 8 octets plan bas + 8 octets plan haut
+
+
+def decode_chr_tiles(chr_bytes) -> np.ndarray:
+    """
+    Décode une CHR (format 2bpp NES) en un tableau contigu (N, 8, 8) de valeurs 0..3.
+    Accepte bytes, bytearray, memoryview ou tableau uint8 ; aucun parcours pixel par pixel :
+    chaque ligne de tuile (octet bas, octet haut) est lue dans la table row_lut().
+    """
+    total_tiles = len(chr_bytes) // TILE_BYTES
+    tiles = np.empty((total_tiles, 8, 8), dtype=np.uint8)
+    return decode_into(tiles, chr_bytes)
+
+
+# --- Décodage en flux : table de correspondance (octet haut, octet bas) -> 8 pixels ---
+_ROW_LUT = None
+_LUT_LOCK = threading.Lock()
+_SCRATCH = threading.local()
+_CHUNK_TILES = 2048  # 16 Ko d'indices par lot
+
+
+def row_lut() -> np.ndarray:
+    """
+    Table (65536, 8) : l'entrée (haut << 8) | bas donne les 8 pixels 0..3 d'une ligne de tuile.
+    Construite une seule fois (512 Ko), partagée en lecture seule.
+    """
+    global _ROW_LUT
+    if _ROW_LUT is None:
+        with _LUT_LOCK:
+            if _ROW_LUT is None:
+                pairs = np.arange(1 << 16, dtype=np.uint16).astype(">u2").view(np.uint8).reshape(-1, 2, 1)
+                bits = np.unpackbits(pairs, axis=2)  # (65536, [haut, bas], 8)
+                lut = bits[:, 0] << 1
+                lut |= bits[:, 1]
+                lut.flags.writeable = False
+                _ROW_LUT = lut
+    return _ROW_LUT
+
+
+def _scratch(n_rows: int) -> np.ndarray:
+    """Tampon d'indices propre au thread, agrandi au besoin puis réutilisé."""
+    buf = getattr(_SCRATCH, "rows", None)
+    if buf is None or len(buf) < n_rows:
+        buf = _SCRATCH.rows = np.empty(max(n_rows, _CHUNK_TILES * 8), dtype=np.intp)
+    return buf[:n_rows]
+
+
+def tiles_touched(offset: int, length: int) -> range:
+    """Tuiles affectées par l'écriture de `length` octets à l'adresse `offset` de la CHR."""
+    if length <= 0:
+        return range(0)
+    return range(offset // TILE_BYTES, (offset + length - 1) // TILE_BYTES + 1)
+
+
+def decode_into(out: np.ndarray, chr_view, tile_range=None) -> np.ndarray:
+    """
+    Décode les tuiles `tile_range` (range ou (début, fin)) de chr_view dans out[début:fin],
+    un tableau (N, 8, 8) uint8 préalloué. Une ligne de tuile = un accès à la table :
+    rien n'est alloué, ce qui convient aux mises à jour de CHR-RAM à chaque frame.
+    """
+    total_tiles = len(chr_view) // TILE_BYTES
+    if tile_range is None:
+        start, stop = 0, total_tiles
+    elif isinstance(tile_range, range):
+        start, stop = tile_range.start, tile_range.stop
+    else:
+        start, stop = tile_range
+    start, stop = max(start, 0), min(stop, total_tiles, len(out))  # bornes ramenées dans la CHR
+    if stop <= start:
+        return out
+
+    lut = row_lut()
+    for first in range(start, stop, _CHUNK_TILES):  # tampon d'indices borné, quelle que soit la CHR
+        n = min(_CHUNK_TILES, stop - first)
+        planes = np.frombuffer(chr_view, dtype=np.uint8, count=n * TILE_BYTES, offset=first * TILE_BYTES)
+        planes = planes.reshape(n, 2, 8)
+        idx = _scratch(n * 8).reshape(n, 8)
+        np.left_shift(planes[:, 1], 8, out=idx, dtype=np.intp)
+        np.bitwise_or(idx, planes[:, 0], out=idx)
+        np.take(lut, idx.ravel(), axis=0, out=out[first:first + n].reshape(n * 8, 8), mode="clip")
+    return out
+
+
+class ChrRam:
+    """
+    CHR-RAM (8 Ko par défaut) et ses tuiles décodées, tenues à jour en flux :
+    chaque écriture ne re-décode que les tuiles qu'elle touche.
+    """
+
+    def __init__(self, size: int = 8 * 1024, data=None):
+        self.data = bytearray(size)
+        self.tiles = np.zeros((size // TILE_BYTES, 8, 8), dtype=np.uint8)
+        if data is not None:
+            self.load(data)
+
+    def write(self, offset: int, data) -> range:
+        """
+        Écrit des octets (ex. via $2007) et renvoie les tuiles re-décodées ; ce qui dépasse la
+        fin de la CHR-RAM est ignoré. Lève ValueError si offset est hors de [0, taille].
+        """
+        if not 0 <= offset <= len(self.data):
+            raise ValueError(f"Adresse CHR-RAM {offset} hors limites (0..{len(self.data)})")
+        end = min(offset + len(data), len(self.data))
+        self.data[offset:end] = data[:end - offset]
+        touched = tiles_touched(offset, end - offset)
+        decode_into(self.tiles, self.data, touched)
+        return touched
+
+    def load(self, data, offset: int = 0) -> range:
+        """Copie une banque entière (changement de banque CHR)."""
+        return self.write(offset, data)
+
 
 def decode_chr_8x8_tiles(chr_bytes: bytes):
-    """Retourne une liste de tiles 8x8 (valeurs 0..3) décodées depuis CHR-ROM"""
-    tiles = []
-    for off in range(0, len(chr_bytes), 16):
-        if off + 16 > len(chr_bytes):
-            break
-        plane0 = chr_bytes[off:off+8]
-        plane1 = chr_bytes[off+8:off+16]
-        tile = np.zeros((8, 8), dtype=np.uint8)
-        for y in range(8):
-            b0 = plane0[y]
-            b1 = plane1[y]
-            for x in range(8):
-                bit = 7 - x
-                p0 = (b0 >> bit) & 1
-                p1 = (b1 >> bit) & 1
-                tile[y, x] = (p1 << 1) | p0
-        tiles.append(tile)
-    return tiles
+    """Retourne les tiles 8x8 (valeurs 0..3) décodées depuis CHR-ROM, sous forme de tableau (N, 8, 8)."""
+    return decode_chr_tiles(chr_bytes)
+
+
+def build_mosaic(tiles: np.ndarray, tiles_per_row: int = 16) -> np.ndarray:
+    """
+    Assemble des tuiles (N, 8, 8) en une planche d'indices 0..3 (sans palette) :
+    la dernière ligne est complétée par des tuiles vides, puis un seul reshape/transpose
+    place toutes les tuiles (rows, cols, 8, 8) -> (rows × 8, cols × 8).
+    """
+    total_tiles = len(tiles)
+    rows = (total_tiles + tiles_per_row - 1) // tiles_per_row
+    padded = np.zeros((rows * tiles_per_row, 8, 8), dtype=np.uint8)
+    padded[:total_tiles] = tiles
+    return np.ascontiguousarray(
+        padded.reshape(rows, tiles_per_row, 8, 8).transpose(0, 2, 1, 3).reshape(rows * 8, tiles_per_row * 8)
+    )
+
+
+def cached_tiles(chr_bytes) -> np.ndarray:
+    """Tuiles décodées, mises en cache (lecture seule) par SHA-1 de la CHR."""
+    key = content_key(chr_bytes)
+    return ARTIFACT_CACHE.get_or_build(key, "chr_tiles", lambda: decode_chr_tiles(chr_bytes))
+
+
+def cached_mosaic(chr_bytes, tiles_per_row: int = 16) -> np.ndarray:
+    """Planche d'indices sans palette, mise en cache par (SHA-1 de la CHR, tuiles par ligne)."""
+    key = content_key(chr_bytes)
+    return ARTIFACT_CACHE.get_or_build(
+        key, "chr_mosaic",
+        lambda: build_mosaic(cached_tiles(chr_bytes), tiles_per_row),
+        params=(tiles_per_row,),
+    )
+
+
+# --- Pages (banques de 4 ou 8 Ko) : seule la page affichée est décodée ---
+def page_count(chr_bytes, page_size: int = 4096) -> int:
+    return (len(chr_bytes) + page_size - 1) // page_size
+
+
+def cached_page_mosaic(chr_bytes, page: int, page_size: int = 4096, tiles_per_row: int = 16) -> np.ndarray:
+    """Planche d'indices d'une seule page de la CHR, décodée à la demande et mise en cache."""
+    def build():
+        view = memoryview(chr_bytes)[page * page_size:(page + 1) * page_size]
+        return build_mosaic(decode_chr_tiles(view), tiles_per_row)
+
+    return ARTIFACT_CACHE.get_or_build(
+        content_key(chr_bytes), "chr_page", build, params=(page, page_size, tiles_per_row)
+    )
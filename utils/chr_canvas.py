@@ -0,0 +1,68 @@
+# utils/chr_canvas.py
+"""
+Composant Streamlit « chr_canvas » : tuiles, palettes et scroll rendus dans le navigateur.
+
+Le serveur envoie une seule fois des données binaires compactes (CHR brute en 2 bpp,
+VRAM des name tables, palette maître 64 × RGB, palettes RAM de 16 octets) ; le
+composant (static/chr_canvas) décode les tuiles et compose le plan 512×512 en
+JavaScript, avec les mêmes règles que ppu_scanline.ScanlineRenderer. Défilement,
+zoom, mirroring et palette se règlent ensuite dans le <canvas>, sans rerun du script
+ni image réencodée. Une nouvelle empreinte (CHR, VRAM, palettes) relance le décodage.
+"""
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import streamlit.components.v1 as components
+
+from utils.nes_palette import NES_PALETTE
+from utils.ppu_scanline import MIRRORING
+
+COMPONENT_DIR = Path(__file__).resolve().parent.parent / "static" / "chr_canvas"
+CHR_BANK_SIZE = 8192            # 2 tables de motifs de 4 Ko : tout ce que le fond peut adresser
+
+_component = components.declare_component("chr_canvas", path=str(COMPONENT_DIR))
+
+
+def pack_palettes(palette_rams: dict) -> tuple:
+    """(noms, octets) : palettes RAM de fond mises bout à bout, 16 octets chacune."""
+    names = list(palette_rams)
+    data = b"".join(bytes(palette_rams[name][:16]).ljust(16, b"\0") for name in names)
+    return names, data
+
+
+def canvas_digest(*parts) -> str:
+    """
+    SHA-1 des données envoyées, pièce par pièce : ni concaténation à chaque rerun, ni
+    entrée dans la mémo de content_key (réservée aux tampons de ROM qui durent).
+    """
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part)
+    return h.hexdigest()
+
+
+def chr_canvas(chr_data: bytes, vram: bytes, palette_rams: dict, mirroring: str = "horizontal",
+               palette_name: str = None, zoom: int = 2, pattern_table: int = 0, key: str = None):
+    """
+    Affiche le composant. palette_rams : {nom: palette RAM de fond (16 octets)} proposées
+    dans le navigateur ; mirroring et palette_name ne fixent que l'état initial.
+    """
+    chr_bank = bytes(chr_data[:CHR_BANK_SIZE])
+    vram = bytes(vram)
+    names, rams = pack_palettes(palette_rams)
+    return _component(
+        chr=chr_bank,
+        vram=vram,
+        master=np.asarray(NES_PALETTE, dtype=np.uint8).tobytes(),
+        palette_ram=rams,
+        palette_names=names,
+        palette=palette_name if palette_name in palette_rams else (names[0] if names else None),
+        mirroring=mirroring,
+        mirrorings={name: list(mapping) for name, mapping in MIRRORING.items()},
+        zoom=zoom,
+        pattern_table=pattern_table,
+        digest=canvas_digest(chr_bank, vram, rams, bytes([pattern_table])),
+        key=key,
+        default=None,
+    )
@@ -0,0 +1,324 @@
+# utils/chr_index.py
+"""
+Index des tuiles CHR : doublons exacts et tuiles identiques à un miroir près.
+
+Chaque tuile est identifiée par ses 16 octets bruts (2 plans × 8 lignes) :
+- miroir horizontal = bits de chaque octet inversés (table de 256 entrées) ;
+- miroir vertical   = ordre des 8 lignes inversé dans chaque plan.
+La forme canonique d'une tuile est la plus petite de ses 4 variantes (identité, H, V, HV) :
+deux tuiles de même forme canonique ne diffèrent que par un miroir, que la NES applique
+gratuitement aux sprites (bits 6–7 des attributs OAM). Tout est vectorisé (np.unique).
+
+Recherche de tuiles similaires : distance de Hamming entre plans de bits (XOR puis
+comptage des bits à 1), calculée par lots sur 2 mots de 64 bits par tuile. Un index
+sur disque (.npy, lu en mmap) permet de chercher dans toute la bibliothèque /roms.
+"""
+import json
+import os
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from utils import nointro
+from utils.artifacts import ARTIFACT_CACHE, content_key
+from utils.chr import TILE_BYTES, decode_chr_tiles
+
+CHR_BANK_SIZE = 8 * 1024
+FLIP_LABELS = ("aucun", "horizontal", "vertical", "horizontal + vertical")
+
+BIT_REVERSE = np.packbits(np.unpackbits(np.arange(256, dtype=np.uint8).reshape(-1, 1), axis=1)[:, ::-1], axis=1).ravel()
+
+
+def raw_tiles(chr_bytes) -> np.ndarray:
+    """Vue (N, 16) sur les octets bruts des tuiles (sans copie)."""
+    total = len(chr_bytes) // TILE_BYTES
+    return np.frombuffer(chr_bytes, dtype=np.uint8, count=total * TILE_BYTES).reshape(total, TILE_BYTES)
+
+
+def tile_variants(raw: np.ndarray) -> np.ndarray:
+    """Les 4 variantes (identité, H, V, HV) de chaque tuile brute : tableau (N, 4, 16)."""
+    planes = raw.reshape(-1, 2, 8)
+    h = BIT_REVERSE[planes]
+    variants = np.empty((len(raw), 4, 2, 8), dtype=np.uint8)
+    variants[:, 0] = planes
+    variants[:, 1] = h
+    variants[:, 2] = planes[:, :, ::-1]
+    variants[:, 3] = h[:, :, ::-1]
+    return variants.reshape(-1, 4, TILE_BYTES)
+
+
+def _as_keys(raw: np.ndarray) -> np.ndarray:
+    """Une clé scalaire (16 octets opaques) par tuile, comparable et triable."""
+    return np.ascontiguousarray(raw).view(np.dtype((np.void, TILE_BYTES))).ravel()
+
+
+def _canonical(raw: np.ndarray):
+    """Forme canonique (N, 16) et index de la variante retenue (0..3, voir FLIP_LABELS)."""
+    variants = tile_variants(raw)
+    # Ordre lexicographique big-endian sur 2 mots de 64 bits = ordre des octets
+    words = variants.view(">u8")  # (N, 4, 2)
+    order = np.lexsort((words[..., 1], words[..., 0]), axis=-1)
+    flip = order[:, 0]
+    return variants[np.arange(len(raw)), flip], flip.astype(np.uint8)
+
+
+def _group_members(ids: np.ndarray, min_size: int = 2) -> list:
+    """Indices des tuiles de chaque groupe d'au moins min_size membres, du plus grand au plus petit."""
+    order = np.argsort(ids, kind="stable")
+    counts = np.bincount(ids)
+    groups = np.split(order, np.cumsum(counts)[:-1])
+    groups = [g for g in groups if len(g) >= min_size]
+    groups.sort(key=len, reverse=True)
+    return groups
+
+
+@dataclass(frozen=True)
+class TileIndex:
+    """Résultat de l'indexation d'une CHR (identifiants de groupe par tuile + statistiques)."""
+    exact_id: np.ndarray       # (N,) groupe de doublons exacts
+    flip_id: np.ndarray        # (N,) groupe à un miroir près
+    flip: np.ndarray           # (N,) miroir qui ramène la tuile à sa forme canonique
+    bank_tiles: int
+
+    @property
+    def tile_count(self) -> int:
+        return len(self.exact_id)
+
+    @property
+    def unique_exact(self) -> int:
+        return int(self.exact_id.max()) + 1 if self.tile_count else 0
+
+    @property
+    def unique_with_flips(self) -> int:
+        return int(self.flip_id.max()) + 1 if self.tile_count else 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.exact_id.nbytes + self.flip_id.nbytes + self.flip.nbytes
+
+    def savings(self) -> dict:
+        """Octets de CHR économisés si les doublons (puis les miroirs) étaient fusionnés."""
+        return {
+            "doublons_exacts": (self.tile_count - self.unique_exact) * TILE_BYTES,
+            "avec_miroirs": (self.tile_count - self.unique_with_flips) * TILE_BYTES,
+        }
+
+    def per_bank(self) -> list:
+        """Tuiles, tuiles uniques et uniques à un miroir près pour chaque banque CHR."""
+        if not self.tile_count:
+            return []
+        bank = np.arange(self.tile_count) // self.bank_tiles
+        n_banks = int(bank[-1]) + 1
+
+        def unique_per_bank(ids):
+            pairs = np.unique(bank.astype(np.int64) * (int(ids.max()) + 1) + ids)
+            return np.bincount(pairs // (int(ids.max()) + 1), minlength=n_banks)
+
+        tiles = np.bincount(bank, minlength=n_banks)
+        exact = unique_per_bank(self.exact_id)
+        flips = unique_per_bank(self.flip_id)
+        return [
+            {"banque": b, "tuiles": int(tiles[b]), "uniques": int(exact[b]), "uniques_avec_miroirs": int(flips[b])}
+            for b in range(n_banks)
+        ]
+
+    def duplicate_groups(self, with_flips: bool = False, min_size: int = 2) -> list:
+        """Groupes (tableaux d'indices de tuiles) de doublons exacts ou à un miroir près."""
+        return _group_members(self.flip_id if with_flips else self.exact_id, min_size)
+
+
+def build_tile_index(chr_bytes, bank_size: int = CHR_BANK_SIZE) -> TileIndex:
+    """Indexe toutes les tuiles d'une CHR (bytes, memoryview…) en quelques passes NumPy."""
+    raw = raw_tiles(chr_bytes)
+    _, exact_id = np.unique(_as_keys(raw), return_inverse=True)
+    canonical, flip = _canonical(raw)
+    _, flip_id = np.unique(_as_keys(canonical), return_inverse=True)
+    return TileIndex(
+        exact_id=exact_id.ravel().astype(np.int32),
+        flip_id=flip_id.ravel().astype(np.int32),
+        flip=flip,
+        bank_tiles=max(1, bank_size // TILE_BYTES),
+    )
+
+
+def cached_tile_index(chr_bytes, bank_size: int = CHR_BANK_SIZE) -> TileIndex:
+    """Index mis en cache par SHA-1 de la CHR."""
+    return ARTIFACT_CACHE.get_or_build(
+        content_key(chr_bytes), "chr_index",
+        lambda: build_tile_index(chr_bytes, bank_size),
+        params=(bank_size,),
+    )
+
+
+# ======================================================
+# 🔎 RECHERCHE PAR DISTANCE DE HAMMING
+# ======================================================
+LIBRARY_INDEX_DIR = nointro.CACHE_DIR / "tile_index"
+_POPCOUNT8 = np.unpackbits(np.arange(256, dtype=np.uint8).reshape(-1, 1), axis=1).sum(axis=1).astype(np.uint8)
+
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Nombre de bits à 1 de chaque mot uint64 (np.bitwise_count si NumPy ≥ 2, sinon table 8 bits)."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    return _POPCOUNT8[words.view(np.uint8)].reshape(*words.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+def tile_words(raw: np.ndarray) -> np.ndarray:
+    """Tuiles brutes (N, 16) vues comme (N, 2) mots de 64 bits : plan bas, plan haut."""
+    return np.ascontiguousarray(raw).view(np.uint64)
+
+
+def hamming_distances(query: np.ndarray, words: np.ndarray, batch: int = 1 << 16) -> np.ndarray:
+    """
+    Distance de Hamming (0..128) entre une tuile (16 octets ou 2 mots) et chaque tuile de words (N, 2).
+    Traité par lots pour borner la mémoire temporaire, y compris sur un index mmap.
+    """
+    query = np.frombuffer(query, dtype=np.uint8) if isinstance(query, (bytes, bytearray, memoryview)) else np.asarray(query)
+    q = tile_words(query.reshape(1, TILE_BYTES)) if query.dtype == np.uint8 else query.reshape(1, 2)
+    out = np.empty(len(words), dtype=np.uint8)
+    for start in range(0, len(words), batch):
+        chunk = np.bitwise_xor(words[start:start + batch], q)
+        out[start:start + batch] = _popcount(chunk).sum(axis=1, dtype=np.uint8)
+    return out
+
+
+def nearest(distances: np.ndarray, k: int, exclude: int = None) -> np.ndarray:
+    """Indices des k plus petites distances, triés (argpartition puis tri des k retenus)."""
+    if exclude is not None:
+        distances = distances.copy()
+        distances[exclude] = np.iinfo(distances.dtype).max
+    k = min(k, len(distances) - (exclude is not None))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    candidates = np.argpartition(distances, k - 1)[:k]
+    return candidates[np.argsort(distances[candidates], kind="stable")]
+
+
+def cached_tile_words(chr_bytes) -> np.ndarray:
+    return ARTIFACT_CACHE.get_or_build(content_key(chr_bytes), "chr_words", lambda: tile_words(raw_tiles(chr_bytes)).copy())
+
+
+def similar_tiles(chr_bytes, tile: int, k: int = 8) -> list:
+    """Les k tuiles de la même CHR les plus proches de la tuile n° tile : [(indice, distance)]."""
+    words = cached_tile_words(chr_bytes)
+    distances = hamming_distances(words[tile], words)
+    return [(int(i), int(distances[i])) for i in nearest(distances, k, exclude=tile)]
+
+
+class LibraryTileIndex:
+    """
+    Index de tuiles de toute une bibliothèque, stocké dans un dossier :
+    words.npy (M, 2) uint64, owners.npy (M, 2) int32 = (n° de ROM, n° de tuile), roms.json
+    (ROMs indexées + empreinte (chemin, membre, taille, mtime_ns) du catalogue indexé).
+    Les tableaux sont ouverts en mmap : rien n'est chargé tant qu'on ne cherche pas.
+    """
+
+    def __init__(self, directory=LIBRARY_INDEX_DIR):
+        directory = Path(directory)
+        with open(directory / "roms.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if not isinstance(meta, dict):
+            raise ValueError("index de bibliothèque à l'ancien format")
+        self.roms = meta["roms"]
+        self.catalog = meta["catalog"]
+        self.words = np.load(directory / "words.npy", mmap_mode="r")
+        self.owners = np.load(directory / "owners.npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.words)
+
+    def search(self, query, k: int = 8) -> list:
+        """[(entrée roms.json, n° de tuile, distance)] des k tuiles les plus proches."""
+        distances = hamming_distances(query, self.words)
+        return [
+            (self.roms[int(self.owners[i, 0])], int(self.owners[i, 1]), int(distances[i]))
+            for i in nearest(distances, k)
+        ]
+
+    @classmethod
+    def load(cls, directory=LIBRARY_INDEX_DIR):
+        """Index existant, ou None s'il n'a pas encore été construit."""
+        try:
+            return cls(directory)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def is_current(self, catalog) -> bool:
+        """Vrai si le catalogue n'a pas changé depuis la construction (ajout, retrait, fichier modifié)."""
+        return self.catalog == catalog_stamps(catalog)
+
+
+def catalog_stamps(catalog) -> list:
+    """[[chemin, membre, taille, mtime_ns]] du catalogue : une ROM modifiée ou retirée change la liste."""
+    stamps = []
+    for _, path, member in catalog:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        stamps.append([str(path), member, st.st_size, st.st_mtime_ns])
+    return stamps
+
+
+def read_library_tile(entry: dict, tile_no: int) -> np.ndarray:
+    """
+    Tuile (8, 8) d'une entrée de l'index, lue hors du registre rom_image (la ROM affichée
+    n'est ni déplacée dans le LRU ni libérée) : seuls ses 16 octets sont décodés.
+    Lève OSError / ValueError / IndexError si la ROM a changé depuis l'indexation.
+    """
+    from utils.rom_image import RomImage
+
+    path, member = entry["path"], entry["member"]
+    st = os.stat(path)
+    if (st.st_size, st.st_mtime_ns) != (entry["size"], entry["mtime_ns"]):
+        raise ValueError(f"{path} a changé depuis l'indexation")
+    rom = RomImage.from_file(path) if member is None else RomImage.from_zip(path, member)
+    raw = rom.chr[tile_no * TILE_BYTES:(tile_no + 1) * TILE_BYTES]
+    if len(raw) != TILE_BYTES:
+        raise IndexError(f"Tuile {tile_no} hors de la CHR de {entry['label']}")
+    return decode_chr_tiles(bytes(raw))[0]
+
+
+def build_library_index(catalog, directory=LIBRARY_INDEX_DIR) -> LibraryTileIndex:
+    """
+    Construit l'index à partir d'un catalogue [(libellé, chemin, membre)] (voir rom_image.list_roms).
+    Les doublons exacts d'une même ROM ne sont indexés qu'une fois.
+    """
+    from utils.rom_image import RomImage
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    catalog = list(catalog)
+    stamps = catalog_stamps(catalog)
+    roms, words, owners = [], [], []
+    for label, path, member in catalog:
+        try:
+            st = os.stat(path)
+            rom = RomImage.from_file(path) if member is None else RomImage.from_zip(path, member)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            continue
+        raw = raw_tiles(rom.chr)
+        if not len(raw):
+            continue
+        _, first = np.unique(_as_keys(raw), return_index=True)
+        first.sort()
+        words.append(tile_words(raw[first]))
+        owners.append(np.column_stack([np.full(len(first), len(roms), dtype=np.int32), first.astype(np.int32)]))
+        roms.append({"label": label, "path": str(path), "member": member,
+                     "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+
+    words = np.concatenate(words) if words else np.empty((0, 2), dtype=np.uint64)
+    owners = np.concatenate(owners) if owners else np.empty((0, 2), dtype=np.int32)
+    # Écriture atomique : un index à moitié écrit n'est jamais ouvert
+    for name, array in (("words.npy", words), ("owners.npy", owners)):
+        tmp = directory / f"{name}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, directory / name)
+    with open(directory / "roms.json.tmp", "w", encoding="utf-8") as f:
+        json.dump({"catalog": stamps, "roms": roms}, f, ensure_ascii=False)
+    os.replace(directory / "roms.json.tmp", directory / "roms.json")
+    return LibraryTileIndex(directory)
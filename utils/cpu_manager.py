@@ -3,23 +3,22 @@ from py65.devices.mpu6502 import MPU
 import streamlit as st
 import numpy as np
 from utils import disasm
+from utils.ines import initial_prg_map
 
-def init_cpu(prg_data: bytes, prg_size: int, reset_vector: int):
+def init_cpu(prg_data: bytes, layout, reset_vector: int = None):
     """
     Initialise et retourne un CPU MPU avec le PRG-ROM mappé à 0x8000..0xFFFF.
+    `layout` est le header décodé (utils.ines.InesHeader) : les banques visibles
+    au démarrage dépendent du mapper. Sans reset_vector, le vecteur $FFFC est lu.
     """
     cpu = MPU()
 
-    try:
-        if prg_size == 16 * 1024:
-            cpu.memory[0x8000:0x8000 + prg_size] = prg_data
-            cpu.memory[0xC000:0xC000 + prg_size] = prg_data
-        else:
-            length = min(prg_size, 0x8000)
-            cpu.memory[0x8000:0x8000 + length] = prg_data[:length]
-    except Exception:
-        cpu.memory[0x8000:0x8000 + min(prg_size, 0x8000)] = prg_data[:min(prg_size, 0x8000)]
+    for cpu_addr, offset, length in initial_prg_map(layout):
+        bank = prg_data[offset:offset + length]
+        cpu.memory[cpu_addr:cpu_addr + len(bank)] = bank
 
+    if reset_vector is None:
+        reset_vector = cpu.memory[0xFFFC] | (cpu.memory[0xFFFD] << 8)
     cpu.pc = reset_vector
     return cpu
 
@@ -73,6 +72,7 @@ def run_steps(session_state: dict, n: int = 1):
 import streamlit as st
 import numpy as np
 from . import disasm
+from .artifacts import ARTIFACT_CACHE, content_key
 
 
 def show_cpu_interface(prg_data: bytes):
@@ -141,12 +141,15 @@ def show_cpu_interface(prg_data: bytes):
                 self.memory = np.frombuffer(data, dtype=np.uint8)
                 self.instruction_size = {}
 
-        cpu = DummyCPU(prg_data)
+        # --- Désassemblage (mis en cache par SHA-1 de la PRG et fenêtre affichée) ---
+        def build_disasm():
+            cpu = DummyCPU(prg_data)
+            disasm_text = disasm.disassemble_full(cpu, start_addr, count=count)
+            return disasm.colorize_disasm(disasm_text, start_addr)
 
-        # --- Désassemblage ---
-        disasm_text = disasm.disassemble_full(cpu, start_addr, count=count)
-        current_pc = start_addr
-        html = disasm.colorize_disasm(disasm_text, current_pc)
+        html = ARTIFACT_CACHE.get_or_build(
+            content_key(prg_data), "disasm", build_disasm, params=(start_addr, count)
+        )
 
         # === Rendu HTML isolé ===
         with st.container():
@@ -0,0 +1,79 @@
+# utils/display.py
+"""
+Affichage des images « pixel art » : résolution native, agrandissement dans le navigateur.
+
+Les images sont envoyées à leur taille NES (256×240, planche 128×256…) et c'est le
+navigateur qui les agrandit, sans lissage (CSS `image-rendering: pixelated`) : le
+coût d'encodage et le volume transféré ne dépendent plus du zoom. Le PNG encodé est
+mis en cache par empreinte du contenu ; une image inchangée garde les mêmes octets,
+donc la même URL de média Streamlit, et le navigateur la reprend de son cache.
+Ce cache de PNG est un LRU à part, de petite taille : les images d'un seul rerun
+(scroll, tirages aléatoires…) n'évincent pas les artefacts coûteux d'ARTIFACT_CACHE.
+"""
+import hashlib
+import io
+import os
+
+import streamlit as st
+from PIL import Image
+
+from utils.artifacts import ArtifactCache
+
+PNG_CACHE_MB = int(os.environ.get("NES_LAB_PNG_CACHE_MB", "16"))
+PNG_CACHE = ArtifactCache(PNG_CACHE_MB * 1024 * 1024)
+
+PIXEL_AREA_PREFIX = "nes-px-"
+PIXEL_CSS = f"""
+<style>
+div[class*="st-key-{PIXEL_AREA_PREFIX}"] img {{
+    image-rendering: crisp-edges;
+    image-rendering: pixelated;
+}}
+</style>
+"""
+
+
+def inject_pixel_css():
+    """Règle CSS (une fois par page) : images des zones pixel_area() agrandies sans lissage."""
+    st.markdown(PIXEL_CSS, unsafe_allow_html=True)
+
+
+def image_key(img: Image.Image) -> str:
+    """Empreinte SHA-1 du contenu d'une image (mode, taille, palette, pixels)."""
+    h = hashlib.sha1(f"{img.mode}:{img.width}x{img.height}".encode())
+    palette = img.getpalette() if img.mode == "P" else None
+    if palette:
+        h.update(bytes(palette))
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def png_bytes(img: Image.Image) -> bytes:
+    """PNG de l'image, encodé une seule fois par contenu."""
+    def encode():
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        return buf.getvalue()
+
+    return PNG_CACHE.get_or_build(image_key(img), "png", encode)
+
+
+def pixel_area(key: str):
+    """Conteneur dont les images sont agrandies par le navigateur sans lissage."""
+    try:
+        return st.container(key=f"{PIXEL_AREA_PREFIX}{key}")
+    except TypeError:  # Streamlit sans clé de conteneur : images affichées, mais lissées
+        return st.container()
+
+
+def show_pixels(img: Image.Image, caption: str = None, zoom: int = None, target=None):
+    """
+    Affiche une image à résolution native ; zoom = facteur d'agrandissement (sinon pleine largeur).
+    `target` permet d'écrire dans un st.empty() (animations) ; à placer dans un pixel_area().
+    """
+    target = target if target is not None else st
+    data = png_bytes(img)
+    if zoom:
+        target.image(data, caption=caption, width=img.width * zoom)
+    else:
+        target.image(data, caption=caption, width="stretch")
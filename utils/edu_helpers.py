@@ -1,10 +1,20 @@
 # utils/edu_helpers.py
 import streamlit as st
-import xml.etree.ElementTree as ET
+import zipfile
 from pathlib import Path
 import numpy as np
 from PIL import Image
 from utils.disasm import disassemble_full, colorize_disasm
+from utils.chr import cached_mosaic, cached_tiles
+from utils.ppu_viewer import render_page_image, select_chr_page
+from utils.ppu_render import indexed_image
+from utils.display import pixel_area, show_pixels
+from utils.chr_index import (
+    FLIP_LABELS, LibraryTileIndex, build_library_index, cached_tile_index, raw_tiles, read_library_tile, similar_tiles,
+)
+from utils.artifacts import ARTIFACT_CACHE
+from utils import nointro, rom_image
+from utils.ines import parse_header
 import matplotlib.pyplot as plt
 # ---------------------------------------------------
 # 🎓 INTRODUCTION GÉNÉRALE
@@ -120,10 +130,15 @@ def explain_octet_lifecycle():
     > créant le mouvement fluide des jeux NES.
     """)
 
-def explain_ines_header(prg_size, chr_size, trainer, header_bytes):
-    """Analyse et explique le header iNES d'une ROM NES, sans bloquer l'exécution."""
+def explain_ines_header(header_bytes, file_size: int = None):
+    """
+    Analyse et explique le header iNES / NES 2.0 d'une ROM NES, sans bloquer l'exécution.
+    Toutes les valeurs proviennent du décodage de utils.ines (tailles, mapper, trainer…).
+    """
     import streamlit as st
 
+    layout = parse_header(header_bytes)
+
     st.header("📦 Structure interne du format iNES")
     st.markdown("""
     Le format **iNES** (pour *Nintendo Entertainment System*) décrit la structure binaire d'une ROM NES :
@@ -132,7 +147,7 @@ def explain_ines_header(prg_size, chr_size, trainer, header_bytes):
     """)
 
     # Vérifie la signature magique NES<1A>
-    if len(header_bytes) < 16 or header_bytes[:4] != b"NES\x1A":
+    if not layout.valid:
         st.warning("""
         ⚠️ **Le fichier ne respecte pas entièrement le format standard `iNES`.**
 
@@ -144,33 +159,23 @@ def explain_ines_header(prg_size, chr_size, trainer, header_bytes):
         💡 L’analyse se poursuit quand même à titre pédagogique, mais certaines informations peuvent être incorrectes.
         """)
 
-        # On remplit avec des valeurs par défaut pour éviter un crash
-        prg_size = 0
-        chr_size = 0
-        mapper = 0
-        mirroring = "Inconnu"
-        trainer = False
     else:
-        # Lecture des informations du header
-        mapper = (header_bytes[6] >> 4) | (header_bytes[7] & 0xF0)
-        mirroring = "Verticale" if header_bytes[6] & 1 else "Horizontale"
-        prg_size_kb = prg_size // 1024
-        chr_size_kb = chr_size // 1024
-
         st.markdown("""
         ### 🧠 Décodage du header iNES
         Voici les champs clés interprétés depuis le header binaire :
         """)
 
         st.json({
-            "Signature": header_bytes[:4].decode(errors="replace"),
-            "PRG-ROM": f"{prg_size_kb} Ko",
-            "CHR-ROM": f"{chr_size_kb} Ko",
-            "Mapper": mapper,
-            "Mirroring": mirroring,
-            "Trainer présent": bool(header_bytes[6] & 0b100),
+            "Signature": bytes(header_bytes[:4]).decode(errors="replace"),
+            **layout.summary(),
+            "Offsets (trainer / PRG / CHR)": (
+                f"0x{layout.trainer_offset:X} / 0x{layout.prg_offset:X} / 0x{layout.chr_offset:X}"
+            ),
         })
 
+        for issue in layout.anomalies(file_size):
+            st.warning(f"⚠️ {issue}")
+
         st.caption("""
         💡 *Le mapper est une puce intégrée à la cartouche NES.  
         Elle permet d’adresser plus de mémoire et d’ajouter des fonctionnalités spécifiques (bank switching, IRQ, etc.).*
@@ -189,8 +194,11 @@ def explain_ines_header(prg_size, chr_size, trainer, header_bytes):
     | 4 | Taille PRG-ROM | En blocs de 16 Ko |
     | 5 | Taille CHR-ROM | En blocs de 8 Ko |
     | 6 | Flags 6 | Mirroring, batterie, trainer, Mapper bas |
-    | 7 | Flags 7 | Mapper haut, VS Unisystem, PlayChoice |
-    | 8–15 | Extension | Souvent inutilisée ou réservée |
+    | 7 | Flags 7 | Mapper haut, VS Unisystem, PlayChoice, signature NES 2.0 |
+    | 8 | Mapper / sous-mapper | NES 2.0 : bits hauts du mapper + sous-mapper (iNES : PRG-RAM) |
+    | 9 | Tailles (MSB) | NES 2.0 : bits hauts PRG/CHR, ou notation exposant × multiplicateur |
+    | 10–11 | RAM | NES 2.0 : PRG-RAM / NVRAM et CHR-RAM / NVRAM (64 << n octets) |
+    | 12–15 | Timing & divers | NES 2.0 : NTSC/PAL, type de console, ROMs annexes, périphérique |
     """)
 
     st.info("""
@@ -208,8 +216,11 @@ def explain_ines_header(prg_size, chr_size, trainer, header_bytes):
 
 
 
-def explain_integrity(sha1: str, crc32: str):
-    """Affiche la section pédagogique sur l’intégrité du fichier NES (SHA1 / CRC32)."""
+def explain_integrity(sha1: str, crc32: str, digests: dict = None):
+    """
+    Affiche la section pédagogique sur l’intégrité du fichier NES (SHA1 / CRC32).
+    `digests` (utils.hashing) ajoute les empreintes avec header, celles utilisées par No-Intro.
+    """
     import streamlit as st
 
     col1, col2 = st.columns(2)
@@ -241,15 +252,19 @@ def explain_integrity(sha1: str, crc32: str):
             "CRC32": "{crc32}"
         }}
         ```""")
+        if digests:
+            with st.expander("🧾 Toutes les empreintes (avec / sans header)"):
+                st.json({"Avec header": digests["headered"], "Sans header": digests["headerless"]})
 
-        # --- Vérification No-Intro ---
-        match = check_no_intro_match(sha1, crc32)
+        # --- Vérification No-Intro (la base locale référence les ROMs avec header) ---
+        match = None
+        if digests:
+            match = check_no_intro_match(digests["headered"]["sha1"], digests["headered"]["crc32"])
+        match = match or check_no_intro_match(sha1, crc32)
 
         # --- Vérification structure iNES ---
-        header = st.session_state.get("header")
-        prg_size = st.session_state.get("prg_size", 0)
-        chr_size = st.session_state.get("chr_size", 0)
-        structure_ok = validate_ines_structure(header, prg_size, chr_size) if header else False
+        rom = st.session_state.get("rom")
+        structure_ok = validate_ines_structure(rom.header, rom.prg_size, rom.chr_size) if rom else False
 
         # --- Cas 1 : ROM reconnue ---
         if match:
@@ -323,33 +338,23 @@ def check_no_intro_match(sha1: str, crc32: str, dat_path: str = "data/No-Intro-N
     """
     Vérifie si les empreintes de la ROM (SHA1 ou CRC32)
     correspondent à une ROM répertoriée dans la base No-Intro locale (.dat).
-    Compatible avec les fichiers XML récents contenant <category> et <rom ...>.
+    La recherche passe par l'index compilé (utils.nointro) au lieu de re-parser le XML.
     """
     p = Path(dat_path)
     if not p.exists():
         return None
 
     try:
-        tree = ET.parse(p)
-        root = tree.getroot()
-
-        for game in root.findall(".//game"):
-            rom = game.find("rom")
-            if rom is None:
-                continue
-
-            # Récupération des empreintes avec tolérance sur la casse
-            rom_sha1 = rom.attrib.get("sha1", "").strip().lower()
-            rom_crc32 = rom.attrib.get("crc", "").strip().upper()
-
-            # Comparaison
-            if sha1.lower() == rom_sha1 or crc32.upper() == rom_crc32:
-                # Retourne un nom lisible
-                title = game.attrib.get("name") or game.findtext("description") or "Jeu inconnu"
-                return title
+        index = nointro.get_index(p)
     except Exception as e:
         st.warning(f"Erreur lors du chargement du fichier No-Intro : {e}")
-    return None
+        return None
+
+    return ARTIFACT_CACHE.get_or_build(
+        sha1.lower(), "no_intro",
+        lambda: index.find_title(sha1=sha1, crc32=crc32),
+        params=(crc32.upper(), index.version, index.stamp),
+    )
 
 def validate_ines_structure(header: bytes, prg_size: int, chr_size: int):
     """
@@ -358,9 +363,7 @@ def validate_ines_structure(header: bytes, prg_size: int, chr_size: int):
     - Taille PRG/CHR réaliste
     Retourne True si tout semble valide, sinon False.
     """
-    if len(header) < 16:
-        return False
-    if header[:4] != b"NES\x1A":
+    if not parse_header(header).valid:
         return False
 
     # Vérification tailles typiques
@@ -372,6 +375,9 @@ def validate_ines_structure(header: bytes, prg_size: int, chr_size: int):
 # ======================================================
 # 🧱 EXPLICATION DES TUILES CHR (corrigée pour CHR-RAM)
 # ======================================================
+GRAYSCALE_PALETTE = [(0, 0, 0), (85, 85, 85), (170, 170, 170), (255, 255, 255)]
+
+
 def explain_chr_tiles(chr_data: bytes):
     """Explique et visualise les tuiles graphiques (CHR-ROM) d'une ROM NES, avec fallback CHR simulée."""
     st.header("🧱 CHR — Visualisation des tuiles")
@@ -384,7 +390,8 @@ def explain_chr_tiles(chr_data: bytes):
     """)
 
     # === Si aucune CHR-ROM, créer un motif simulé (CHR-RAM pédagogique) ===
-    if not chr_data or len(chr_data) < 16:
+    simulated = not chr_data or len(chr_data) < 16
+    if simulated:
         st.warning("""
         ⚠️ Aucune donnée graphique **CHR-ROM** détectée.  
         Ce jeu utilise une **CHR-RAM** (graphismes chargés dynamiquement).  
@@ -399,40 +406,61 @@ def explain_chr_tiles(chr_data: bytes):
                 fake_chr[i + 8 + j] = ((~val >> (j % 8)) & 0xFF)
         chr_data = fake_chr.tobytes()
 
-    # --- Génération des tuiles ---
-    tile_count = min(len(chr_data) // 16, 256)
-    tiles = []
+    # --- Génération des tuiles : une page (banque) à la fois ---
+    page, page_size = select_chr_page(chr_data, "chr_tiles")
+    img = render_page_image(chr_data, page, page_size, 16, GRAYSCALE_PALETTE)
+    first = page * page_size // 16
+    tile_count = min(len(chr_data) // 16 - first, page_size // 16)
 
-    for i in range(tile_count):
-        tile_bytes = chr_data[i * 16:(i + 1) * 16]
-        low = np.frombuffer(tile_bytes[:8], dtype=np.uint8)
-        high = np.frombuffer(tile_bytes[8:], dtype=np.uint8)
-        tile = np.zeros((8, 8), dtype=np.uint8)
-        for y in range(8):
-            for x in range(8):
-                lo_bit = (low[y] >> (7 - x)) & 1
-                hi_bit = (high[y] >> (7 - x)) & 1
-                tile[y, x] = lo_bit + (hi_bit << 1)
-        tiles.append(tile)
+    with pixel_area("chr_tiles"):
+        show_pixels(img, caption=f"Page {page} : {tile_count} tuiles CHR (réelles ou simulées)")
 
-    grid_size = int(np.ceil(np.sqrt(tile_count)))
-    tile_size = 8
-    canvas = np.zeros((grid_size * tile_size, grid_size * tile_size), dtype=np.uint8)
+    st.info("""
+    🧩 Chaque tuile NES = 16 octets (8 octets bas + 8 octets hauts) → 64 pixels (4 teintes possibles).  
+    Même sans CHR-ROM, la structure reste identique, seule la source des données change (RAM vs ROM).
+    """)
 
-    for idx, tile in enumerate(tiles):
-        y = (idx // grid_size) * tile_size
-        x = (idx % grid_size) * tile_size
-        canvas[y:y+tile_size, x:x+tile_size] = tile
+    if not simulated:
+        show_chr_duplicates(chr_data)
 
-    img = Image.fromarray(canvas * 85)
-    img = img.resize((img.width * 4, img.height * 4), Image.NEAREST)
 
-    st.image(img, caption=f"{tile_count} tuiles CHR (réelles ou simulées)", use_container_width=True)
+def show_chr_duplicates(chr_data, max_groups: int = 12, max_members: int = 8):
+    """Doublons exacts et tuiles identiques à un miroir près, sur toute la CHR-ROM."""
+    st.markdown("### ♻️ Tuiles en double et tuiles miroirs")
+    index = cached_tile_index(chr_data)
+    savings = index.savings()
 
-    st.info("""
-    🧩 Chaque tuile NES = 16 octets (8 octets bas + 8 octets hauts) → 64 pixels (4 teintes possibles).  
-    Même sans CHR-ROM, la structure reste identique, seule la source des données change (RAM vs ROM).
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Tuiles", index.tile_count)
+    c2.metric("Uniques", index.unique_exact)
+    c3.metric("Uniques (miroirs fusionnés)", index.unique_with_flips)
+    c4.metric("Économie possible", f"{savings['avec_miroirs'] / 1024:.1f} Ko",
+              f"{savings['doublons_exacts'] / 1024:.1f} Ko sans les miroirs", delta_color="off")
+
+    st.markdown("""
+    Les cartouches contiennent souvent la même tuile plusieurs fois (une par banque, pour
+    l'animation…), ou une tuile et son **miroir** : la NES sait retourner un sprite
+    horizontalement ou verticalement (bits 6–7 des attributs OAM), une seule copie suffirait.
     """)
+    st.dataframe(index.per_bank(), width="stretch", hide_index=True)
+
+    groups = index.duplicate_groups(with_flips=True)[:max_groups]
+    if not groups:
+        st.success("Aucune tuile en double dans cette CHR.")
+        return
+
+    # Une ligne par groupe : ses premiers membres côte à côte
+    tiles = cached_tiles(chr_data)
+    strip = np.zeros((len(groups) * 10, max_members * 10), dtype=np.uint8)
+    for row, members in enumerate(groups):
+        for col, tile_id in enumerate(members[:max_members]):
+            strip[row * 10 + 1:row * 10 + 9, col * 10 + 1:col * 10 + 9] = tiles[tile_id]
+    with pixel_area("chr_duplicates"):
+        show_pixels(indexed_image(strip, GRAYSCALE_PALETTE), caption=f"{len(groups)} plus grands groupes (une ligne par groupe)", zoom=4)
+    st.caption(" · ".join(
+        f"{len(g)}× tuile {g[0]} ({', '.join(sorted({FLIP_LABELS[f] for f in index.flip[g]}))})"
+        for g in groups[:5]
+    ))
 
 
 # ======================================================
@@ -444,7 +472,8 @@ def show_chr_tile_detail(chr_data: bytes):
     st.subheader("🔬 Décomposition interactive d’une tuile CHR — en couleur NES")
 
     # === Cas CHR absente ===
-    if len(chr_data) == 0:
+    simulated = len(chr_data) == 0
+    if simulated:
         st.warning("""
         ⚠️ Aucune donnée graphique CHR-ROM détectée.  
         Une tuile factice est générée pour démonstration.
@@ -464,12 +493,7 @@ def show_chr_tile_detail(chr_data: bytes):
     low = np.frombuffer(tile_bytes[:8], dtype=np.uint8)
     high = np.frombuffer(tile_bytes[8:], dtype=np.uint8)
 
-    tile = np.zeros((8, 8), dtype=np.uint8)
-    for y in range(8):
-        for x in range(8):
-            lo_bit = (low[y] >> (7 - x)) & 1
-            hi_bit = (high[y] >> (7 - x)) & 1
-            tile[y, x] = lo_bit + (hi_bit << 1)
+    tile = cached_tiles(chr_data)[tile_index]
 
     nes_palettes = {
         "🎮 Classique (Super Mario Bros.)": [(124, 124, 124), (0, 0, 252), (248, 56, 0), (252, 252, 252)],
@@ -482,8 +506,7 @@ def show_chr_tile_detail(chr_data: bytes):
     selected_palette = st.selectbox("🎨 Palette de rendu :", list(nes_palettes.keys()))
     palette = np.array(nes_palettes[selected_palette], dtype=np.uint8)
 
-    rgb_tile = palette[tile]
-    img = Image.fromarray(rgb_tile, mode="RGB").resize((8 * 20, 8 * 20), Image.NEAREST)
+    img = indexed_image(tile, palette)
 
     tab1, tab2, tab3 = st.tabs(["📄 Données brutes", "🔢 Matrice", "🎨 Rendu NES"])
 
@@ -493,14 +516,66 @@ def show_chr_tile_detail(chr_data: bytes):
     with tab2:
         st.write(tile)
 
-    with tab3:
-        st.image(img, caption=f"🎨 Tuile {tile_index} — {selected_palette}", use_container_width=True)
+    with tab3, pixel_area("chr_tile_detail"):
+        show_pixels(img, caption=f"🎨 Tuile {tile_index} — {selected_palette}")
 
     st.caption("""
     💾 Même sans CHR-ROM réelle, la structure 8×8 reste la même :  
     c’est l’illustration du format 2-bitplan NES (2 bits → 4 teintes).
     """)
 
+    if not simulated:
+        show_similar_tiles(chr_data, tile_index, palette)
+
+
+def _tile_strip(tiles, palette) -> Image.Image:
+    """Tuiles (K, 8, 8) côte à côte, séparées d'un pixel noir (indice 4), en couleurs."""
+    strip = np.full((8, len(tiles) * 9), 4, dtype=np.uint8)
+    for i, tile in enumerate(tiles):
+        strip[:, i * 9:i * 9 + 8] = tile
+    return indexed_image(strip, np.vstack([palette, [(0, 0, 0)]]))
+
+
+def show_similar_tiles(chr_data, tile_index: int, palette):
+    """Tuiles les plus proches (distance de Hamming entre plans de bits), dans la ROM ou la bibliothèque."""
+    st.markdown("### 🔎 Tuiles les plus proches")
+    st.markdown("""
+    Deux tuiles sont comparées bit à bit : **XOR** de leurs 16 octets, puis on compte les bits
+    à 1 (*popcount*). Distance 0 = tuiles identiques, 128 = tous les bits diffèrent.
+    """)
+    k = st.slider("Nombre de voisins :", 1, 32, 8, key="similar_k")
+    scope = st.radio("Rechercher dans :", ["Cette ROM", "Bibliothèque /roms"], horizontal=True, key="similar_scope")
+
+    if scope == "Cette ROM":
+        matches = similar_tiles(chr_data, tile_index, k)
+        tiles = cached_tiles(chr_data)
+        with pixel_area("similar_tiles"):
+            show_pixels(_tile_strip(tiles[[i for i, _ in matches]], palette), zoom=6)
+        st.caption(" · ".join(f"#{i} (d={d})" for i, d in matches))
+        return
+
+    catalog = rom_image.list_roms("roms")
+    library = LibraryTileIndex.load()
+    rebuild = st.button("🗂️ (Re)construire l’index de la bibliothèque", key="similar_build")
+    if rebuild or library is None or not library.is_current(catalog):
+        with st.spinner("Indexation des tuiles de toutes les ROMs de /roms…"):
+            library = build_library_index(catalog)
+    query = raw_tiles(chr_data)[tile_index]
+    results = []
+    strips = []
+    for entry, tile_no, d in library.search(query, k):
+        try:
+            strips.append(read_library_tile(entry, tile_no))
+        except (OSError, ValueError, IndexError, zipfile.BadZipFile):
+            continue  # ROM modifiée ou retirée entre deux reruns : l'index sera reconstruit au suivant
+        results.append((entry, tile_no, d))
+    if strips:
+        with pixel_area("similar_tiles"):
+            show_pixels(_tile_strip(np.stack(strips), palette), zoom=6)
+    st.caption(f"{len(library)} tuiles indexées dans {len(library.roms)} ROM(s) — " + " · ".join(
+        f"{entry['label']} #{tile_no} (d={d})" for entry, tile_no, d in results
+    ))
+
 def show_chr_atlas(chr_data: bytes, cols: int = 16):
     """Affiche toutes les tuiles CHR-ROM sous forme d'un atlas complet."""
     import streamlit as st
@@ -513,17 +588,7 @@ def show_chr_atlas(chr_data: bytes, cols: int = 16):
         return
 
     rows = (tiles + cols - 1) // cols
-    atlas = np.zeros((rows * 8, cols * 8), dtype=np.uint8)
-
-    for i in range(tiles):
-        tile_bytes = chr_data[i*16:(i+1)*16]
-        low = np.frombuffer(tile_bytes[:8], dtype=np.uint8)
-        high = np.frombuffer(tile_bytes[8:], dtype=np.uint8)
-        for y in range(8):
-            for x in range(8):
-                lo_bit = (low[y] >> (7 - x)) & 1
-                hi_bit = (high[y] >> (7 - x)) & 1
-                atlas[(i//cols)*8 + y, (i%cols)*8 + x] = lo_bit + (hi_bit << 1)
+    atlas = cached_mosaic(chr_data, cols)
 
     # Palette 4 niveaux de gris
     palette = np.array([
@@ -533,13 +598,8 @@ def show_chr_atlas(chr_data: bytes, cols: int = 16):
         [0, 0, 0]
     ], dtype=np.uint8)
 
-    rgb_atlas = palette[atlas]
-    img = Image.fromarray(rgb_atlas, mode="RGB").resize(
-        (cols * 8 * 2, rows * 8 * 2),
-        Image.NEAREST
-    )
-
-    st.image(img, caption=f"Planche complète : {tiles} tuiles ({rows}×{cols})", use_container_width=True)
+    with pixel_area("chr_atlas"):
+        show_pixels(indexed_image(atlas, palette), caption=f"Planche complète : {tiles} tuiles ({rows}×{cols})")
     st.caption("💡 Chaque bloc 8×8 représente une tuile graphique utilisée dans le jeu.")
 
 def show_memory_bus_diagram():
@@ -0,0 +1,93 @@
+# utils/hashing.py
+"""
+Empreintes d'une ROM (CRC32, MD5, SHA-1, SHA-256) calculées en une seule passe.
+
+Le fichier est mappé en mémoire (mmap) et parcouru par blocs de taille fixe :
+chaque bloc alimente simultanément les quatre algorithmes, pour la version
+« avec header » (fichier complet, convention No-Intro headered) et « sans header »
+(header iNES de 16 octets retiré). Aucune copie complète de la ROM n'est créée.
+Les résultats sont mis en cache par (chemin, taille, date de modification).
+"""
+import hashlib
+import mmap
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+CHUNK_SIZE = 1 << 20  # 1 Mo
+INES_MAGIC = b"NES\x1a"
+INES_HEADER_SIZE = 16
+
+
+class MultiHasher:
+    """Alimente CRC32, MD5, SHA-1 et SHA-256 avec les mêmes blocs."""
+
+    def __init__(self):
+        self.crc = 0
+        self.size = 0
+        self._hashes = {name: hashlib.new(name) for name in ("md5", "sha1", "sha256")}
+
+    def update(self, chunk):
+        self.crc = zlib.crc32(chunk, self.crc)
+        self.size += len(chunk)
+        for h in self._hashes.values():
+            h.update(chunk)
+
+    def hexdigests(self) -> dict:
+        digests = {"crc32": f"{self.crc & 0xffffffff:08x}", "size": self.size}
+        digests.update({name: h.hexdigest() for name, h in self._hashes.items()})
+        return digests
+
+
+def hash_buffer(buf, header_size: int = None, chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Empreintes avec et sans header d'un buffer (bytes, mmap, memoryview…).
+    Par défaut, le header vaut 16 octets si la signature iNES est présente, sinon 0.
+    """
+    view = memoryview(buf)
+    if header_size is None:
+        header_size = INES_HEADER_SIZE if bytes(view[:4]) == INES_MAGIC else 0
+    header_size = min(header_size, len(view))
+
+    headered, headerless = MultiHasher(), MultiHasher()
+    headered.update(view[:header_size])
+    for offset in range(header_size, len(view), chunk_size):
+        chunk = view[offset:offset + chunk_size]
+        headered.update(chunk)
+        headerless.update(chunk)
+
+    return {
+        "header_size": header_size,
+        "headered": headered.hexdigests(),
+        "headerless": headerless.hexdigests(),
+    }
+
+
+_FILE_CACHE = OrderedDict()  # (chemin, taille, mtime) -> empreintes
+_FILE_CACHE_MAX = 4096
+_FILE_CACHE_LOCK = threading.Lock()
+
+
+def hash_file(path, header_size: int = None, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Empreintes d'un fichier ROM via mmap, mises en cache par (chemin, taille, mtime)."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns, header_size)
+    with _FILE_CACHE_LOCK:
+        cached = _FILE_CACHE.get(key)
+        if cached is not None:
+            _FILE_CACHE.move_to_end(key)
+            return cached
+
+    with open(path, "rb") as f:
+        if st.st_size == 0:
+            digests = hash_buffer(b"", header_size, chunk_size)
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                digests = hash_buffer(mm, header_size, chunk_size)
+
+    with _FILE_CACHE_LOCK:
+        _FILE_CACHE[key] = digests
+        while len(_FILE_CACHE) > _FILE_CACHE_MAX:
+            _FILE_CACHE.popitem(last=False)
+    return digests
@@ -0,0 +1,218 @@
+# utils/ines.py
+"""
+Décodage complet du header iNES / NES 2.0 (16 octets) et disposition mémoire de la ROM.
+
+Toutes les tailles et tous les offsets (trainer, PRG, CHR, ROMs annexes) sont
+calculés ici, une seule fois par header : les autres modules lisent le résultat
+au lieu de refaire l'arithmétique sur les octets bruts.
+"""
+import struct
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+INES_MAGIC = b"NES\x1a"
+HEADER_SIZE = 16
+TRAINER_SIZE = 512
+PRG_UNIT = 16 * 1024
+CHR_UNIT = 8 * 1024
+
+_HEADER_STRUCT = struct.Struct("<4s12B")
+
+MIRRORING_LABELS = {
+    "horizontal": "Horizontale",
+    "vertical": "Verticale",
+    "four_screen": "Quatre écrans",
+}
+TIMING_LABELS = ("NTSC (RP2C02)", "PAL (RP2C07)", "Multi-région", "Dendy (UMC 6527P)")
+CONSOLE_LABELS = ("NES / Famicom", "Vs. System", "PlayChoice-10", "Console étendue")
+MAPPER_NAMES = {
+    0: "NROM", 1: "MMC1", 2: "UxROM", 3: "CNROM", 4: "MMC3", 5: "MMC5",
+    7: "AxROM", 9: "MMC2", 10: "MMC4", 11: "Color Dreams", 66: "GxROM", 69: "Sunsoft FME-7",
+}
+
+
+@dataclass(frozen=True)
+class InesHeader:
+    """Header iNES / NES 2.0 décodé, avec la disposition des sections dans le fichier."""
+    format: str                      # "NES 2.0", "iNES", "iNES archaïque" ou "Invalide"
+    mapper: int = 0
+    submapper: int = 0
+    prg_rom_size: int = 0
+    chr_rom_size: int = 0
+    prg_ram_size: int = 0
+    prg_nvram_size: int = 0
+    chr_ram_size: int = 0
+    chr_nvram_size: int = 0
+    mirroring: str = "horizontal"    # "horizontal", "vertical" ou "four_screen"
+    battery: bool = False
+    trainer: bool = False
+    timing: int = 0                  # index dans TIMING_LABELS
+    console_type: int = 0            # index dans CONSOLE_LABELS
+    misc_roms: int = 0
+    expansion_device: int = 0
+    raw_anomalies: tuple = field(default_factory=tuple)
+
+    # --- Disposition dans le fichier ---
+    @property
+    def valid(self) -> bool:
+        return self.format != "Invalide"
+
+    @property
+    def is_nes2(self) -> bool:
+        return self.format == "NES 2.0"
+
+    @property
+    def trainer_offset(self) -> int:
+        return HEADER_SIZE
+
+    @property
+    def prg_offset(self) -> int:
+        return HEADER_SIZE + (TRAINER_SIZE if self.trainer else 0)
+
+    @property
+    def chr_offset(self) -> int:
+        return self.prg_offset + self.prg_rom_size
+
+    @property
+    def misc_offset(self) -> int:
+        return self.chr_offset + self.chr_rom_size
+
+    @property
+    def expected_size(self) -> int:
+        return self.misc_offset
+
+    @property
+    def uses_chr_ram(self) -> bool:
+        return self.chr_rom_size == 0
+
+    @property
+    def mapper_name(self) -> str:
+        return MAPPER_NAMES.get(self.mapper, "Inconnu")
+
+    def anomalies(self, file_size: int = None) -> list:
+        """Incohérences du header, éventuellement confrontées à la taille réelle du fichier."""
+        issues = list(self.raw_anomalies)
+        if self.valid and file_size is not None:
+            if file_size < self.expected_size:
+                issues.append(f"Fichier tronqué : {file_size} octets pour {self.expected_size} attendus")
+            elif file_size > self.expected_size and not self.misc_roms:
+                issues.append(f"{file_size - self.expected_size} octets en trop après la CHR-ROM")
+        return issues
+
+    def summary(self) -> dict:
+        """Champs principaux sous forme lisible (pour st.json / rapports)."""
+        return {
+            "Format": self.format,
+            "Mapper": f"{self.mapper} ({self.mapper_name})" + (f" / sous-mapper {self.submapper}" if self.is_nes2 else ""),
+            "PRG-ROM": f"{self.prg_rom_size // 1024} Ko",
+            "CHR-ROM": f"{self.chr_rom_size // 1024} Ko" if self.chr_rom_size else "0 Ko (CHR-RAM)",
+            "PRG-RAM / NVRAM": f"{self.prg_ram_size // 1024} Ko / {self.prg_nvram_size // 1024} Ko",
+            "CHR-RAM / NVRAM": f"{self.chr_ram_size // 1024} Ko / {self.chr_nvram_size // 1024} Ko",
+            "Mirroring": MIRRORING_LABELS[self.mirroring],
+            "Batterie": self.battery,
+            "Trainer présent": self.trainer,
+            "Timing": TIMING_LABELS[self.timing],
+            "Console": CONSOLE_LABELS[self.console_type],
+        }
+
+
+def _nes2_rom_size(lsb: int, msb: int, unit: int) -> int:
+    """Taille NES 2.0 : nombre d'unités sur 12 bits, ou notation exposant-multiplicateur si MSB = $F."""
+    if msb == 0x0F:
+        exponent, multiplier = lsb >> 2, lsb & 0x03
+        return (1 << exponent) * (multiplier * 2 + 1)
+    return ((msb << 8) | lsb) * unit
+
+
+def _nes2_ram_size(shift: int) -> int:
+    return 64 << shift if shift else 0
+
+
+@lru_cache(maxsize=256)
+def _parse(header: bytes) -> InesHeader:
+    if len(header) < HEADER_SIZE or header[:4] != INES_MAGIC:
+        return InesHeader(format="Invalide", raw_anomalies=("Signature NES<1A> absente",))
+
+    _, b4, b5, f6, f7, b8, b9, b10, b11, b12, b13, b14, b15 = _HEADER_STRUCT.unpack(header[:HEADER_SIZE])
+    mirroring = "four_screen" if f6 & 0x08 else ("vertical" if f6 & 0x01 else "horizontal")
+    battery = bool(f6 & 0x02)
+    trainer = bool(f6 & 0x04)
+    anomalies = []
+
+    if f7 & 0x0C == 0x08:
+        prg_rom = _nes2_rom_size(b4, b9 & 0x0F, PRG_UNIT)
+        chr_rom = _nes2_rom_size(b5, b9 >> 4, CHR_UNIT)
+        console = f7 & 0x03
+        return InesHeader(
+            format="NES 2.0",
+            mapper=(f6 >> 4) | (f7 & 0xF0) | ((b8 & 0x0F) << 8),
+            submapper=b8 >> 4,
+            prg_rom_size=prg_rom,
+            chr_rom_size=chr_rom,
+            prg_ram_size=_nes2_ram_size(b10 & 0x0F),
+            prg_nvram_size=_nes2_ram_size(b10 >> 4),
+            chr_ram_size=_nes2_ram_size(b11 & 0x0F),
+            chr_nvram_size=_nes2_ram_size(b11 >> 4),
+            mirroring=mirroring,
+            battery=battery,
+            trainer=trainer,
+            timing=b12 & 0x03,
+            console_type=console,
+            misc_roms=b14 & 0x03,
+            expansion_device=b15 & 0x3F,
+            raw_anomalies=tuple(anomalies),
+        )
+
+    # iNES 1.0 : les octets 12–15 doivent être nuls, sinon l'octet 7 est probablement
+    # pollué (ex. signature « DiskDude! ») et seul le quartet bas du mapper est fiable.
+    archaic = f7 & 0x0C != 0 or any((b12, b13, b14, b15))
+    if archaic:
+        anomalies.append("Octets 7 ou 12–15 non standards : quartet haut du mapper ignoré")
+    mapper = (f6 >> 4) if archaic else (f6 >> 4) | (f7 & 0xF0)
+    prg_ram = (b8 or 1) * 8 * 1024
+    if b4 == 0:
+        anomalies.append("Taille PRG-ROM nulle")
+    return InesHeader(
+        format="iNES archaïque" if archaic else "iNES",
+        mapper=mapper,
+        prg_rom_size=b4 * PRG_UNIT,
+        chr_rom_size=b5 * CHR_UNIT,
+        prg_ram_size=0 if battery else prg_ram,
+        prg_nvram_size=prg_ram if battery else 0,
+        chr_ram_size=CHR_UNIT if b5 == 0 else 0,
+        mirroring=mirroring,
+        battery=battery,
+        trainer=trainer,
+        timing=1 if (not archaic and b9 & 0x01) else 0,
+        console_type=0 if archaic else (1 if f7 & 0x01 else 2 if f7 & 0x02 else 0),
+        raw_anomalies=tuple(anomalies),
+    )
+
+
+def parse_header(header) -> InesHeader:
+    """Décode les 16 premiers octets (bytes, memoryview…) ; résultat mis en cache par header."""
+    return _parse(bytes(header[:HEADER_SIZE]))
+
+
+def initial_prg_map(header: InesHeader) -> list:
+    """
+    Banques PRG visibles par le CPU à la mise sous tension, selon le mapper :
+    liste de (adresse CPU, offset dans la PRG-ROM, longueur).
+    """
+    size = header.prg_rom_size
+    if size == 0:
+        return []
+    if size <= 16 * 1024:
+        return [(0x8000, 0, size), (0xC000, 0, size)]           # NROM-128 : miroir
+    if header.mapper in (0, 3) or size == 32 * 1024:
+        return [(0x8000, 0, 0x8000)]                             # 32 Ko fixes
+    if header.mapper == 4:
+        return [                                                 # MMC3 : 2 dernières banques 8 Ko fixes
+            (0x8000, 0, 0x2000),
+            (0xA000, 0x2000, 0x2000),
+            (0xC000, size - 0x4000, 0x2000),
+            (0xE000, size - 0x2000, 0x2000),
+        ]
+    if header.mapper in (7, 66):
+        return [(0x8000, size - 0x8000, 0x8000)]                 # banque 32 Ko (dernière par défaut)
+    return [(0x8000, 0, 0x4000), (0xC000, size - 0x4000, 0x4000)]  # MMC1 / UxROM : dernière banque fixe
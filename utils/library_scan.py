@@ -0,0 +1,269 @@
+# utils/library_scan.py
+"""
+Scanner de bibliothèque de ROMs (sans interface).
+
+Parcourt une arborescence (fichiers .nes et archives .zip), calcule les empreintes
+de chaque ROM dans un ProcessPoolExecutor, décode le header iNES / NES 2.0,
+identifie la ROM via l'index No-Intro et écrit un rapport JSON et/ou CSV.
+Dans les archives, un membre dont le CRC32 du répertoire central (et la taille)
+figure dans l'index n'est pas décompressé : ses empreintes viennent du .dat.
+
+Le scan est incrémental et reprenable : un fichier d'état mémorise (taille, mtime)
+et les résultats de chaque fichier ; seuls les fichiers nouveaux ou modifiés sont
+re-hachés, et l'état est sauvegardé régulièrement pendant le scan.
+
+Usage :
+    python -m utils.library_scan roms/ --json rapport.json --csv rapport.csv
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from utils import hashing, nointro, rom_zip
+from utils.ines import HEADER_SIZE, parse_header
+
+ROM_EXTENSIONS = {".nes"}
+ARCHIVE_EXTENSIONS = {".zip"}
+STATE_VERSION = 1
+CHECKPOINT_SECONDS = 5.0  # sauvegarde périodique de l'état (scan reprenable)
+BATCH_SIZE = 64  # fichiers par tâche : limite le coût des échanges inter-processus
+
+CSV_FIELDS = [
+    "path", "member", "title", "match", "format", "mapper", "submapper",
+    "prg_kb", "chr_kb", "mirroring", "battery", "trainer", "size",
+    "crc32", "sha1", "hashed", "anomalies",
+]
+
+
+def iter_library(root):
+    """Fichiers candidats (.nes, .zip) sous root, triés pour un ordre stable."""
+    root = Path(root)
+    if root.is_file():
+        yield root
+        return
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            ext = os.path.splitext(name)[1].lower()
+            if ext in ROM_EXTENSIONS or ext in ARCHIVE_EXTENSIONS:
+                yield Path(dirpath) / name
+
+
+def describe_rom(digests: dict, header: bytes, size: int, hashed: bool = True) -> dict:
+    """Résumé d'une ROM à partir de ses empreintes et de son header."""
+    layout = parse_header(header)
+    return {
+        "hashed": hashed,
+        "format": layout.format,
+        "mapper": layout.mapper,
+        "submapper": layout.submapper,
+        "prg_kb": layout.prg_rom_size // 1024,
+        "chr_kb": layout.chr_rom_size // 1024,
+        "mirroring": layout.mirroring,
+        "battery": layout.battery,
+        "trainer": layout.trainer,
+        "size": size,
+        "digests": digests,
+        "anomalies": layout.anomalies(size),
+    }
+
+
+def _scan_nes(path: str) -> list:
+    digests = hashing.hash_file(path)
+    with open(path, "rb") as f:
+        header = f.read(16)
+    return [{"member": None, **describe_rom(digests, header, os.path.getsize(path))}]
+
+
+def _dat_digests(row: dict) -> dict:
+    """Empreintes « avec header » reprises d'une entrée No-Intro (membre non décompressé)."""
+    headered = {"crc32": row["crc"], "size": row["size"], "md5": row["md5"], "sha1": row["sha1"], "sha256": row["sha256"]}
+    return {"header_size": HEADER_SIZE, "headered": headered, "headerless": None}
+
+
+def _scan_zip(path: str, index=None) -> list:
+    entries = []
+    for member in rom_zip.iter_nes_members(path):
+        row = next(iter(index.lookup(crc=member.crc32, size=member.size)), None) if index else None
+        if row is not None:
+            entries.append({"member": member.name, **describe_rom(_dat_digests(row), member.header, member.size, hashed=False)})
+            continue
+        data = rom_zip.read_member(path, member.name)
+        entries.append({"member": member.name, **describe_rom(hashing.hash_buffer(data), member.header, len(data))})
+    return entries
+
+
+def scan_file(path: str, dat_path: str = None) -> tuple:
+    """Tâche exécutée dans un processus fils : (chemin, entrées) ou (chemin, erreur)."""
+    try:
+        if os.path.splitext(path)[1].lower() in ARCHIVE_EXTENSIONS:
+            index = nointro.get_index(dat_path) if dat_path else None
+            return path, _scan_zip(path, index), None
+        return path, _scan_nes(path), None
+    except Exception as e:  # zlib.error, archive corrompue… : erreur du fichier, le lot continue
+        return path, [], f"{type(e).__name__}: {e}"
+
+
+def scan_batch(paths: list, dat_path: str = None) -> list:
+    return [scan_file(path, dat_path) for path in paths]
+
+
+def match_entry(entry: dict, index) -> dict:
+    """Identifie une entrée dans l'index No-Intro (SHA-1 puis CRC32, avec puis sans header)."""
+    entry["title"], entry["match"] = None, None
+    if index is None:
+        return entry
+    for variant in ("headered", "headerless"):
+        d = entry["digests"][variant]
+        if d is None:
+            continue
+        for field, value in (("sha1", d["sha1"]), ("crc", d["crc32"])):
+            rows = index.lookup(**{field: value})
+            if rows:
+                entry["title"], entry["match"] = rows[0]["title"], f"{field} ({variant})"
+                return entry
+    return entry
+
+
+def load_state(state_path) -> dict:
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") == STATE_VERSION:
+            return state
+    except (OSError, ValueError):
+        pass
+    return {"version": STATE_VERSION, "files": {}}
+
+
+def save_state(state: dict, state_path):
+    state_path = Path(state_path)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = state_path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_path)
+
+
+def scan_library(root, state_path=None, workers=None, dat_path=nointro.DEFAULT_DAT_PATH, progress=None) -> dict:
+    """
+    Scanne root et renvoie {"entries": [...], "errors": {...}, "stats": {...}}.
+    Les fichiers dont (taille, mtime) n'ont pas changé depuis le dernier scan sont repris de l'état.
+    """
+    started = time.perf_counter()
+    state_path = state_path or (nointro.CACHE_DIR / "library_scan_state.json")
+    state = load_state(state_path)
+    known = state["files"]
+
+    seen, todo, unreadable = set(), [], {}
+    for path in iter_library(root):
+        key = str(path.resolve())
+        try:
+            st = path.stat()
+        except OSError as e:  # lien cassé, fichier supprimé pendant le scan : erreur du fichier
+            unreadable[key] = f"{type(e).__name__}: {e}"
+            continue
+        seen.add(key)
+        rec = known.get(key)
+        if rec is None or rec["size"] != st.st_size or rec["mtime_ns"] != st.st_mtime_ns:
+            todo.append((key, st.st_size, st.st_mtime_ns))
+    for key in [k for k in known if k not in seen]:
+        del known[key]  # fichiers supprimés depuis le dernier scan
+
+    index = nointro.get_index(dat_path) if dat_path and os.path.exists(dat_path) else None
+    stamps = {key: (size, mtime) for key, size, mtime in todo}
+
+    done = 0
+    last_checkpoint = time.monotonic()
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths = [key for key, _, _ in todo]
+            batches = [paths[i:i + BATCH_SIZE] for i in range(0, len(paths), BATCH_SIZE)]
+            futures = [pool.submit(scan_batch, batch, index and str(index.dat_path)) for batch in batches]
+            for future in as_completed(futures):
+                for path, entries, error in future.result():
+                    size, mtime = stamps[path]
+                    known[path] = {
+                        "size": size,
+                        "mtime_ns": mtime,
+                        "entries": entries,
+                        "error": error,
+                    }
+                    done += 1
+                    if progress:
+                        progress(done, len(todo), path)
+                if time.monotonic() - last_checkpoint > CHECKPOINT_SECONDS:
+                    save_state(state, state_path)
+                    last_checkpoint = time.monotonic()
+    save_state(state, state_path)
+
+    # L'identification se fait à la volée (recherches indexées) : un nouveau .dat suffit à la rafraîchir
+    entries = [
+        match_entry({"path": path, **entry}, index)
+        for path in sorted(k for k in known if k in seen)
+        for entry in known[path]["entries"]
+    ]
+    errors = {path: rec["error"] for path, rec in known.items() if rec.get("error")}
+    errors.update(unreadable)
+    return {
+        "entries": entries,
+        "errors": errors,
+        "stats": {
+            "files": len(seen),
+            "rescanned": len(todo),
+            "reused": len(seen) - len(todo),
+            "roms": len(entries),
+            "matched": sum(1 for e in entries if e["title"]),
+            "seconds": round(time.perf_counter() - started, 3),
+            "dat_version": index.version if index else None,
+        },
+    }
+
+
+def write_json(report: dict, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def write_csv(report: dict, path):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for entry in report["entries"]:
+            writer.writerow({
+                **entry,
+                "crc32": entry["digests"]["headered"]["crc32"],
+                "sha1": entry["digests"]["headered"]["sha1"],
+                "anomalies": " | ".join(entry["anomalies"]),
+            })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scanner de bibliothèque de ROMs NES (No-Intro).")
+    parser.add_argument("root", help="Dossier (ou fichier) à analyser")
+    parser.add_argument("--json", dest="json_path", help="Rapport JSON")
+    parser.add_argument("--csv", dest="csv_path", help="Rapport CSV")
+    parser.add_argument("--state", help="Fichier d'état du scan incrémental")
+    parser.add_argument("--dat", default=nointro.DEFAULT_DAT_PATH, help="Fichier .dat No-Intro")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de processus")
+    args = parser.parse_args(argv)
+
+    def progress(done, total, path):
+        if done % 100 == 0 or done == total:
+            print(f"\r{done}/{total} fichiers analysés", end="", file=sys.stderr)
+
+    report = scan_library(args.root, args.state, args.workers, args.dat, progress)
+    print(file=sys.stderr)
+    if args.json_path:
+        write_json(report, args.json_path)
+    if args.csv_path:
+        write_csv(report, args.csv_path)
+    print(json.dumps(report["stats"], ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from PIL import Image
 import streamlit as st
 import numpy as np
 import matplotlib.pyplot as plt
+from utils.ines import parse_header, MIRRORING_LABELS
 
 ZONES = [
     (0x0000, 0x07FF, (0, 180, 0), "RAM"),
@@ -75,15 +76,23 @@ def display_memory_map(prg_data: bytes, chr_data: bytes, header: bytes):
     > de savoir où commence le code et où se trouvent les images.
     """)
 
-    # Calculs des tailles
-    total_size = len(header) + len(prg_data) + len(chr_data)
+    # Disposition lue depuis le header décodé (trainer compris)
+    layout = parse_header(header)
+    trainer_size = layout.prg_offset - layout.trainer_offset
+    total_size = len(header) + trainer_size + len(prg_data) + len(chr_data)
     header_ratio = len(header) / total_size
     prg_ratio = len(prg_data) / total_size
     chr_ratio = len(chr_data) / total_size
 
-    # --- Garantir que le header reste visible ---
+    # --- Garantir que le header (et le trainer) restent visibles ---
     min_ratio = 0.02  # 2 % minimum d’affichage visuel
     sizes = [max(header_ratio, min_ratio), prg_ratio, chr_ratio]
+    segments = ["Header", "PRG-ROM", "CHR-ROM"]
+    colors = ["#4B8BBE", "#FFD43B", "#306998"]
+    if trainer_size:
+        sizes.insert(1, max(trainer_size / total_size, min_ratio))
+        segments.insert(1, "Trainer")
+        colors.insert(1, "#B5651D")
     # Renormaliser pour garder un total de 1
     sizes = [s / sum(sizes) for s in sizes]
 
@@ -91,8 +100,6 @@ def display_memory_map(prg_data: bytes, chr_data: bytes, header: bytes):
     st.markdown("### 🧩 Structure interne de la ROM")
 
     fig, ax = plt.subplots(figsize=(8, 1))
-    segments = ["Header", "PRG-ROM", "CHR-ROM"]
-    colors = ["#4B8BBE", "#FFD43B", "#306998"]
 
     # Fond
     ax.barh([0], [1], color="#222")
@@ -120,7 +127,7 @@ def display_memory_map(prg_data: bytes, chr_data: bytes, header: bytes):
     ax.legend(
         loc="upper center",
         bbox_to_anchor=(0.5, 1.6),
-        ncol=3,
+        ncol=len(segments),
         frameon=False
     )
 
@@ -148,9 +155,12 @@ def display_memory_map(prg_data: bytes, chr_data: bytes, header: bytes):
     st.markdown("### 📊 Détails techniques du fichier")
     st.json({
         "Taille totale": f"{total_size} octets",
-        "Header": f"{len(header)} octets",
-        "PRG-ROM": f"{len(prg_data)} octets",
-        "CHR-ROM": f"{len(chr_data)} octets"
+        "Header": f"{len(header)} octets ({layout.format})",
+        "Trainer": f"{trainer_size} octets" + (f" @ 0x{layout.trainer_offset:X}" if trainer_size else ""),
+        "PRG-ROM": f"{len(prg_data)} octets @ 0x{layout.prg_offset:X}",
+        "CHR-ROM": f"{len(chr_data)} octets @ 0x{layout.chr_offset:X}" if len(chr_data) else "0 octet (CHR-RAM)",
+        "Mapper": f"{layout.mapper} ({layout.mapper_name})",
+        "Mirroring": MIRRORING_LABELS[layout.mirroring],
     })
 
     st.caption("""
@@ -1,29 +1,237 @@
 # utils/nes_crt_view.py
+"""
+Effet « télé CRT » appliqué aux images NES, assez rapide pour chaque frame à 60 i/s.
+
+Le pipeline travaille en float32 et ne fait qu'un minimum de passes à pleine résolution :
+1. couleurs : saturation appliquée à la table de couleurs (16 ou 64 entrées), pas aux pixels ;
+2. faisceau : flou séparable (horizontal puis vertical) et halo (bloom, à demi-résolution)
+   calculés à la résolution NES (256×240), où ils coûtent `scale`² fois moins cher ;
+3. agrandissement + masque : colonnes répétées puis un seul produit diffusé
+   (H, 1, W·s, 3) × (H, s, W·s, 3) avec un masque précalculé par résolution (lignes de
+   balayage, grille d'ouverture ou masque à trous, vignettage, gain), mis en cache par
+   lru_cache ;
+4. écrêtage et conversion uint8.
+Les images CRT sont affichées à leur taille native, hors pixel_area ; les animations passent
+chaque frame par ce pipeline dans le thread de rendu d'utils.animation (option coûteuse
+en volume : couleurs vraies).
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+
 import numpy as np
-from PIL import Image, ImageFilter, ImageEnhance
 import streamlit as st
-import time
+from PIL import Image
+
 from utils.nes_palette import NES_PALETTE, DEMO_PALETTES
+from utils.animation import show_animation, start_animation, wait_animation
+from utils.artifacts import content_key
+from utils.chr import cached_mosaic
+from utils.display import pixel_area, show_pixels
+from utils.ppu_render import indexed_image
+
+MASK_TYPES = {"Grille d'ouverture (Trinitron)": "aperture", "Masque à trous": "shadow", "Aucun": "none"}
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+@dataclass(frozen=True)
+class CrtSettings:
+    """Réglages de l'effet ; hashable, donc utilisable comme clé de cache."""
+    scale: int = 3              # pixels de sortie par pixel NES (≥ 2 pour voir les lignes)
+    mask: str = "aperture"      # "aperture", "shadow" ou "none"
+    scanlines: float = 0.45     # assombrissement de la dernière ligne de chaque ligne NES
+    mask_strength: float = 0.3  # atténuation des deux canaux « éteints » de chaque luminophore
+    vignette: float = 0.25      # assombrissement des coins
+    blur: float = 0.35          # part du faisceau étalé (flou horizontal surtout)
+    bloom: float = 0.25         # intensité du halo ajouté
+    saturation: float = 1.2
+    brightness: float = 1.25    # gain compensant l'assombrissement du masque
+
+
+# === Masques précalculés (une fois par résolution et par réglage) ===
+@lru_cache(maxsize=8)
+def crt_mask(height: int, width: int, scale: int, mask: str = "aperture", scanlines: float = 0.45,
+             mask_strength: float = 0.3, vignette: float = 0.25, brightness: float = 1.25) -> np.ndarray:
+    """
+    Masque float32 (height, scale, width × scale, 3) en lecture seule : produit des lignes de
+    balayage, du masque de luminophores, du vignettage et du gain. Il se multiplie
+    directement avec une image aux colonnes répétées (height, 1, width × scale, 3) :
+    agrandissement vertical et masque en une passe.
+    """
+    out_h, out_w = height * scale, width * scale
+    y = np.arange(out_h)[:, None]
+    x = np.arange(out_w)[None, :]
+
+    # Lignes de balayage : dernière sous-ligne de chaque ligne NES (une ligne sur deux si scale = 1)
+    dark_row = (y % scale == scale - 1) if scale > 1 else (y % 2 == 1)
+    weight = np.where(dark_row, 1.0 - scanlines, 1.0).astype(np.float32)[:, :, None]
+
+    # Luminophores : triades R, G, B par colonne, décalées une ligne NES sur deux pour le masque à trous
+    if mask != "none":
+        shift = (y // max(scale, 1) % 2) * 2 if mask == "shadow" else 0
+        channel = (x + shift) % 3                                  # (out_h ou 1, out_w)
+        phosphor = np.where(channel[:, :, None] == np.arange(3), 1.0, 1.0 - mask_strength)
+        weight = weight * phosphor.astype(np.float32)
+
+    # Vignettage : le coin perd `vignette`, le centre rien
+    ny = (y + 0.5) / out_h * 2 - 1
+    nx = (x + 0.5) / out_w * 2 - 1
+    weight = weight * (1.0 - vignette * (nx * nx + ny * ny) / 2).astype(np.float32)[:, :, None]
+
+    full = np.broadcast_to(weight * np.float32(brightness), (out_h, out_w, 3))
+    result = np.ascontiguousarray(full, dtype=np.float32).reshape(height, scale, out_w, 3)
+    result.flags.writeable = False
+    return result
+
+
+@lru_cache(maxsize=8)
+def gaussian_kernel(sigma: float) -> np.ndarray:
+    """Noyau gaussien 1D normalisé (rayon 3 σ, au moins 1)."""
+    radius = max(1, int(np.ceil(3 * sigma)))
+    k = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2).astype(np.float32)
+    k /= k.sum()
+    k.flags.writeable = False
+    return k
+
+
+def blur_axis(img: np.ndarray, kernel: np.ndarray, axis: int) -> np.ndarray:
+    """Convolution 1D float32 le long d'un axe (bords répétés), par tranches décalées et produits en place."""
+    radius = len(kernel) // 2
+    pad = [(0, 0)] * img.ndim
+    pad[axis] = (radius, radius)
+    padded = np.pad(img, pad, mode="edge")
+    n = img.shape[axis]
+    lead = (slice(None),) * axis
+    out = padded[lead + (slice(0, n),)] * kernel[0]
+    tmp = np.empty_like(out)
+    for i in range(1, len(kernel)):
+        np.multiply(padded[lead + (slice(i, i + n),)], kernel[i], out=tmp)
+        out += tmp
+    return out
+
+
+def separable_blur(img: np.ndarray, sigma_x: float, sigma_y: float) -> np.ndarray:
+    """Flou gaussien séparable (horizontal puis vertical) sur une image float32 (H, W, 3)."""
+    out = blur_axis(img, gaussian_kernel(sigma_x), axis=1) if sigma_x > 0 else img
+    return blur_axis(out, gaussian_kernel(sigma_y), axis=0) if sigma_y > 0 else out
+
+
+def bloom(img: np.ndarray, sigma: float = 2.0) -> np.ndarray:
+    """Halo : flou large calculé à demi-résolution (4 fois moins de pixels), puis ramené à la taille de l'image."""
+    height, width = img.shape[:2]
+    half = separable_blur(img[::2, ::2], sigma / 2, sigma / 2)
+    return half.repeat(2, axis=0).repeat(2, axis=1)[:height, :width]
+
+
+def saturate(colors: np.ndarray, saturation: float) -> np.ndarray:
+    """Couleurs float32 (…, 3) dont l'écart à la luminance est multiplié par `saturation`."""
+    colors = np.asarray(colors, dtype=np.float32)
+    luma = colors @ LUMA
+    return np.clip(luma[..., None] + (colors - luma[..., None]) * saturation, 0, 255)
+
+
+def apply_crt(rgb: np.ndarray, settings: CrtSettings = CrtSettings(), saturated: bool = False) -> np.ndarray:
+    """
+    Image RGB (H, W, 3) → image CRT uint8 (H × scale, W × scale, 3).
+    saturated=True : les couleurs ont déjà été saturées (table de couleurs, voir crt_frame).
+    """
+    s = settings
+    beam = np.asarray(rgb, dtype=np.float32)
+    if not saturated and s.saturation != 1:
+        beam = saturate(beam, s.saturation)
+    height, width = beam.shape[:2]
+
+    # Faisceau étalé (surtout horizontalement) et halo, à la résolution NES
+    if s.blur > 0:
+        beam = beam * np.float32(1 - s.blur) + separable_blur(beam, 0.8, 0.35) * np.float32(s.blur)
+    if s.bloom > 0:
+        glow = bloom(beam)
+        glow *= np.float32(s.bloom)
+        beam = beam + glow
+
+    # Agrandissement + masque : colonnes répétées, lignes par diffusion, un seul produit
+    mask = crt_mask(height, width, s.scale, s.mask, s.scanlines, s.mask_strength, s.vignette, s.brightness)
+    out = np.multiply(beam.repeat(s.scale, axis=1)[:, None], mask)
+    np.clip(out, 0, 255, out=out)
+    return out.reshape(height * s.scale, width * s.scale, 3).astype(np.uint8)
+
+
+def crt_frame(indices: np.ndarray, palette_rgb, settings: CrtSettings = CrtSettings()) -> np.ndarray:
+    """Image d'indices de palette → image CRT uint8 ; la saturation n'est calculée que sur la palette."""
+    colors = saturate(np.asarray(palette_rgb)[:, :3], settings.saturation)
+    return apply_crt(colors[indices], settings, saturated=True)
+
+
+def crt_image(img: Image.Image, settings: CrtSettings = CrtSettings()) -> Image.Image:
+    """Image PIL (mode "P" ou RGB) → image PIL RGB avec effet CRT."""
+    if img.mode == "P":
+        palette = np.array(img.getpalette()[:768], dtype=np.uint8).reshape(-1, 3)
+        return Image.fromarray(crt_frame(np.asarray(img), palette, settings), "RGB")
+    return Image.fromarray(apply_crt(np.asarray(img.convert("RGB")), settings), "RGB")
 
 
 def apply_crt_effect(img: Image.Image, intensity=0.4):
-    """Ajoute un effet CRT : balayage, légère distorsion et flou."""
-    # Convertit en numpy pour traitement
-    arr = np.array(img, dtype=np.uint8)
+    """Ajoute un effet CRT : balayage, masque de luminophores, halo (voir CrtSettings)."""
+    return crt_image(img, CrtSettings(scanlines=intensity))
 
-    # Ajoute un motif de lignes horizontales sombres
-    for y in range(0, arr.shape[0], 2):
-        arr[y, :, :] = (arr[y, :, :] * (1 - intensity)).astype(np.uint8)
 
-    img = Image.fromarray(arr, "RGB")
+# === Option commune à tous les visualiseurs ===
+def crt_controls(key: str, default: bool = False):
+    """Case « 📺 Effet CRT » et réglages ; renvoie les CrtSettings, ou None si l'effet est désactivé."""
+    if not st.checkbox("📺 Effet CRT", value=default, key=f"{key}_crt"):
+        return None
+    with st.expander("⚙️ Réglages CRT"):
+        col1, col2 = st.columns(2)
+        mask = col1.selectbox("Masque :", list(MASK_TYPES), key=f"{key}_crt_mask")
+        scale = col2.slider("Pixels par pixel NES :", 2, 4, 3, key=f"{key}_crt_scale")
+        scanlines = col1.slider("Lignes de balayage", 0.0, 0.9, 0.45, 0.05, key=f"{key}_crt_scanlines")
+        bloom = col2.slider("Halo (bloom)", 0.0, 1.0, 0.25, 0.05, key=f"{key}_crt_bloom")
+        blur = col1.slider("Flou du faisceau", 0.0, 1.0, 0.35, 0.05, key=f"{key}_crt_blur")
+        vignette = col2.slider("Vignettage", 0.0, 0.8, 0.25, 0.05, key=f"{key}_crt_vignette")
+    return CrtSettings(scale=scale, mask=MASK_TYPES[mask], scanlines=scanlines, blur=blur, bloom=bloom, vignette=vignette)
 
-    # Légère accentuation des couleurs
-    enhancer = ImageEnhance.Color(img)
-    img = enhancer.enhance(1.2)
 
-    # Légère mise au flou pour simuler la persistance du phosphore
-    img = img.filter(ImageFilter.GaussianBlur(radius=0.6))
-    return img
+def show_frame(img: Image.Image, crt: CrtSettings = None, caption: str = None, zoom: int = None,
+               area: str = "frame"):
+    """
+    show_pixels() dans un pixel_area(area), ou image CRT envoyée à sa taille native : hors de la
+    zone pixel (un agrandissement au plus proche voisin ferait du moiré sur les luminophores)
+    et hors du cache de PNG (elle change à chaque réglage). Le zoom reste exprimé en pixels NES.
+    """
+    if crt is None:
+        with pixel_area(area):
+            show_pixels(img, caption=caption, zoom=zoom)
+        return
+    out = crt_image(img, crt)
+    st.image(out, caption=caption, width=out.width, output_format="PNG")
+
+
+# === Animations : pipeline complet dans le thread de rendu (utils.animation) ===
+CRT_ANIMATION_FRAMES = 60       # 1 s à 60 i/s : une image CRT ×3 pèse ~0,7 Mo en APNG
+
+
+def crt_producer(produce, palette_rgb, crt: CrtSettings):
+    """
+    Enveloppe un produce(job) d'animation : ses frames d'indices passent par crt_frame dans le
+    thread de rendu, à passer à start_animation avec palette_rgb=None (couleurs vraies).
+    """
+    def produce_crt(job):
+        frames, info = produce(job)
+        job.stage = "effet CRT"
+        out = []
+        for i, frame in enumerate(frames):
+            out.append(crt_frame(frame, palette_rgb, crt))
+            job.done = i + 1
+        return out, info
+
+    return produce_crt
+
+
+def crt_animation_note(frame_count: int, crt: CrtSettings):
+    """Avertit du coût de l'option : images en couleurs vraies au lieu d'un fichier indexé."""
+    st.caption(
+        f"📺 Effet CRT complet sur chaque image (×{crt.scale}, couleurs vraies) : animation limitée à "
+        f"{frame_count} images, jusqu'à ~0,7 Mo par image contre quelques Ko sans l'effet."
+    )
 
 
 def render_crt_view(chr_data: bytes, speed=2, palette_name=None):
@@ -40,39 +248,38 @@ def render_crt_view(chr_data: bytes, speed=2, palette_name=None):
     indices = DEMO_PALETTES[palette_name]
     palette = NES_PALETTE[indices]
 
-    # --- Construction de la mosaïque CHR ---
-    total_tiles = len(chr_data) // 16
+    # --- Construction de la mosaïque CHR (indices, étirée en 512×480 au plus proche voisin) ---
     tiles_per_row = 16
-    rows = (total_tiles + tiles_per_row - 1) // tiles_per_row
-    mosaic = np.zeros((rows * 8, tiles_per_row * 8), dtype=np.uint8)
-
-    for i in range(total_tiles):
-        tile_bytes = chr_data[i * 16:(i + 1) * 16]
-        low = np.frombuffer(tile_bytes[:8], dtype=np.uint8)
-        high = np.frombuffer(tile_bytes[8:], dtype=np.uint8)
-        tile = np.zeros((8, 8), dtype=np.uint8)
-        for y in range(8):
-            for x in range(8):
-                lo_bit = (low[y] >> (7 - x)) & 1
-                hi_bit = (high[y] >> (7 - x)) & 1
-                tile[y, x] = lo_bit + (hi_bit << 1)
-        r, c = divmod(i, tiles_per_row)
-        mosaic[r * 8:(r + 1) * 8, c * 8:(c + 1) * 8] = tile
-
-    rgb = palette[mosaic]
-    img = Image.fromarray(rgb, "RGB").resize((512, 480), Image.NEAREST)
-
-    # --- Animation de défilement horizontal ---
-    scroll_speed = st.slider("📜 Vitesse du défilement", 1, 10, speed)
-    enable_crt = st.checkbox("📺 Activer effet CRT", value=True)
+    mosaic = np.asarray(indexed_image(cached_mosaic(chr_data, tiles_per_row), size=(512, 480)))
+    width = mosaic.shape[1]
 
-    placeholder = st.empty()
-    for offset in range(0, img.width - 256, scroll_speed):
-        viewport = img.crop((offset, 0, offset + 256, 240))
-        if enable_crt:
-            viewport = apply_crt_effect(viewport)
-        placeholder.image(viewport, caption=f"Défilement horizontal (offset={offset})", use_container_width=True)
-        time.sleep(0.05)
+    # --- Animation de défilement horizontal : rendue dans un thread, jouée par le navigateur ---
+    scroll_speed = st.slider("📜 Vitesse du défilement", 1, 10, speed)
+    crt = crt_controls("crt_view", default=True)
+    offsets = list(range(0, max(1, width - 256), scroll_speed))
+    colors = palette
+    if crt is not None:
+        offsets = offsets[:CRT_ANIMATION_FRAMES]
+        crt_animation_note(len(offsets), crt)
 
-    st.success("🎬 Animation terminée (fin du balayage).")
+    def produce(job):
+        frames = []
+        for i, offset in enumerate(offsets):
+            frames.append(mosaic[:240, offset:offset + 256])
+            job.done = i + 1
+        return frames, {}
 
+    if crt is not None:
+        produce, colors = crt_producer(produce, palette, crt), None
+    job = start_animation(
+        content_key(chr_data), ("crt_view", tuple(indices), len(offsets), scroll_speed, crt),
+        produce, len(offsets), colors,
+    )
+    animation = wait_animation(job)
+    caption = f"Défilement horizontal — {animation.frame_count} frames à 60 i/s — {animation.nbytes / 1024:.0f} Ko"
+    # Images CRT à leur taille native, hors pixel_area (voir show_frame)
+    if crt is not None:
+        show_animation(animation, caption=caption, zoom=1)
+    else:
+        with pixel_area("crt_view"):
+            show_animation(animation, caption=caption)
@@ -1,9 +1,13 @@
 # utils/nes_emulator.py
 import numpy as np
 import streamlit as st
-import time
-from PIL import Image
 from utils.nes_palette import NES_PALETTE, DEMO_PALETTES
+from utils.artifacts import content_key
+from utils.chr import cached_mosaic
+from utils.ppu_render import indexed_image
+from utils.animation import ANIMATION_FORMATS, show_animation, start_animation, wait_animation
+from utils.display import pixel_area
+from utils.nes_crt_view import CRT_ANIMATION_FRAMES, crt_animation_note, crt_controls, crt_producer
 
 
 # ================================================================
@@ -52,32 +56,18 @@ class MiniPPU:
         self.framebuffer = np.zeros((240, 256, 3), dtype=np.uint8)
         self.frame = 0
 
-    def render_frame(self, frame_index, palette):
-        """Affiche la CHR-ROM comme si la NES balayait l’écran image par image."""
-        total_tiles = len(self.chr_data) // 16
+    def frame_indices(self, frame_index):
+        """Image d'indices de la frame : la CHR-ROM comme si la NES balayait l’écran image par image."""
         tiles_per_row = 16
-        rows = (total_tiles + tiles_per_row - 1) // tiles_per_row
-
-        mosaic = np.zeros((rows * 8, tiles_per_row * 8), dtype=np.uint8)
-        for i in range(total_tiles):
-            tile_bytes = self.chr_data[i * 16:(i + 1) * 16]
-            low = np.frombuffer(tile_bytes[:8], dtype=np.uint8)
-            high = np.frombuffer(tile_bytes[8:], dtype=np.uint8)
-            tile = np.zeros((8, 8), dtype=np.uint8)
-            for y in range(8):
-                for x in range(8):
-                    lo_bit = (low[y] >> (7 - x)) & 1
-                    hi_bit = (high[y] >> (7 - x)) & 1
-                    tile[y, x] = lo_bit + (hi_bit << 1)
-            r, c = divmod(i, tiles_per_row)
-            mosaic[r * 8:(r + 1) * 8, c * 8:(c + 1) * 8] = tile
+        mosaic = cached_mosaic(self.chr_data, tiles_per_row)
 
         # Simulation d’un balayage vertical du PPU
         scroll_y = (frame_index * 4) % max(1, mosaic.shape[0] - 240)
-        window = mosaic[scroll_y:scroll_y + 240, :256]
-        rgb = palette[window]
+        return mosaic[scroll_y:scroll_y + 240, :256]
 
-        return Image.fromarray(rgb, mode="RGB")
+    def render_frame(self, frame_index, palette):
+        """Affiche la CHR-ROM comme si la NES balayait l’écran image par image."""
+        return indexed_image(self.frame_indices(frame_index), palette)
 
 
 # ================================================================
@@ -116,6 +106,11 @@ def run_emulator(prg_data: bytes, chr_data: bytes = None, frame_count=120):
         indices = DEMO_PALETTES[palette_name]
         palette = NES_PALETTE[indices]
 
+        # Animation : pré-rendue puis jouée par le navigateur
+        fps = st.slider("Images par seconde :", 10, 60, 60, 5, key="emulator_fps")
+        fmt = ANIMATION_FORMATS[st.radio("Format :", list(ANIMATION_FORMATS), horizontal=True, key="emulator_format")]
+        crt = crt_controls("emulator")
+
     # === Zone d'affichage ===
     with col2:
         st.markdown("### 🧩 Boucle CPU/PPU simplifiée")
@@ -124,32 +119,48 @@ def run_emulator(prg_data: bytes, chr_data: bytes = None, frame_count=120):
             cpu = MiniNESCPU(np.frombuffer(prg_data, dtype=np.uint8))
             ppu = MiniPPU(chr_data)
 
-            progress = st.progress(0)
-            img_placeholder = st.empty()
-            cpu_state = st.empty()
-
+            # Boucle CPU : une instruction par frame (rapide, exécutée ici pour la trace)
+            trace = []
             for i in range(frame_count):
                 opcode = cpu.step()
-                img = ppu.render_frame(i, palette)
-
-                # Affichage image
-                img_placeholder.image(
-                    img,
-                    caption=f"🖼️ Frame {i+1}/{frame_count} — PC=${cpu.pc:04X} — Opcode ${opcode:02X}",
-                    use_container_width=True
-                )
-
-                # Affichage état CPU
-                cpu_state.json({
-                    "PC": f"${cpu.pc:04X}",
-                    "A": f"${cpu.a:02X}",
-                    "X": f"${cpu.x:02X}",
-                    "Y": f"${cpu.y:02X}",
-                    "Cycle": cpu.cycle
-                })
-
-                progress.progress((i + 1) / frame_count)
-                time.sleep(0.05)
+                trace.append({"Frame": i + 1, "PC": f"${cpu.pc:04X}", "Opcode": f"${opcode:02X}", "A": f"${cpu.a:02X}"})
+
+            # Frames PPU rendues en arrière-plan puis jouées par le navigateur (un seul fichier)
+            shown = frame_count if crt is None else min(frame_count, CRT_ANIMATION_FRAMES)
+
+            def produce(job):
+                frames = []
+                for i in range(shown):
+                    frames.append(ppu.frame_indices(i))
+                    job.done = i + 1
+                return frames, {}
+
+            colors = palette
+            if crt is not None:
+                crt_animation_note(shown, crt)
+                produce, colors = crt_producer(produce, palette, crt), None
+            job = start_animation(
+                content_key(ppu.chr_data), ("emulator", shown, tuple(indices), crt),
+                produce, shown, colors, fps=fps, fmt=fmt,
+            )
+            animation = wait_animation(job)
+            caption = f"🖼️ {shown} frames à {fps} i/s — {animation.nbytes / 1024:.0f} Ko ({fmt.upper()})"
+            if crt is not None:
+                show_animation(animation, caption=caption, zoom=1)
+            else:
+                with pixel_area("emulator"):
+                    show_animation(animation, caption=caption)
+
+            # État CPU en fin de boucle
+            st.json({
+                "PC": f"${cpu.pc:04X}",
+                "A": f"${cpu.a:02X}",
+                "X": f"${cpu.x:02X}",
+                "Y": f"${cpu.y:02X}",
+                "Cycle": cpu.cycle
+            })
+            with st.expander("📜 Trace CPU frame par frame"):
+                st.dataframe(trace, hide_index=True)
 
             st.success("✅ Émulation terminée — boucle complète exécutée.")
         else:
@@ -0,0 +1,194 @@
+# utils/nointro.py
+"""
+Index compilé de la base No-Intro (.dat XML).
+
+Le fichier .dat (plusieurs milliers d'entrées) est lu une seule fois en flux
+(iterparse) puis compilé en base SQLite sous le dossier de cache. Les recherches
+par sha1 / crc / md5 / sha256 / taille passent ensuite par des index B-tree
+(quelques microsecondes) sur une base ouverte en mmap, sans reconstruire l'arbre XML.
+L'index est reconstruit si la <version> du .dat ou sa date de modification change.
+"""
+import os
+import re
+import sqlite3
+import threading
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from pathlib import Path
+
+DEFAULT_DAT_PATH = "data/No-Intro-NES.dat"
+CACHE_DIR = Path(os.environ.get("NES_LAB_CACHE_DIR", ".cache"))
+
+HASH_FIELDS = ("sha1", "crc", "md5", "sha256")
+SCHEMA_VERSION = "1"
+
+_VERSION_RE = re.compile(rb"<version>\s*([^<]+?)\s*</version>")
+
+
+def read_dat_version(dat_path) -> str:
+    """Lit la balise <version> dans l'en-tête du .dat sans parser tout le fichier."""
+    with open(dat_path, "rb") as f:
+        head = f.read(8192)
+    m = _VERSION_RE.search(head)
+    return m.group(1).decode("utf-8", "replace") if m else ""
+
+
+def _iter_dat_roms(dat_path):
+    """Parcourt le .dat en flux et renvoie (titre, nom, taille, crc, md5, sha1, sha256, header)."""
+    for _, elem in ET.iterparse(dat_path, events=("end",)):
+        if elem.tag != "game":
+            continue
+        title = elem.attrib.get("name") or elem.findtext("description") or "Jeu inconnu"
+        for rom in elem.findall("rom"):
+            a = rom.attrib
+            size = a.get("size", "")
+            yield (
+                title,
+                a.get("name", ""),
+                int(size) if size.isdigit() else None,
+                a.get("crc", "").strip().lower() or None,
+                a.get("md5", "").strip().lower() or None,
+                a.get("sha1", "").strip().lower() or None,
+                a.get("sha256", "").strip().lower() or None,
+                a.get("header", "") or None,
+            )
+        elem.clear()
+
+
+def build_index(dat_path, db_path) -> None:
+    """Compile le .dat en base SQLite (écriture atomique via fichier temporaire)."""
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = db_path.with_suffix(f".tmp{os.getpid()}")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    st = os.stat(dat_path)
+    con = sqlite3.connect(tmp_path)
+    try:
+        con.executescript("""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE roms (
+                title TEXT, rom_name TEXT, size INTEGER,
+                crc TEXT, md5 TEXT, sha1 TEXT, sha256 TEXT, header TEXT
+            );
+        """)
+        con.executemany("INSERT INTO roms VALUES (?, ?, ?, ?, ?, ?, ?, ?)", _iter_dat_roms(dat_path))
+        for field in HASH_FIELDS + ("size",):
+            con.execute(f"CREATE INDEX idx_{field} ON roms({field})")
+        con.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("schema", SCHEMA_VERSION),
+            ("dat_version", read_dat_version(dat_path)),
+            ("dat_mtime_ns", str(st.st_mtime_ns)),
+            ("dat_size", str(st.st_size)),
+        ])
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp_path, db_path)
+
+
+class NoIntroIndex:
+    """Index No-Intro compilé : recherche des entrées par empreinte ou taille."""
+
+    def __init__(self, dat_path=DEFAULT_DAT_PATH, cache_dir=None):
+        self.dat_path = Path(dat_path)
+        cache_dir = Path(cache_dir) if cache_dir else CACHE_DIR
+        self.db_path = cache_dir / f"{self.dat_path.stem}.sqlite"
+        self._lock = threading.Lock()
+        self._con = None
+        self._stamp = None
+        # Cache propre à l'instance (un lru_cache de méthode serait partagé et garderait self en vie)
+        self._lookup = lru_cache(maxsize=4096)(self._query)
+        self.open()
+
+    def _dat_stamp(self):
+        st = os.stat(self.dat_path)
+        return st.st_mtime_ns, st.st_size
+
+    def _is_stale(self) -> bool:
+        if not self.db_path.exists():
+            return True
+        con = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            meta = dict(con.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError:
+            return True
+        finally:
+            con.close()
+        mtime_ns, size = self._dat_stamp()
+        return (
+            meta.get("schema") != SCHEMA_VERSION
+            or meta.get("dat_mtime_ns") != str(mtime_ns)
+            or meta.get("dat_size") != str(size)
+            or meta.get("dat_version") != read_dat_version(self.dat_path)
+        )
+
+    def open(self):
+        """Ouvre l'index (reconstruit au besoin) en lecture seule, mappé en mémoire."""
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+            if self._is_stale():
+                build_index(self.dat_path, self.db_path)
+            con = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            con.row_factory = sqlite3.Row
+            con.execute(f"PRAGMA mmap_size={max(self.db_path.stat().st_size, 1 << 20)}")
+            self._con = con
+            self._stamp = self._dat_stamp()
+            self.version = con.execute("SELECT value FROM meta WHERE key = 'dat_version'").fetchone()[0]
+            self.count = con.execute("SELECT COUNT(*) FROM roms").fetchone()[0]
+            self._lookup.cache_clear()
+
+    def refresh(self):
+        """Rouvre l'index si le .dat a été modifié depuis l'ouverture."""
+        if self._dat_stamp() != self._stamp:
+            self.open()
+
+    def lookup(self, sha1=None, crc=None, md5=None, sha256=None, size=None) -> list:
+        """Entrées dont toutes les empreintes fournies correspondent (insensible à la casse)."""
+        criteria = (
+            ("sha1", sha1.lower() if sha1 else None),
+            ("crc", crc.lower() if crc else None),
+            ("md5", md5.lower() if md5 else None),
+            ("sha256", sha256.lower() if sha256 else None),
+            ("size", size),
+        )
+        return [dict(r) for r in self._lookup(tuple(c for c in criteria if c[1] is not None))]
+
+    @property
+    def stamp(self) -> tuple:
+        """(mtime_ns, taille) du .dat à l'ouverture de l'index : à inclure dans les clés de cache."""
+        return self._stamp
+
+    def _query(self, criteria):
+        if not criteria:
+            return ()
+        where = " AND ".join(f"{field} = ?" for field, _ in criteria)
+        with self._lock:
+            rows = self._con.execute(f"SELECT * FROM roms WHERE {where}", [v for _, v in criteria]).fetchall()
+        return tuple(rows)
+
+    def find_title(self, sha1: str = None, crc32: str = None):
+        """Titre No-Intro correspondant (SHA-1 prioritaire, puis CRC32), ou None."""
+        for criteria in ({"sha1": sha1}, {"crc": crc32}):
+            if next(iter(criteria.values())):
+                rows = self.lookup(**criteria)
+                if rows:
+                    return rows[0]["title"]
+        return None
+
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_index(dat_path=DEFAULT_DAT_PATH) -> NoIntroIndex:
+    """Index partagé par le processus pour un .dat donné (revalidé par sa date de modification)."""
+    key = os.path.abspath(dat_path)
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(key)
+        if index is None:
+            index = _INDEXES[key] = NoIntroIndex(dat_path)
+    index.refresh()
+    return index
@@ -1,10 +1,15 @@
 # utils/ppu_framebuilder.py
 import numpy as np
-from PIL import Image
 import streamlit as st
-import time
-import random
-from utils.nes_palette import NES_PALETTE, DEMO_PALETTES
+from utils.nes_palette import DEMO_PALETTES
+from utils.artifacts import content_key
+from utils.chr import cached_tiles
+from utils.animation import ANIMATION_FORMATS, show_animation, start_animation, wait_animation
+from utils.ppu_render import build_nametable, indexed_image, palette_ram, ppu_palette_rgb
+from utils.ppu_incremental import FRAME_PIXELS, IncrementalRenderer
+from utils.ppu_sprites import SPRITE_COUNT, build_oam, parse_oam, sprite0_hit
+from utils.display import pixel_area
+from utils.nes_crt_view import CRT_ANIMATION_FRAMES, crt_animation_note, crt_controls, crt_producer, show_frame
 
 
 # === Fonctions de base inchangées ===
@@ -33,19 +38,7 @@ def decode_chr(chr_data: bytes):
         chr_data = fake_chr.tobytes()
 
     # === Décodage standard des tuiles NES ===
-    total_tiles = len(chr_data) // 16
-    tiles = []
-    for i in range(total_tiles):
-        tile_bytes = chr_data[i*16:(i+1)*16]
-        low = np.frombuffer(tile_bytes[:8], dtype=np.uint8)
-        high = np.frombuffer(tile_bytes[8:], dtype=np.uint8)
-        tile = np.zeros((8, 8), dtype=np.uint8)
-        for y in range(8):
-            for x in range(8):
-                lo_bit = (low[y] >> (7 - x)) & 1
-                hi_bit = (high[y] >> (7 - x)) & 1
-                tile[y, x] = lo_bit + (hi_bit << 1)
-        tiles.append(tile)
+    tiles = cached_tiles(chr_data)
 
     # ✅ On renvoie toujours au moins quelques tuiles
     if len(tiles) == 0:
@@ -54,31 +47,77 @@ def decode_chr(chr_data: bytes):
 
 
 def build_name_table(width=32, height=30, total_tiles=256):
-    table = np.zeros((height, width), dtype=np.uint16)
-    for y in range(height):
-        for x in range(width):
-            base = (x * 11 + y * 7) % total_tiles
-            table[y, x] = (base + (x ^ y) * 2) % total_tiles
-    return table
+    y, x = np.mgrid[0:height, 0:width]
+    base = (x * 11 + y * 7) % total_tiles
+    return ((base + (x ^ y) * 2) % total_tiles).astype(np.uint16)
 
 
 def build_attribute_table(width=32, height=30):
-    attr = np.zeros((height // 2, width // 2), dtype=np.uint8)
-    for y in range(attr.shape[0]):
-        for x in range(attr.shape[1]):
-            attr[y, x] = (x + y * 2) % 4
-    return attr
+    y, x = np.mgrid[0:height // 2, 0:width // 2]
+    return ((x + y * 2) % 4).astype(np.uint8)
 
 
-def build_sprites(total_tiles=256, num_sprites=8):
-    sprites = []
-    for _ in range(num_sprites):
-        tile_id = random.randint(0, total_tiles - 1)
-        x = random.randint(0, 240)
-        y = random.randint(0, 200)
-        palette_shift = random.randint(0, 3)
-        sprites.append({"id": tile_id, "x": x, "y": y, "shift": palette_shift})
-    return sprites
+def build_sprites(total_tiles=256, num_sprites=8, rng=None) -> np.ndarray:
+    """
+    Table OAM (64, 4) modifiable : num_sprites sprites aléatoires (palette, miroirs et
+    priorité variés), les autres cachés hors écran.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    n = min(num_sprites, SPRITE_COUNT)
+    sprites = np.stack([
+        rng.integers(0, 241, n),                 # X
+        rng.integers(0, 201, n),                 # Y
+        rng.integers(0, total_tiles, n) & 0xFF,  # tuile
+        rng.integers(0, 256, n) & 0xE3,          # attributs : miroirs, priorité, sous-palette
+    ], axis=1)
+    return parse_oam(build_oam(sprites)).copy()
+
+
+ANIMATION_FRAMES = 200
+
+
+def simulate_frames(vram: bytes, tiles, oam, frame_count: int, seed: int, sprites_on: bool = True,
+                    tall: bool = False, scrolling: bool = True, animated_tiles: bool = False, job=None):
+    """
+    Calcule les frames d'indices de l'animation (aucun appel Streamlit : exécutable dans un thread).
+    Renvoie (frames, info) : info contient les statistiques du rendu incrémental et l'état des sprites.
+    """
+    # Framebuffer persistant : seules les cases, attributs et boîtes de sprites modifiés sont recomposés.
+    # Scroll : une seule name table répétée (mirroring « single screen »), lue ligne par ligne.
+    renderer = IncrementalRenderer(vram, tiles, mirroring="single_low", tall=tall)
+    live_vram = np.frombuffer(vram, dtype=np.uint8).copy()
+    oam = oam.copy()
+    rng = np.random.default_rng(seed)
+    visible = oam[:, 0] < 0xEF
+    animated_cells = rng.choice(960, 12, replace=False)
+
+    frames = []
+    for frame_i in range(frame_count):
+        scroll_x = frame_i % 16 if scrolling and frame_count > 1 else 0
+        scroll_y = (frame_i // 4) % 8 if scrolling and frame_count > 1 else 0
+
+        # --- Tuiles animées (eau, lave…) : le CPU réécrit quelques octets de name table ---
+        if animated_tiles and frame_i and frame_i % 8 == 0:
+            live_vram[animated_cells] += 1
+
+        # --- Sprites : petit mouvement NES-like (les sprites cachés restent hors écran) ---
+        if sprites_on and frame_i:
+            oam[visible, 3] = (oam[visible, 3] + rng.integers(-1, 2, visible.sum())) % 248
+            oam[visible, 0] = (oam[visible, 0] + rng.integers(-1, 2, visible.sum())) % 232
+
+        frames.append(renderer.update(live_vram, oam if sprites_on else None, (scroll_x, scroll_y)).copy())
+        if job is not None:
+            job.done = frame_i + 1
+
+    info = {"stats": renderer.stats_table(), "sprites": None}
+    if sprites_on and renderer.sprites is not None:
+        sprites = renderer.sprites
+        info["sprites"] = {
+            "hit": sprite0_hit(renderer.background, sprites),
+            "overflow_lines": len(sprites.overflow_lines),
+            "dropped": sprites.dropped,
+        }
+    return frames, info
 
 
 # === Boucle d’animation NES simplifiée ===
@@ -94,8 +133,12 @@ def render_ppu_frame(chr_data: bytes):
         list(DEMO_PALETTES.keys()),
         key="ppu_frame_palette"
     )
-    indices = DEMO_PALETTES[palette_name]
-    base_palette = NES_PALETTE[indices]
+    # Palette RAM (32 octets) : la palette choisie + les 3 suivantes pour le fond,
+    # les 4 d'après pour les sprites
+    names = list(DEMO_PALETTES)
+    start = names.index(palette_name)
+    ram = palette_ram(DEMO_PALETTES[names[(start + i) % len(names)]] for i in range(8))
+    frame_palette = ppu_palette_rgb(ram)
 
     # Décodage des tuiles
     tiles = decode_chr(chr_data)
@@ -104,62 +147,86 @@ def render_ppu_frame(chr_data: bytes):
         st.warning("Aucune tuile trouvée.")
         return
 
-    # Tables
-    name_table = build_name_table(total_tiles=total_tiles)
+    # Name table de 1 Ko comme en VRAM : 960 numéros de tuiles (8 bits) + 64 octets d'attributs
+    name_table = build_name_table(total_tiles=min(total_tiles, 256))
     attribute_table = build_attribute_table()
+    vram = build_nametable(name_table, attribute_table.repeat(2, axis=0).repeat(2, axis=1))
 
     # Paramètres d’animation
     enable_sprites = st.checkbox("👾 Activer couche Sprite")
-    num_sprites = st.slider("Nombre de sprites", 4, 32, 8)
+    col1, col2 = st.columns(2)
+    num_sprites = col1.slider("Nombre de sprites", 4, SPRITE_COUNT, 8)
+    tall = col2.checkbox("Sprites 8×16 (bit 5 de PPUCTRL)")
     animate = st.checkbox("🌀 Activer animation / scroll")
-    speed = st.slider("Vitesse d’animation (ms)", 30, 200, 80, 10)
-
-    placeholder = st.empty()
-
-    sprites = build_sprites(total_tiles, num_sprites)
-
-    for frame_i in range(200 if animate else 1):
-        scroll_x = frame_i % 16 if animate else 0
-        scroll_y = (frame_i // 4) % 8 if animate else 0
-
-        h, w = name_table.shape
-        frame = np.zeros((h * 8, w * 8, 3), dtype=np.uint8)
-
-        # --- Fond ---
-        for ty in range(h):
-            for tx in range(w):
-                tile_index = int(name_table[ty, tx]) % total_tiles
-                tile = tiles[tile_index]
-                attr_x, attr_y = tx // 2, ty // 2
-                sub_palette_index = attribute_table[attr_y, attr_x]
-                local_palette = np.roll(base_palette, sub_palette_index, axis=0)
-                frame[ty*8:(ty+1)*8, tx*8:(tx+1)*8] = local_palette[tile]
-
-        # --- Sprites ---
-        if enable_sprites:
-            for s in sprites:
-                tile = tiles[s["id"]]
-                sprite_palette = np.roll(base_palette, s["shift"], axis=0)
-                sprite_img = sprite_palette[tile]
-                mask = tile > 0
-                # petit mouvement NES-like
-                s["x"] = (s["x"] + random.choice([-1, 0, 1])) % 248
-                s["y"] = (s["y"] + random.choice([-1, 0, 1])) % 232
-                sy, sx = s["y"], s["x"]
-                for y in range(8):
-                    for x in range(8):
-                        if mask[y, x]:
-                            frame[sy + y, sx + x] = sprite_img[y, x]
-
-        # --- Scroll (caméra) ---
-        viewport = frame[scroll_y:scroll_y+240, scroll_x:scroll_x+256]
-        img = Image.fromarray(viewport, mode="RGB").resize((512, 480), Image.NEAREST)
-        placeholder.image(img, caption=f"🕹️ Frame {frame_i:03d}", use_container_width=True)
-
-        if animate:
-            time.sleep(speed / 1000.0)
+    col1, col2 = st.columns(2)
+    scrolling = col1.checkbox("↔️ Défilement pendant l’animation", value=True)
+    animated_tiles = col2.checkbox("🔁 Tuiles animées (quelques cases de la name table)")
+    col1, col2, col3 = st.columns([2, 2, 1])
+    fps = col1.slider("Images par seconde", 10, 60, 60, 5, key="ppu_frame_fps")
+    fmt = ANIMATION_FORMATS[col2.radio("Format", list(ANIMATION_FORMATS), horizontal=True, key="ppu_frame_format")]
+    if col3.button("🎲 Nouveau tirage"):
+        st.session_state.ppu_frame_seed = st.session_state.get("ppu_frame_seed", 0) + 1
+    seed = st.session_state.get("ppu_frame_seed", 0)
+    crt = crt_controls("ppu_frame")
+
+    oam = build_sprites(total_tiles, num_sprites, np.random.default_rng(seed))
+    options = dict(sprites_on=enable_sprites, tall=tall, scrolling=scrolling, animated_tiles=animated_tiles)
+
+    if animate:
+        # Animation calculée dans un thread puis jouée par le navigateur (un seul fichier, en cache)
+        frame_count = ANIMATION_FRAMES if crt is None else CRT_ANIMATION_FRAMES
+
+        def produce(job):
+            return simulate_frames(vram, tiles, oam, frame_count, seed, job=job, **options)
+
+        palette = frame_palette
+        if crt is not None:
+            crt_animation_note(frame_count, crt)
+            produce, palette = crt_producer(produce, frame_palette, crt), None
+        job = start_animation(
+            content_key(chr_data) if len(chr_data) else "simulated_chr",
+            ("ppu_frame", palette_name, num_sprites, seed, frame_count, tuple(sorted(options.items())), crt),
+            produce, frame_count, palette, fps=fps, fmt=fmt,
+        )
+        animation = wait_animation(job)
+        caption = f"🕹️ {animation.frame_count} frames à {fps} i/s — {animation.nbytes / 1024:.0f} Ko ({fmt.upper()})"
+        if crt is not None:
+            show_animation(animation, caption=caption, zoom=1)
+        else:
+            with pixel_area("ppu_frame"):
+                show_animation(animation, caption=caption)
+        info = animation.info
+    else:
+        frames, info = simulate_frames(vram, tiles, oam, 1, seed, **options)
+        show_frame(indexed_image(frames[0], frame_palette), crt, caption="🕹️ Frame 000", area="ppu_frame")
+
+    sprite_info = info["sprites"]
+    if sprite_info:
+        hit = sprite_info["hit"]
+        st.caption(
+            f"Sprite 0 hit : {'ligne %d, colonne %d' % (hit[1], hit[0]) if hit else 'non'} — "
+            f"lignes à plus de 8 sprites : {sprite_info['overflow_lines']} "
+            f"({sprite_info['dropped']} lignes de sprites non dessinées)"
+        )
+
+    # --- Statistiques du rendu incrémental ---
+    if animate:
+        table = info["stats"]
+        st.markdown("#### 📉 Pixels réécrits par image (rendu incrémental)")
+        st.line_chart({
+            "pixels réécrits": table["pixels_touched"],
+            "dont boîtes de sprites": table["sprite_pixels"],
+            "rendu complet": [FRAME_PIXELS] * len(table["frame"]),
+        })
+        mean = sum(table["pixels_touched"]) / len(table["frame"])
+        st.caption(
+            f"Moyenne : {mean:,.0f} pixels par image ({mean / FRAME_PIXELS:.1%} de l’écran), "
+            f"{sum(table['tiles_recomposed'])} cases de name table redécodées en {len(table['frame'])} images. "
+            "Un changement de scroll recopie tout le fond depuis le plan (sans redécoder de tuile)."
+        )
 
     st.info("""
     💡 L’écran NES fait défiler le décor par translation de la caméra,  
     et le PPU redessine les sprites chaque frame (~60 fps sur console réelle).
+    Au-delà de 8 sprites sur une même ligne, les suivants dans l'OAM disparaissent (clignotement des jeux).
     """)
@@ -0,0 +1,146 @@
+# utils/ppu_incremental.py
+"""
+Rendu incrémental d'une image NES : un framebuffer persistant mis à jour par régions sales.
+
+D'une image à l'autre, seules quelques choses changent : une poignée de cases de la
+name table (tuiles animées), un quadrant d'attribut, les sprites qui bougent, et
+parfois le scroll. Le rendu garde donc :
+- le plan des name tables (ScanlineRenderer), dont seules les cases modifiées sont
+  recomposées (tuile ou sous-palette changée) ;
+- le fond à l'écran (240×256), recopié du plan si le scroll change, sinon mis à jour
+  uniquement sur les pixels des cases recomposées ;
+- le framebuffer final, où seules les boîtes des sprites de l'image précédente
+  (restaurées depuis le fond) et de l'image courante (redessinées) sont réécrites.
+
+Chaque update() enregistre des statistiques (FrameStats) pour tracer le nombre de
+pixels réellement touchés par image.
+"""
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+from utils.ppu_scanline import PLANE_SIZE, SCREEN_H, SCREEN_W, ScanlineRenderer, scanline_positions, scroll_writes
+from utils.ppu_sprites import HIDDEN_Y, parse_oam, render_sprites
+
+FRAME_PIXELS = SCREEN_H * SCREEN_W
+
+
+@dataclass(frozen=True)
+class FrameStats:
+    """Travail effectué pour une image."""
+    frame: int
+    tiles_recomposed: int       # cases du plan redécodées (tuile ou attribut modifié)
+    scrolled: bool              # scroll modifié : fond recopié du plan (copie, pas de décodage)
+    background_pixels: int      # pixels de fond mis à jour à l'écran
+    sprite_pixels: int          # pixels des boîtes de sprites (anciennes + nouvelles)
+    pixels_touched: int         # pixels réécrits dans le framebuffer
+
+    @property
+    def ratio(self) -> float:
+        """Part de l'écran réécrite (1.0 = rendu complet)."""
+        return self.pixels_touched / FRAME_PIXELS
+
+
+def sprite_boxes(oam, tall: bool = False) -> np.ndarray:
+    """Masque (240, 256) des boîtes 8×8 ou 8×16 des sprites visibles de l'OAM."""
+    oam = parse_oam(oam)
+    height = 16 if tall else 8
+    mask = np.zeros((SCREEN_H, SCREEN_W), dtype=bool)
+    for y, x in oam[oam[:, 0] < HIDDEN_Y][:, [0, 3]].tolist():
+        mask[y + 1:y + 1 + height, x:x + 8] = True
+    return mask
+
+
+class IncrementalRenderer:
+    """
+    Framebuffer d'indices (240, 256) tenu à jour image après image.
+
+    vram      : name tables physiques (voir ScanlineRenderer)
+    tiles     : (N, 8, 8) motifs 0..3
+    mirroring : mirroring des name tables
+    tall      : sprites 8×16
+    """
+
+    def __init__(self, vram, tiles, mirroring: str = "single_low", tall: bool = False):
+        self.scanline = ScanlineRenderer(vram, tiles, mirroring)
+        self.tiles = self.scanline.tiles
+        self.tall = tall
+        self._scroll = None
+        self._positions = None      # (xs, ys) : position dans le plan du début de chaque ligne d'écran
+        self.background = np.zeros((SCREEN_H, SCREEN_W), dtype=np.uint8)
+        self.frame = np.zeros((SCREEN_H, SCREEN_W), dtype=np.uint8)
+        self._boxes = np.zeros((SCREEN_H, SCREEN_W), dtype=bool)
+        self._oam = b""
+        self.sprites = None
+        self.history = []
+
+    def update(self, vram=None, oam=None, scroll=(0, 0), line_writes=None) -> np.ndarray:
+        """
+        Image suivante : nouvelle VRAM (name tables), nouvelle OAM et scroll (x, y) ;
+        renvoie le framebuffer (à copier avant toute modification).
+        """
+        # 1. Name tables : seules les cases modifiées du plan sont recomposées
+        dirty_cells = self.scanline.update_vram(vram) if vram is not None else None
+        tiles_recomposed = int(dirty_cells.sum()) if dirty_cells is not None else 0
+
+        # 2. Fond à l'écran : recopie complète si le scroll change, sinon pixels des cases touchées
+        scroll = (tuple(scroll), repr(line_writes))
+        scrolled = scroll != self._scroll
+        if scrolled:
+            self._scroll = scroll
+            self._positions = scanline_positions(scroll_writes(*scroll[0]), line_writes)
+            self.background = self.scanline.render(*scroll[0], line_writes=line_writes)
+            changed = np.ones((SCREEN_H, SCREEN_W), dtype=bool)
+        elif tiles_recomposed:
+            changed = self._copy_cells(dirty_cells)
+        else:
+            changed = np.zeros((SCREEN_H, SCREEN_W), dtype=bool)
+
+        # 3. Sprites : si l'OAM change, anciennes boîtes restaurées et nouvelles redessinées
+        oam = bytes(parse_oam(oam)) if oam is not None else b""
+        if oam != self._oam:
+            boxes = sprite_boxes(oam, self.tall) if oam else np.zeros_like(self._boxes)
+            sprite_area = boxes | self._boxes
+            self.sprites = render_sprites(oam, self.tiles, tall=self.tall) if boxes.any() else None
+            self._oam, self._boxes = oam, boxes
+        else:
+            sprite_area = np.zeros_like(self._boxes)
+        touched = changed | sprite_area
+        region = self.background[touched]
+        if self.sprites is not None and (touched & self._boxes).any():
+            spr, behind = self.sprites.indices[touched], self.sprites.behind[touched]
+            show = (spr > 0) & ~(behind & ((region & 0x03) > 0))
+            region = np.where(show, spr, region)
+        self.frame[touched] = region
+
+        self.history.append(FrameStats(
+            frame=len(self.history),
+            tiles_recomposed=tiles_recomposed,
+            scrolled=scrolled,
+            background_pixels=int(np.count_nonzero(changed)),
+            sprite_pixels=int(np.count_nonzero(sprite_area)),
+            pixels_touched=int(np.count_nonzero(touched)),
+        ))
+        return self.frame
+
+    def _copy_cells(self, dirty_cells: np.ndarray) -> np.ndarray:
+        """
+        Recopie du plan les seuls pixels d'écran couverts par les cases modifiées (masque 64×64),
+        d'après la position de chaque ligne dans le plan ; renvoie le masque des pixels recopiés.
+        """
+        xs, ys = self._positions
+        changed = np.zeros((SCREEN_H, SCREEN_W), dtype=bool)
+        lines = np.flatnonzero(dirty_cells.any(axis=1)[ys // 8])
+        if not len(lines):
+            return changed
+        plane_y = ys[lines]
+        plane_x = (xs[lines, None] + np.arange(SCREEN_W)) % PLANE_SIZE       # (lignes, 256)
+        rows, cols = np.nonzero(dirty_cells[plane_y[:, None] // 8, plane_x // 8])
+        self.background[lines[rows], cols] = self.scanline.plane[plane_y[rows], plane_x[rows, cols]]
+        changed[lines[rows], cols] = True
+        return changed
+
+    def stats_table(self) -> dict:
+        """Historique des statistiques par colonne (pour st.line_chart / pandas)."""
+        rows = [asdict(s) for s in self.history]
+        return {key: [row[key] for row in rows] for key in rows[0]} if rows else {}
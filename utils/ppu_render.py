@@ -0,0 +1,254 @@
+# utils/ppu_render.py
+"""
+Rendu vectorisé du PPU : framebuffer d'indices de palette + table de couleurs.
+
+Comme le vrai PPU, le fond est d'abord composé en indices de palette
+(sous-palette × 4 + pixel 0..3, donc 0..15) ; la conversion en RGB est un seul
+accès indexé dans une table de 16 couleurs. Ainsi :
+- un changement de palette ne touche aucune tuile : seule la conversion finale
+  (np.take dans un buffer existant) est refaite ;
+- un changement de banque CHR ou de name table ne recompose que les tuiles
+  concernées (ou tout l'écran d'un bloc, si la majorité a changé).
+
+Le fond peut être décrit comme sur la console : une name table de 1 Ko
+(960 numéros de tuiles + 64 octets d'attributs, chaque octet portant 4 quadrants
+de 2 bits) et 16 octets de palette RAM ($3F00–$3F0F, 4 sous-palettes de fond).
+
+Les images affichées restent indexées (PIL mode "P" + putpalette) : un octet par
+pixel, un PNG environ 3× plus léger, et changer de palette ne remplace que la
+table de couleurs d'une image déjà construite.
+"""
+import numpy as np
+from PIL import Image
+
+from utils.nes_palette import NES_PALETTE
+
+
+def sub_palettes(base_indices, count: int = 4) -> np.ndarray:
+    """Table (count × 4, 3) des couleurs RGB : sous-palette s = palette de base décalée de s (np.roll)."""
+    base = NES_PALETTE[list(base_indices)]
+    return np.concatenate([np.roll(base, s, axis=0) for s in range(count)])
+
+
+# --- Images indexées (mode "P") ---
+def palette_bytes(palette_rgb) -> bytes:
+    """Table de couleurs PIL (256 × RGB) ; les entrées non utilisées restent noires."""
+    flat = np.zeros((256, 3), dtype=np.uint8)
+    palette_rgb = np.asarray(palette_rgb, dtype=np.uint8).reshape(-1, 3)
+    flat[:len(palette_rgb)] = palette_rgb
+    return flat.tobytes()
+
+
+def indexed_image(indices: np.ndarray, palette_rgb=None, scale: int = 1, size: tuple = None) -> Image.Image:
+    """
+    Image PIL en mode "P" à partir d'indices de palette (uint8), agrandie au plus proche voisin
+    (facteur `scale` ou taille `size`). Sans palette_rgb, seule la table est à fournir ensuite (recolor).
+    """
+    img = Image.fromarray(np.ascontiguousarray(indices, dtype=np.uint8), mode="P")
+    if size is None and scale != 1:
+        size = (img.width * scale, img.height * scale)
+    if size is not None:
+        img = img.resize(size, Image.NEAREST)
+    if palette_rgb is not None:
+        img.putpalette(palette_bytes(palette_rgb))
+    return img
+
+
+def recolor(img: Image.Image, palette_rgb) -> Image.Image:
+    """Copie d'une image indexée avec une autre palette (les pixels ne sont pas recalculés)."""
+    out = img.copy()
+    out.putpalette(palette_bytes(palette_rgb))
+    return out
+
+
+# --- Name table, attributs et palette RAM (format de la VRAM) ---
+NAMETABLE_SIZE = 1024
+NAMETABLE_TILES = 960          # 32 × 30 tuiles, suivies de 64 octets d'attributs
+SCREEN_SHAPE = (30, 32)
+
+
+def decode_attributes(attr_bytes, rows: int = 30) -> np.ndarray:
+    """
+    Sous-palette (0..3) de chacune des 32×30 tuiles à partir des 64 octets d'attributs.
+    Un octet couvre 4×4 tuiles ; ses quadrants 2×2 sont, du bit 0 au bit 7 :
+    haut-gauche, haut-droite, bas-gauche, bas-droite. rows = 32 couvre aussi les deux
+    lignes « fantômes » (coarse Y 30–31) qu'un scroll vertical hors limites affiche.
+    """
+    attrs = np.frombuffer(bytes(attr_bytes[:64]), dtype=np.uint8).reshape(8, 8)
+    ty, tx = np.indices((rows, SCREEN_SHAPE[1]))
+    shift = ((ty & 2) << 1) | (tx & 2)                        # 0, 2, 4 ou 6
+    return (attrs[ty >> 2, tx >> 2] >> shift) & 0x03
+
+
+def encode_attributes(tile_palettes: np.ndarray) -> bytes:
+    """Inverse de decode_attributes : la sous-palette de chaque bloc 2×2 est celle de sa tuile haut-gauche."""
+    grid = np.zeros((32, 32), dtype=np.uint8)                 # 30 lignes complétées à 32 (8 octets × 4)
+    grid[:30] = np.asarray(tile_palettes, dtype=np.uint8) & 0x03
+    quads = grid[::2, ::2].reshape(8, 2, 8, 2)                # (octet y, quadrant y, octet x, quadrant x)
+    attrs = quads[:, 0, :, 0] | quads[:, 0, :, 1] << 2 | quads[:, 1, :, 0] << 4 | quads[:, 1, :, 1] << 6
+    return attrs.astype(np.uint8).tobytes()
+
+
+def build_nametable(name_table: np.ndarray, tile_palettes: np.ndarray) -> bytes:
+    """Name table de 1 Ko (numéros de tuiles sur 8 bits + attributs) à partir de tables 30×32."""
+    tiles = (np.asarray(name_table) & 0xFF).astype(np.uint8).tobytes()
+    return tiles + encode_attributes(tile_palettes)
+
+
+def split_nametable(vram, index: int = 0):
+    """
+    (numéros de tuiles (30, 32), sous-palettes (30, 32)) d'une name table de 1 Ko.
+    `vram` peut être un dump de 2 ou 4 Ko ($2000–$2FFF) : index choisit la name table.
+    """
+    data = memoryview(vram)[index * NAMETABLE_SIZE:(index + 1) * NAMETABLE_SIZE]
+    if len(data) < NAMETABLE_SIZE:
+        raise ValueError(f"Name table incomplète : {len(data)} octets au lieu de {NAMETABLE_SIZE}")
+    name_table = np.frombuffer(data[:NAMETABLE_TILES], dtype=np.uint8).reshape(SCREEN_SHAPE)
+    return name_table, decode_attributes(data[NAMETABLE_TILES:])
+
+
+def palette_ram(sub_palette_indices) -> bytes:
+    """
+    Palette RAM à partir de listes de 4 couleurs NES : 4 listes = 16 octets de fond ($3F00),
+    8 listes = 32 octets (fond puis sprites, $3F10).
+    """
+    ram = np.array([list(p)[:4] for p in sub_palette_indices][:8], dtype=np.uint8).reshape(-1)
+    size = 32 if len(ram) > 16 else 16
+    return bytes(ram) + bytes(size - len(ram))
+
+
+def ppu_palette_rgb(ram) -> np.ndarray:
+    """
+    Table (16 ou 32, 3) des couleurs depuis la palette RAM : l'entrée 0 de chaque
+    sous-palette (fond comme sprites) affiche la couleur universelle $3F00, comme sur le PPU.
+    """
+    ram = np.frombuffer(bytes(ram[:32]), dtype=np.uint8).copy() & 0x3F
+    ram[::4] = ram[0]
+    return NES_PALETTE[ram]
+
+
+def background_palette_rgb(ram) -> np.ndarray:
+    """Table (16, 3) des 4 sous-palettes de fond ($3F00–$3F0F)."""
+    return ppu_palette_rgb(ram[:16])
+
+
+def render_nametable(vram, tiles: np.ndarray, index: int = 0, pattern_table: int = 0) -> np.ndarray:
+    """
+    Image d'indices (240, 256) d'une name table, en une seule passe. pattern_table = 1
+    lit les motifs à $1000 (bit 4 de PPUCTRL), soit les tuiles 256..511 de la banque.
+    """
+    name_table, tile_palettes = split_nametable(vram, index)
+    return compose_indices(tiles, name_table.astype(np.intp) + 256 * pattern_table, tile_palettes)
+
+
+def compose_indices(tiles: np.ndarray, name_table: np.ndarray, tile_palettes: np.ndarray) -> np.ndarray:
+    """
+    Framebuffer (H×8, W×8) d'indices de palette pour une grille de tuiles :
+    un seul accès indexé tiles[name_table], puis transposition (aucune boucle par tuile).
+    """
+    h, w = name_table.shape
+    blocks = tiles[name_table % len(tiles)]                      # (h, w, 8, 8)
+    blocks = blocks | (tile_palettes.astype(np.uint8) << 2)[:, :, None, None]
+    return blocks.transpose(0, 2, 1, 3).reshape(h * 8, w * 8)
+
+
+def write_tiles(indices: np.ndarray, tiles: np.ndarray, name_table: np.ndarray, tile_palettes: np.ndarray,
+                mask: np.ndarray, origin: tuple = (0, 0)):
+    """
+    Recompose sur place, dans l'image d'indices, les seules tuiles sélectionnées par mask
+    (grille de la name table), avec un décalage `origin` (y, x) en pixels ; renvoie (lignes, colonnes, blocs).
+    """
+    ty, tx = np.nonzero(mask)
+    blocks = tiles[name_table[ty, tx] % len(tiles)] | (tile_palettes[ty, tx].astype(np.uint8) << 2)[:, None, None]
+    rows = (origin[0] + ty[:, None] * 8 + np.arange(8))[:, :, None]      # (k, 8, 1)
+    cols = (origin[1] + tx[:, None] * 8 + np.arange(8))[:, None, :]      # (k, 1, 8)
+    indices[rows, cols] = blocks
+    return rows, cols, blocks
+
+
+class BackgroundLayer:
+    """
+    Plan de fond de 32×30 tuiles tenu à jour de façon incrémentale.
+
+    tiles        : (N, 8, 8) motifs 0..3 (banque CHR courante)
+    name_table   : (30, 32) numéros de tuiles
+    tile_palettes: (30, 32) sous-palette (0..3) de chaque tuile
+    palette_rgb  : (16, 3) couleurs, voir background_palette_rgb() ou sub_palettes()
+    """
+
+    def __init__(self, tiles, name_table, tile_palettes, palette_rgb):
+        self.tiles = np.asarray(tiles, dtype=np.uint8)
+        self.name_table = np.array(name_table)
+        self.tile_palettes = np.array(tile_palettes, dtype=np.uint8)
+        self.palette_rgb = np.array(palette_rgb, dtype=np.uint8)
+        self.indices = compose_indices(self.tiles, self.name_table, self.tile_palettes)
+        self._rgb = np.empty(self.indices.shape + (3,), dtype=np.uint8)
+        self._colorize()
+
+    @classmethod
+    def from_nametable(cls, vram, tiles, ram, index: int = 0, pattern_table: int = 0) -> "BackgroundLayer":
+        """Plan de fond construit depuis une name table de 1 Ko et 16 octets de palette RAM."""
+        name_table, tile_palettes = split_nametable(vram, index)
+        return cls(tiles, name_table.astype(np.intp) + 256 * pattern_table, tile_palettes, background_palette_rgb(ram))
+
+    def _colorize(self):
+        """Conversion indices -> RGB : un seul accès indexé, écrit sur place."""
+        np.take(self.palette_rgb, self.indices, axis=0, out=self._rgb)
+        self.pixels_updated = self.indices.size
+
+    @property
+    def shape(self):
+        return self.indices.shape
+
+    def rgb(self) -> np.ndarray:
+        """Image RGB courante (lecture seule : copier avant d'y dessiner des sprites)."""
+        view = self._rgb.view()
+        view.flags.writeable = False
+        return view
+
+    # --- Mises à jour ciblées ---
+    def _recompose(self, mask: np.ndarray):
+        """Recompose les tuiles sélectionnées par mask (30, 32), en indices puis en RGB."""
+        ty, tx = np.nonzero(mask)
+        if not len(ty):
+            self.pixels_updated = 0
+            return
+        if len(ty) * 4 > mask.size:  # plus d'un quart de l'écran : recomposition d'un seul bloc
+            self.indices = compose_indices(self.tiles, self.name_table, self.tile_palettes)
+            self._colorize()
+            return
+        rows, cols, blocks = write_tiles(self.indices, self.tiles, self.name_table, self.tile_palettes, mask)
+        self._rgb[rows, cols] = self.palette_rgb[blocks]
+        self.pixels_updated = blocks.size
+
+    def set_palette(self, palette_rgb):
+        """Nouvelle table de couleurs : aucune tuile n'est recomposée, seule la conversion finale est refaite."""
+        palette_rgb = np.asarray(palette_rgb, dtype=np.uint8)
+        if np.array_equal(palette_rgb, self.palette_rgb):
+            self.pixels_updated = 0
+            return
+        self.palette_rgb = palette_rgb.copy()
+        self._colorize()
+
+    def set_chr_bank(self, tiles):
+        """Nouvelle banque CHR : seules les tuiles affichées dont le motif change sont recomposées."""
+        tiles = np.asarray(tiles, dtype=np.uint8)
+        old, self.tiles = self.tiles, tiles
+        if len(tiles) != len(old):  # le modulo sur le nombre de tuiles change : tout est à refaire
+            self._recompose(np.ones(self.name_table.shape, dtype=bool))
+            return
+        changed = (tiles != old).any(axis=(1, 2))
+        self._recompose(changed[self.name_table % len(tiles)])
+
+    def set_tiles(self, name_table=None, tile_palettes=None):
+        """Nouvelle name table et/ou attributs : seules les cases modifiées sont recomposées."""
+        mask = np.zeros(self.name_table.shape, dtype=bool)
+        if name_table is not None:
+            name_table = np.asarray(name_table)
+            mask |= name_table != self.name_table
+            self.name_table = name_table.copy()
+        if tile_palettes is not None:
+            tile_palettes = np.asarray(tile_palettes, dtype=np.uint8)
+            mask |= tile_palettes != self.tile_palettes
+            self.tile_palettes = tile_palettes.copy()
+        self._recompose(mask)
@@ -1,8 +1,10 @@
 # utils/ppu_rom_viewer.py
 import numpy as np
-from PIL import Image
 import streamlit as st
-from utils.nes_palette import NES_PALETTE, DEMO_PALETTES
+from utils.nes_palette import DEMO_PALETTES
+from utils.chr import cached_tiles
+from utils.ppu_render import background_palette_rgb, build_nametable, indexed_image, palette_ram, render_nametable
+from utils.nes_crt_view import crt_controls, show_frame
 
 
 def decode_chr(chr_data: bytes):
@@ -34,59 +36,46 @@ def decode_chr(chr_data: bytes):
         chr_data = bytes(8192)
 
     # 🧱 Décodage standard des tuiles CHR (8×8)
-    total_tiles = len(chr_data) // 16
-    tiles = []
-    for i in range(total_tiles):
-        t = np.zeros((8, 8), dtype=np.uint8)
-        low = np.frombuffer(chr_data[i*16:i*16+8], dtype=np.uint8)
-        high = np.frombuffer(chr_data[i*16+8:i*16+16], dtype=np.uint8)
-        for y in range(8):
-            for x in range(8):
-                lo = (low[y] >> (7 - x)) & 1
-                hi = (high[y] >> (7 - x)) & 1
-                t[y, x] = lo + (hi << 1)
-        tiles.append(t)
-
-    return tiles
+    return cached_tiles(chr_data)
 
 
 # === Construction de Name Table simulée réaliste ===
 def build_name_table(theme="mario", width=32, height=30):
     """Construit une table de tuiles NES imitant une scène connue."""
-    table = np.zeros((height, width), dtype=np.uint16)
+    y, x = np.mgrid[0:height, 0:width]
 
     if theme == "mario":
-        for y in range(height):
-            for x in range(width):
-                if y > 25:
-                    table[y, x] = 80 + (x % 4)  # sol
-                elif y > 20:
-                    table[y, x] = 64 + (x // 2) % 4  # briques
-                elif y == 10 and x % 8 == 0:
-                    table[y, x] = 100  # nuage
-                else:
-                    table[y, x] = 0  # ciel
+        table = np.select(
+            [y > 25, y > 20, (y == 10) & (x % 8 == 0)],  # sol, briques, nuage
+            [80 + x % 4, 64 + (x // 2) % 4, 100],
+            0,  # ciel
+        )
     elif theme == "zelda":
-        for y in range(height):
-            for x in range(width):
-                if y == 0 or y == height-1 or x == 0 or x == width-1:
-                    table[y, x] = 32  # mur
-                elif (x + y) % 7 == 0:
-                    table[y, x] = 48  # arbre
-                else:
-                    table[y, x] = 16  # sol
+        border = (y == 0) | (y == height - 1) | (x == 0) | (x == width - 1)
+        table = np.select([border, (x + y) % 7 == 0], [32, 48], 16)  # mur, arbre, sol
     elif theme == "metroid":
-        for y in range(height):
-            for x in range(width):
-                if y > 25:
-                    table[y, x] = 96 + (x % 8)
-                elif (x * y) % 11 == 0:
-                    table[y, x] = 72
-                else:
-                    table[y, x] = 40
+        table = np.select([y > 25, (x * y) % 11 == 0], [96 + x % 8, 72], 40)
     else:
-        table[:, :] = np.random.randint(0, 128, (height, width))
-    return table
+        table = np.random.randint(0, 128, (height, width))
+    return table.astype(np.uint16)
+
+
+def build_scene_palettes(theme="mario", width=32, height=30):
+    """
+    Sous-palette (0..3) de chaque tuile, par zone du décor. Le PPU n'en retient qu'une
+    par bloc 2×2 (quadrant d'attribut) : les limites de zones tombent sur des lignes paires.
+    """
+    y, x = np.mgrid[0:height, 0:width]
+    if theme == "mario":
+        zones = np.select([y > 25, y > 20, y < 12], [2, 1, 3], 0)  # sol, briques, nuages, ciel
+    elif theme == "zelda":
+        border = (y < 2) | (y >= height - 2) | (x < 2) | (x >= width - 2)
+        zones = np.where(border, 1, 0)
+    elif theme == "metroid":
+        zones = np.where(y > 25, 2, (x // 8) % 2)
+    else:
+        zones = np.random.randint(0, 4, (height, width))
+    return zones.astype(np.uint8)
 
 
 def render_rom_scene(chr_data: bytes):
@@ -128,22 +117,19 @@ def render_rom_scene(chr_data: bytes):
         list(DEMO_PALETTES.keys()),
         key=f"palette_{theme}_scene"
     )
-    indices = DEMO_PALETTES[palette_name]
-    palette = NES_PALETTE[indices]
+    crt = crt_controls("rom_scene")
+    # Palette RAM : la palette choisie + les 3 suivantes = 4 sous-palettes de fond
+    names = list(DEMO_PALETTES)
+    start = names.index(palette_name)
+    ram = palette_ram(DEMO_PALETTES[names[(start + i) % len(names)]] for i in range(4))
 
-    # Décodage + construction
+    # Décodage + construction d'une name table de 1 Ko (tuiles + attributs), rendue en une passe
     tiles = decode_chr(chr_data)
-    table = build_name_table(theme=theme)
-    height, width = table.shape
-
-    frame = np.zeros((height * 8, width * 8, 3), dtype=np.uint8)
-    for y in range(height):
-        for x in range(width):
-            idx = table[y, x] % len(tiles)
-            frame[y*8:(y+1)*8, x*8:(x+1)*8] = palette[tiles[idx]]
+    vram = build_nametable(build_name_table(theme=theme), build_scene_palettes(theme=theme))
+    frame = render_nametable(vram, tiles)
+    palette = background_palette_rgb(ram)
 
-    img = Image.fromarray(frame, mode="RGB").resize((512, 480), Image.NEAREST)
-    st.image(img, caption=f"Écran simulé — thème : {theme}", use_container_width=True)
+    show_frame(indexed_image(frame, palette), crt, caption=f"Écran simulé — thème : {theme}", area="rom_scene")
 
     # 🧠 Explications pédagogiques
     st.markdown(f"""
@@ -151,6 +137,8 @@ def render_rom_scene(chr_data: bytes):
     Ce rendu simule une vraie scène NES :
     - **{theme.capitalize()}** applique une structure logique (sol, mur, ciel, obstacles).
     - Chaque tuile provient directement de la **CHR-ROM** (ou CHR-RAM simulée).
+    - Les **attributs** (64 octets en fin de name table) choisissent une des 4 sous-palettes
+      par bloc de 2×2 tuiles.
     - Le PPU assemble ces tuiles pour composer le décor final.
 
     💡 Essaie de changer de palette ou de thème pour observer comment les teintes influencent l’ambiance du jeu !
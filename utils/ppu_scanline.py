@@ -0,0 +1,274 @@
+# utils/ppu_scanline.py
+"""
+Rendu du fond ligne par ligne, avec les registres de scroll internes du PPU (« loopy »).
+
+Le PPU ne connaît pas de position de caméra : il lit l'écran à partir d'une adresse
+VRAM `v` (15 bits), recopiée depuis un registre temporaire `t` que le CPU écrit via
+$2000/$2005/$2006, plus un décalage fin horizontal `x` (3 bits) :
+
+    v, t :  yyy NN YYYYY XXXXX   (Y fin, name table, Y grossier, X grossier)
+
+À chaque ligne, le PPU incrémente Y (point 256) puis recopie la partie horizontale
+de t dans v (point 257). Un jeu qui réécrit ces registres en cours d'image obtient
+une barre de statut fixe (SMB3) ou des effets de vague.
+
+Le rendu est vectorisé : les 4 name tables logiques (selon le mirroring) forment un
+plan d'indices de 512×512 pixels, chaque ligne d'écran y est une fenêtre de 256 pixels
+et toutes les lignes consécutives qui partagent le même scroll sont copiées d'un seul
+bloc (simple tranche NumPy) : une image avec deux coupures coûte 3 copies.
+"""
+import numpy as np
+
+from utils.ppu_render import NAMETABLE_SIZE, compose_indices, decode_attributes, write_tiles
+
+SCREEN_H, SCREEN_W = 240, 256
+PLANE_SIZE = 512                # 2 × 2 name tables de 256 × 256 pixels (30 lignes + 2 lignes d'attributs)
+
+# Name table physique de chacune des 4 name tables logiques ($2000, $2400, $2800, $2C00)
+MIRRORING = {
+    "horizontal": (0, 0, 1, 1),
+    "vertical": (0, 1, 0, 1),
+    "single_low": (0, 0, 0, 0),
+    "single_high": (1, 1, 1, 1),
+    "four_screen": (0, 1, 2, 3),
+}
+
+PPUCTRL, PPUSTATUS, PPUSCROLL, PPUADDR = 0x2000, 0x2002, 0x2005, 0x2006
+
+
+class LoopyRegisters:
+    """Registres internes v, t, x, w du PPU et leurs mises à jour (écritures CPU et rendu)."""
+
+    def __init__(self):
+        self.v = 0
+        self.t = 0
+        self.x = 0
+        self.w = 0
+
+    # --- Accès CPU ---
+    def write(self, register: int, value: int = 0):
+        """Écriture CPU dans $2000, $2005 ou $2006 ; $2002 = lecture de PPUSTATUS (remet w à 0)."""
+        value &= 0xFF
+        if register == PPUCTRL:
+            self.t = (self.t & ~0x0C00) | (value & 0x03) << 10
+        elif register == PPUSTATUS:
+            self.w = 0
+        elif register == PPUSCROLL:
+            if self.w == 0:
+                self.t = (self.t & ~0x001F) | value >> 3
+                self.x = value & 0x07
+            else:
+                self.t = (self.t & ~0x73E0) | (value & 0x07) << 12 | (value >> 3) << 5
+            self.w ^= 1
+        elif register == PPUADDR:
+            if self.w == 0:
+                self.t = (self.t & 0x00FF) | (value & 0x3F) << 8
+            else:
+                self.t = (self.t & 0x7F00) | value
+                self.v = self.t
+            self.w ^= 1
+        else:
+            raise ValueError(f"Registre PPU non géré : ${register:04X}")
+
+    # --- Mises à jour du rendu ---
+    def copy_horizontal(self):
+        """Point 257 : X grossier et name table horizontale de t vers v."""
+        self.v = (self.v & ~0x041F) | (self.t & 0x041F)
+
+    def copy_vertical(self):
+        """Ligne de prérendu : Y fin, Y grossier et name table verticale de t vers v."""
+        self.v = (self.v & ~0x7BE0) | (self.t & 0x7BE0)
+
+    def increment_y(self):
+        """Point 256 : ligne suivante ; après la ligne 29, passage à la name table du dessous."""
+        if (self.v & 0x7000) != 0x7000:
+            self.v += 0x1000
+            return
+        self.v &= ~0x7000
+        coarse_y = (self.v & 0x03E0) >> 5
+        if coarse_y == 29:
+            coarse_y = 0
+            self.v ^= 0x0800
+        elif coarse_y == 31:  # Y hors limites (lignes d'attributs) : pas de changement de name table
+            coarse_y = 0
+        else:
+            coarse_y += 1
+        self.v = (self.v & ~0x03E0) | coarse_y << 5
+
+    def vertical_run(self, count: int) -> np.ndarray:
+        """
+        Y dans le plan de `count` lignes successives (la ligne courante puis count − 1
+        incréments de Y), calculés d'un bloc ; v est laissé sur la dernière ligne.
+        """
+        y = (self.v >> 5 & 0x1F) * 8 + (self.v >> 12 & 0x07)
+        nt_y = self.v >> 11 & 1
+        k = y + np.arange(count)
+        if y >= SCREEN_H:  # lignes d'attributs : retour à 0 après 255, sans changer de name table
+            head = k < 256
+            k = np.where(head, k, k - 256)
+            wraps, rows = np.where(head, 0, k // SCREEN_H), np.where(head, k, k % SCREEN_H)
+        else:
+            wraps, rows = k // SCREEN_H, k % SCREEN_H
+        nts = nt_y ^ (wraps & 1)
+        last_y, last_nt = int(rows[-1]), int(nts[-1])
+        self.v = (self.v & ~0x7BE0) | (last_y & 7) << 12 | last_nt << 11 | (last_y >> 3) << 5
+        return nts * 256 + rows
+
+    # --- Position dans le plan 512×512 ---
+    @property
+    def plane_x(self) -> int:
+        return (self.v >> 10 & 1) * 256 + (self.v & 0x1F) * 8 + self.x
+
+    @property
+    def plane_y(self) -> int:
+        return (self.v >> 11 & 1) * 256 + (self.v >> 5 & 0x1F) * 8 + (self.v >> 12 & 0x07)
+
+
+def scroll_writes(x: int, y: int, nametable: int = 0) -> list:
+    """
+    Écritures de début d'image (vblank) : name table dans $2000 puis X et Y dans $2005.
+    x (0..511) et y (0..479) peuvent désigner directement un point du plan : le
+    débordement choisit la name table voisine.
+    """
+    nametable ^= (x >> 8 & 1) | (2 if y % 480 >= SCREEN_H else 0)
+    return [(PPUCTRL, nametable & 3), (PPUSTATUS, 0), (PPUSCROLL, x & 0xFF), (PPUSCROLL, y % 480 % SCREEN_H)]
+
+
+def split_writes(x: int, y: int, nametable: int = 0) -> list:
+    """
+    Séquence $2006/$2005/$2005/$2006 d'un changement de scroll complet en cours d'image
+    (X et Y), telle qu'utilisée pour les barres de statut.
+    """
+    return [
+        (PPUSTATUS, 0),
+        (PPUADDR, (nametable & 3) << 2),
+        (PPUSCROLL, y),
+        (PPUSCROLL, x),
+        (PPUADDR, ((y & 0xF8) << 2 | (x >> 3)) & 0xFF),
+    ]
+
+
+def scanline_positions(start_writes, line_writes=None):
+    """
+    Position (x, y) dans le plan 512×512 du premier pixel de chaque ligne d'écran.
+    line_writes : {ligne: [(registre, valeur), …]} écrites pendant le hblank qui précède
+    la ligne, après le point 257 (une écriture $2005 seule ne prend effet qu'à la ligne suivante).
+    """
+    regs = LoopyRegisters()
+    for register, value in start_writes:
+        regs.write(register, value)
+    regs.copy_vertical()
+    regs.copy_horizontal()
+    line_writes = line_writes or {}
+    xs = np.empty(SCREEN_H, dtype=np.intp)
+    ys = np.empty(SCREEN_H, dtype=np.intp)
+    # Entre deux lignes avec écritures, x est constant et y suit les incréments : un bloc par segment
+    bounds = sorted({0, SCREEN_H} | {line for line in line_writes if 0 <= line < SCREEN_H})
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if start:
+            regs.increment_y()
+            regs.copy_horizontal()
+        for register, value in line_writes.get(start, ()):
+            regs.write(register, value)
+        xs[start] = regs.plane_x
+        regs.copy_horizontal()                                   # point 257 des lignes suivantes
+        xs[start + 1:end] = regs.plane_x
+        ys[start:end] = regs.vertical_run(end - start)
+    return xs, ys
+
+
+def scroll_runs(xs: np.ndarray, ys: np.ndarray) -> list:
+    """Blocs (début, fin) de lignes consécutives de même scroll (même x, y qui avance d'une ligne)."""
+    breaks = np.flatnonzero((xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1] + 1)) + 1
+    bounds = np.concatenate([[0], breaks, [len(xs)]])
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def nametable_cells(data, pattern_table: int = 0):
+    """(numéros de tuiles, sous-palettes) des 32×32 cases d'une name table, lignes 30–31 comprises."""
+    data = bytes(data[:NAMETABLE_SIZE]).ljust(NAMETABLE_SIZE, b"\0")
+    name_table = np.frombuffer(data, dtype=np.uint8).reshape(32, 32).astype(np.intp) + 256 * pattern_table
+    return name_table, decode_attributes(data[960:], rows=32)
+
+
+def nametable_plane(data, tiles: np.ndarray, pattern_table: int = 0) -> np.ndarray:
+    """Name table de 1 Ko en indices (256, 256), lignes 240–255 comprises (octets d'attributs lus comme tuiles)."""
+    return compose_indices(tiles, *nametable_cells(data, pattern_table))
+
+
+class ScanlineRenderer:
+    """
+    Fond rendu ligne par ligne à partir de la VRAM des name tables (1 à 4 Ko).
+
+    vram          : name tables physiques consécutives (2 Ko de CIRAM, ou 4 Ko en four_screen)
+    tiles         : (N, 8, 8) motifs 0..3 de la banque CHR
+    mirroring     : clé de MIRRORING (valeurs de ines.Header.mirroring comprises)
+    pattern_table : table de motifs du fond (bit 4 de PPUCTRL)
+    """
+
+    def __init__(self, vram, tiles, mirroring: str = "horizontal", pattern_table: int = 0):
+        if mirroring not in MIRRORING:
+            raise ValueError(f"Mirroring inconnu : {mirroring}")
+        self.mirroring = mirroring
+        self.tiles = np.asarray(tiles, dtype=np.uint8)
+        self.pattern_table = pattern_table
+        self.vram = bytes(vram)
+        physical = {}
+        self.plane = np.empty((PLANE_SIZE, PLANE_SIZE), dtype=np.uint8)
+        for logical, index in enumerate(MIRRORING[mirroring]):
+            if index not in physical:
+                physical[index] = nametable_plane(self._physical(self.vram, index), self.tiles, pattern_table)
+            top, left = (logical >> 1) * 256, (logical & 1) * 256
+            self.plane[top:top + 256, left:left + 256] = physical[index]
+
+    @staticmethod
+    def _physical(vram, index: int) -> memoryview:
+        return memoryview(vram)[index * NAMETABLE_SIZE:(index + 1) * NAMETABLE_SIZE]
+
+    def update_vram(self, vram) -> np.ndarray:
+        """
+        Nouvelle VRAM : seules les cases dont la tuile ou le quadrant d'attribut change sont
+        recomposées, dans chaque copie logique. Renvoie le masque (64, 64) des cases du plan touchées.
+        """
+        vram = bytes(vram)
+        dirty = np.zeros((PLANE_SIZE // 8, PLANE_SIZE // 8), dtype=bool)
+        if vram == self.vram:
+            return dirty
+        for index in sorted(set(MIRRORING[self.mirroring])):
+            old_ids, old_pals = nametable_cells(self._physical(self.vram, index), self.pattern_table)
+            ids, pals = nametable_cells(self._physical(vram, index), self.pattern_table)
+            cells = (ids != old_ids) | (pals != old_pals)
+            if not cells.any():
+                continue
+            for logical, physical in enumerate(MIRRORING[self.mirroring]):
+                if physical == index:
+                    top, left = (logical >> 1) * 256, (logical & 1) * 256
+                    write_tiles(self.plane, self.tiles, ids, pals, cells, origin=(top, left))
+                    dirty[top // 8:top // 8 + 32, left // 8:left // 8 + 32] |= cells
+        self.vram = vram
+        return dirty
+
+    @property
+    def nbytes(self) -> int:
+        return self.plane.nbytes
+
+    def render(self, scroll_x: int = 0, scroll_y: int = 0, nametable: int = 0, line_writes=None,
+               source: np.ndarray = None) -> np.ndarray:
+        """
+        Image d'indices (240, 256). Le scroll de départ est écrit pendant le vblank ;
+        line_writes ({ligne: écritures}, voir split_writes) le modifie en cours d'image.
+        Le rendu ne modifie pas l'objet : une même instance peut servir à plusieurs sessions.
+        `source` remplace le plan (tout tableau 512×512, par ex. un masque de pixels modifiés).
+        """
+        source = self.plane if source is None else source
+        xs, ys = scanline_positions(scroll_writes(scroll_x, scroll_y, nametable), line_writes)
+        frame = np.empty((SCREEN_H, SCREEN_W), dtype=source.dtype)
+        for start, end in scroll_runs(xs, ys):
+            x, y = int(xs[start]), int(ys[start])
+            rows = source[y:y + end - start]
+            # Fenêtre de 256 pixels dans une ligne de 512 qui reboucle : une ou deux tranches
+            right = min(PLANE_SIZE - x, SCREEN_W)
+            frame[start:end, :right] = rows[:, x:x + right]
+            if right < SCREEN_W:
+                frame[start:end, right:] = rows[:, :SCREEN_W - right]
+        return frame
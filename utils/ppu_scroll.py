@@ -1,12 +1,107 @@
+import threading
+from collections import OrderedDict
+
 import numpy as np
-from PIL import Image
 import streamlit as st
 from utils.nes_palette import NES_PALETTE, DEMO_PALETTES, GAME_PALETTES
+from utils.artifacts import ARTIFACT_CACHE, content_key
+from utils.chr import cached_mosaic, cached_tiles
+from utils.ppu_render import background_palette_rgb, build_nametable, indexed_image, palette_ram
+from utils.ppu_rom_viewer import build_name_table, build_scene_palettes
+from utils.ppu_scanline import (
+    MIRRORING, PPUSCROLL, ScanlineRenderer, scanline_positions, scroll_runs, scroll_writes, split_writes,
+)
+from utils.display import pixel_area, show_pixels
+from utils.chr_canvas import chr_canvas
+from utils.nes_crt_view import crt_controls, show_frame
+
+VIEWPORT_W, VIEWPORT_H = 256, 240
+
+
+# === Pyramide de zoom découpée en blocs ===
+class TilePyramid:
+    """
+    Planche d'indices de palette (sans couleur) et ses versions agrandies, découpées
+    en blocs carrés de `chunk` pixels calculés à la demande. Une fenêtre n'assemble
+    que les blocs qu'elle recouvre : son coût ne dépend ni de la taille de la planche
+    ni du zoom. La palette n'est appliquée qu'à la fenêtre finale (256×240).
+    """
+
+    def __init__(self, sheet: np.ndarray, chunk: int = 128, max_chunks: int = 256):
+        self.sheet = sheet
+        self.chunk = chunk
+        self.max_chunks = max_chunks
+        self._chunks = OrderedDict()  # (zoom, ligne, colonne) -> bloc d'indices agrandi
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self.sheet.nbytes + self.max_chunks * self.chunk * self.chunk
+
+    def size(self, zoom: int) -> tuple:
+        """(largeur, hauteur) de la planche au zoom demandé."""
+        return self.sheet.shape[1] * zoom, self.sheet.shape[0] * zoom
+
+    def _build_chunk(self, zoom: int, cy: int, cx: int) -> np.ndarray:
+        width, height = self.size(zoom)
+        rows = np.arange(cy * self.chunk, min((cy + 1) * self.chunk, height)) // zoom
+        cols = np.arange(cx * self.chunk, min((cx + 1) * self.chunk, width)) // zoom
+        return self.sheet[rows[:, None], cols[None, :]]
+
+    def get_chunk(self, zoom: int, cy: int, cx: int) -> np.ndarray:
+        key = (zoom, cy, cx)
+        with self._lock:
+            block = self._chunks.get(key)
+            if block is not None:
+                self._chunks.move_to_end(key)
+                return block
+        block = self._build_chunk(zoom, cy, cx)
+        with self._lock:
+            self._chunks[key] = block
+            while len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+        return block
+
+    def viewport(self, x: int, y: int, zoom: int, width: int = VIEWPORT_W, height: int = VIEWPORT_H) -> np.ndarray:
+        """Fenêtre (height, width) d'indices au zoom donné ; hors planche = indice 0."""
+        out = np.zeros((height, width), dtype=self.sheet.dtype)
+        full_w, full_h = self.size(zoom)
+        x1, y1 = min(x + width, full_w), min(y + height, full_h)
+        c = self.chunk
+        for cy in range(y // c, (y1 - 1) // c + 1 if y1 > y else 0):
+            for cx in range(x // c, (x1 - 1) // c + 1 if x1 > x else 0):
+                block = self.get_chunk(zoom, cy, cx)
+                # Intersection du bloc et de la fenêtre, en coordonnées de planche
+                top, left = max(y, cy * c), max(x, cx * c)
+                bottom, right = min(y1, cy * c + block.shape[0]), min(x1, cx * c + block.shape[1])
+                out[top - y:bottom - y, left - x:right - x] = block[top - cy * c:bottom - cy * c, left - cx * c:right - cx * c]
+        return out
+
+
+def cached_pyramid(chr_data, tiles_per_row: int) -> TilePyramid:
+    """Pyramide partagée par (CHR, tuiles par ligne) : les blocs déjà calculés servent à toutes les sessions."""
+    return ARTIFACT_CACHE.get_or_build(
+        content_key(chr_data), "tile_pyramid",
+        lambda: TilePyramid(cached_mosaic(chr_data, tiles_per_row)),
+        params=(tiles_per_row,),
+    )
+
+
+# === CHR simulée (ROM avec CHR-RAM) ===
+def simulated_chr() -> bytes:
+    """Fausse CHR de 8 Ko aux motifs variés, pour les jeux sans CHR-ROM."""
+    fake_chr = np.zeros((8192,), dtype=np.uint8)
+    for i in range(0, len(fake_chr), 16):
+        pattern = (i // 32) % 256
+        for j in range(8):
+            fake_chr[i + j] = ((pattern >> (j % 8)) & 0xFF)
+            fake_chr[i + 8 + j] = ((~pattern >> (j % 8)) & 0xFF)
+    return fake_chr.tobytes()
 
 
 # === Génération du fond à partir des tuiles CHR ===
-def generate_background(chr_data: bytes, palette, tiles_per_row=16, zoom=2):
-    """Crée une mosaïque 2D de toutes les tuiles CHR-ROM (ou simulée)."""
+def generate_background(chr_data: bytes, tiles_per_row=16) -> TilePyramid:
+    """Pyramide de la mosaïque 2D de toutes les tuiles CHR-ROM (ou simulée)."""
     # === Cas CHR-ROM absente (ROM avec CHR-RAM) ===
     if len(chr_data) == 0:
         st.markdown("""
@@ -18,44 +113,115 @@ def generate_background(chr_data: bytes, palette, tiles_per_row=16, zoom=2):
         """, unsafe_allow_html=True)
 
         # Génère une fausse CHR avec 8 Ko de données variées
-        fake_chr = np.zeros((8192,), dtype=np.uint8)
-        for i in range(0, len(fake_chr), 16):
-            pattern = (i // 32) % 256
-            for j in range(8):
-                fake_chr[i + j] = ((pattern >> (j % 8)) & 0xFF)
-                fake_chr[i + 8 + j] = ((~pattern >> (j % 8)) & 0xFF)
-        chr_data = fake_chr.tobytes()
-
-    # === Décodage standard des tuiles NES ===
-    total_tiles = len(chr_data) // 16
+        chr_data = simulated_chr()
+
+    # === Décodage standard des tuiles NES (planche d'indices en cache) ===
     tiles_per_row = max(8, tiles_per_row)
-    rows = (total_tiles + tiles_per_row - 1) // tiles_per_row
-    mosaic = np.zeros((rows * 8, tiles_per_row * 8), dtype=np.uint8)
-
-    for i in range(total_tiles):
-        tile_bytes = chr_data[i * 16:(i + 1) * 16]
-        low = np.frombuffer(tile_bytes[:8], dtype=np.uint8)
-        high = np.frombuffer(tile_bytes[8:], dtype=np.uint8)
-        tile = np.zeros((8, 8), dtype=np.uint8)
-        for y in range(8):
-            for x in range(8):
-                lo_bit = (low[y] >> (7 - x)) & 1
-                hi_bit = (high[y] >> (7 - x)) & 1
-                tile[y, x] = lo_bit + (hi_bit << 1)
-        r, c = divmod(i, tiles_per_row)
-        mosaic[r * 8:(r + 1) * 8, c * 8:(c + 1) * 8] = tile
-
-    # Application de la palette NES
-    rgb = palette[mosaic]
-    full_img = Image.fromarray(rgb, mode="RGB").resize(
-        (mosaic.shape[1] * zoom, mosaic.shape[0] * zoom),
-        Image.NEAREST
+    return cached_pyramid(chr_data, tiles_per_row)
+
+
+# === Rendu matériel ligne par ligne (registres loopy) ===
+SCANLINE_THEMES = ("mario", "metroid", "zelda", "mario")
+
+
+def demo_vram(mirroring: str) -> bytes:
+    """Une scène par name table physique : 2 Ko de CIRAM, 4 Ko en four_screen."""
+    count = 4 if mirroring == "four_screen" else 2
+    return b"".join(
+        build_nametable(build_name_table(theme), build_scene_palettes(theme))
+        for theme in SCANLINE_THEMES[:count]
+    )
+
+
+def cached_scanline_renderer(chr_data, mirroring: str) -> ScanlineRenderer:
+    """Plan 512×512 des 4 name tables logiques, partagé par (CHR, mirroring)."""
+    return ARTIFACT_CACHE.get_or_build(
+        content_key(chr_data), "scanline_renderer",
+        lambda: ScanlineRenderer(demo_vram(mirroring), cached_tiles(chr_data), mirroring),
+        params=(mirroring,),
+    )
+
+
+def scene_palette_ram(palettes: dict, palette_name: str) -> bytes:
+    """Palette RAM de fond (16 octets) : la palette choisie et les 3 suivantes comme sous-palettes."""
+    names = list(palettes)
+    start = names.index(palette_name)
+    return palette_ram(palettes[names[(start + i) % len(names)]] for i in range(4))
+
+
+def show_scanline_scroll(chr_data: bytes, mirroring: str, palettes: dict, palette_name: str, crt=None):
+    """Scroll du PPU réel : registres v/t/x, mirroring et changements de scroll en cours d'image."""
+    st.subheader("📺 Scroll matériel ligne par ligne (registres v, t, x)")
+    st.markdown("""
+    Sur la console, l'écran est lu dans **4 name tables logiques** (2×2), dont le **mirroring**
+    de la cartouche décide lesquelles sont des copies. Le CPU règle le scroll via `$2005`/`$2006`
+    pendant le vblank… ou **en cours d'image** : c'est ainsi que SMB3 garde sa barre de statut
+    fixe pendant que le décor défile.
+    """)
+    if len(chr_data) == 0:
+        chr_data = simulated_chr()
+
+    modes = list(MIRRORING)
+    mirroring = st.selectbox(
+        "🪞 Mirroring des name tables :", modes,
+        index=modes.index(mirroring) if mirroring in modes else 0, key="scanline_mirroring",
+    )
+    col1, col2 = st.columns(2)
+    scroll_x = col1.slider("Scroll X (0–511)", 0, 511, 0, key="scanline_x")
+    scroll_y = col2.slider("Scroll Y (0–479)", 0, 479, 0, key="scanline_y")
+    split = st.slider("Barre de statut fixe à partir de la ligne (240 = aucune)", 120, 240, 200, key="scanline_split")
+    wave = st.checkbox("🌊 Effet de vague (écriture `$2005` à chaque ligne)", key="scanline_wave")
+
+    # Écritures CPU en cours d'image : {ligne: [(registre, valeur), …]}
+    line_writes = {}
+    if wave:
+        for line in range(split):
+            offset = (scroll_x + int(6 * np.sin(line / 5))) & 0xFF
+            line_writes[line] = [(PPUSCROLL, offset), (PPUSCROLL, 0)]
+    if split < 240:
+        line_writes[split] = split_writes(0, 0, nametable=2)
+
+    # 4 sous-palettes de fond : la palette choisie et les 3 suivantes
+    colors = background_palette_rgb(scene_palette_ram(palettes, palette_name))
+
+    renderer = cached_scanline_renderer(chr_data, mirroring)
+    frame = renderer.render(scroll_x, scroll_y, line_writes=line_writes)
+    runs = scroll_runs(*scanline_positions(scroll_writes(scroll_x, scroll_y), line_writes))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        show_frame(indexed_image(frame, colors), crt, caption=f"Écran 256×240 — {len(runs)} bloc(s) de lignes copiés",
+                   area="scanline_screen")
+    with col2, pixel_area("scanline_plane"):
+        show_pixels(indexed_image(renderer.plane, colors), caption=f"4 name tables logiques (512×512) — {mirroring}")
+
+    st.caption("""
+    💡 Chaque bloc de lignes qui partage le même scroll est copié d'un seul coup depuis le plan ;
+    une barre de statut ajoute un bloc, l'effet de vague en ajoute un par ligne.
+    """)
+
+
+# === Rendu dans le navigateur (composant canvas) ===
+def show_canvas_scroll(chr_data: bytes, mirroring: str, palettes: dict, palette_name: str):
+    """Mêmes name tables que le rendu ligne par ligne, mais composées et défilées dans le navigateur."""
+    st.subheader("⚡ Scroll dans le navigateur (canvas)")
+    st.markdown("""
+    Ici, le serveur n'envoie qu'une fois la **CHR brute**, les **name tables** (2 à 4 Ko) et les
+    **palettes** ; tuiles, plan et fenêtre sont ensuite dessinés en JavaScript. Glisser, zoomer ou
+    changer de palette ne relance pas le script Python.
+    """)
+    if len(chr_data) == 0:
+        chr_data = simulated_chr()
+    chr_canvas(
+        chr_data, demo_vram("four_screen"),
+        {name: scene_palette_ram(palettes, name) for name in palettes},
+        mirroring=mirroring if mirroring in MIRRORING else "horizontal",
+        palette_name=palette_name, key="ppu_canvas",
     )
-    return full_img
 
 
 # === Interface principale ===
-def show_ppu_scroller(chr_data: bytes):
+def show_ppu_scroller(chr_data: bytes, mirroring: str = "horizontal"):
     """Simulation interactive du scrolling NES (PPU)."""
     st.header("🌀 Simulation de scrolling NES (PPU)")
 
@@ -89,13 +255,11 @@ def show_ppu_scroller(chr_data: bytes):
     # --- Contrôles de zoom et disposition ---
     zoom = st.slider("Zoom (×)", 1, 6, 3)
     tiles_per_row = st.slider("Nombre de tuiles par ligne :", 16, 32, 24)
+    crt = crt_controls("ppu_scroll")
 
-    # Génération de la mosaïque
-    background = generate_background(chr_data, palette, tiles_per_row=tiles_per_row, zoom=zoom)
-    if background is None:
-        return
-
-    bg_width, bg_height = background.size
+    # Pyramide de la mosaïque (aucun agrandissement complet : seuls les blocs visibles sont calculés)
+    background = generate_background(chr_data, tiles_per_row=tiles_per_row)
+    bg_width, bg_height = background.size(zoom)
 
     # === Contrôles de scrolling ===
     st.markdown("### 🎮 Contrôle du défilement")
@@ -103,8 +267,9 @@ def show_ppu_scroller(chr_data: bytes):
     scroll_y = st.slider("📜 Défilement vertical", 0, max(0, bg_height - 240), 0)
 
     # === Rendu de la fenêtre visible ===
-    viewport = background.crop((scroll_x, scroll_y, scroll_x + 256, scroll_y + 240))
-    st.image(viewport, caption="🪄 Fenêtre visible (256×240 pixels NES)", use_container_width=True)
+    window = background.viewport(scroll_x, scroll_y, zoom)
+    viewport = indexed_image(window, palette)
+    show_frame(viewport, crt, caption="🪄 Fenêtre visible (256×240 pixels NES)", area="ppu_scroll")
 
     # === Visualisation ASCII ===
     st.subheader("🧠 Visualisation du principe de caméra")
@@ -129,6 +294,10 @@ def show_ppu_scroller(chr_data: bytes):
 
     st.code(camera_ascii, language="text")
 
+    # === Scroll matériel (name tables, mirroring, coupures en cours d'image) ===
+    show_canvas_scroll(chr_data, mirroring, all_palettes, palette_name)
+    show_scanline_scroll(chr_data, mirroring, all_palettes, palette_name, crt)
+
     # === Explications pédagogiques ===
     st.caption("""
     💡 La NES déplace simplement la “caméra” sur la grande carte de tuiles.  
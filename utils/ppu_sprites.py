@@ -0,0 +1,152 @@
+# utils/ppu_sprites.py
+"""
+Couche sprites du PPU à partir d'une vraie table OAM (256 octets, 64 sprites × 4).
+
+Chaque entrée OAM : Y (ligne du haut − 1), tuile, attributs, X.
+Attributs : bits 0-1 sous-palette (sprites : $3F10–$3F1F), bit 5 derrière le fond,
+bit 6 miroir horizontal, bit 7 miroir vertical.
+
+Les 64 sprites sont rendus d'un bloc avec NumPy, sans boucle par sprite ni par pixel :
+- motifs (64, h, 8) lus en un accès indexé, miroirs compris ;
+- limite de 8 sprites par ligne : cumul par ligne du nombre de sprites présents,
+  les suivants (dans l'ordre OAM) ne sont pas dessinés et la ligne est signalée ;
+- priorité : à pixel égal, le sprite d'indice OAM le plus bas gagne (np.minimum.at
+  sur un tampon « propriétaire » par pixel), puis son bit 5 décide s'il passe derrière un
+  pixel de fond opaque — comme sur la console, même si un autre sprite est devant ;
+- sprite 0 hit : premier pixel opaque du sprite 0 sur un pixel de fond opaque.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+OAM_SIZE = 256
+SPRITE_COUNT = 64
+SPRITES_PER_LINE = 8
+SCREEN_H, SCREEN_W = 240, 256
+HIDDEN_Y = 0xEF                 # Y >= $EF : sprite hors écran
+
+ATTR_PALETTE = 0x03
+ATTR_BEHIND = 0x20
+ATTR_HFLIP = 0x40
+ATTR_VFLIP = 0x80
+SPRITE_PALETTE_BASE = 0x10      # indices 16..31 de la table de couleurs de l'image
+
+
+@dataclass(frozen=True)
+class SpriteFrame:
+    """Rendu des sprites d'une image (indices 0 = aucun sprite)."""
+    indices: np.ndarray         # (240, 256) uint8 : 0x10 | sous-palette << 2 | pixel
+    behind: np.ndarray          # (240, 256) bool : pixel de sprite derrière le fond
+    sprite0: np.ndarray         # (240, 256) bool : pixels opaques du sprite 0
+    overflow_lines: np.ndarray  # lignes où plus de 8 sprites étaient présents
+    dropped: int                # nombre de (sprite, ligne) non dessinés à cause de la limite
+
+    @property
+    def overflow(self) -> bool:
+        """Drapeau « sprite overflow » (bit 5 de PPUSTATUS), sans le bug d'évaluation du PPU."""
+        return len(self.overflow_lines) > 0
+
+
+def build_oam(sprites) -> bytes:
+    """OAM de 256 octets à partir de (x, y, tuile, attributs) ; les entrées absentes sont cachées (Y = $FF)."""
+    oam = np.full((SPRITE_COUNT, 4), 0xFF, dtype=np.uint8)
+    entries = np.array(list(sprites)[:SPRITE_COUNT], dtype=np.int64).reshape(-1, 4)
+    oam[:len(entries)] = entries[:, [1, 2, 3, 0]] & 0xFF       # ordre OAM : Y, tuile, attributs, X
+    return oam.tobytes()
+
+
+def parse_oam(oam) -> np.ndarray:
+    """Table OAM (64, 4) : colonnes Y, tuile, attributs, X."""
+    data = np.frombuffer(bytes(oam[:OAM_SIZE]), dtype=np.uint8)
+    if len(data) < OAM_SIZE:
+        raise ValueError(f"OAM incomplète : {len(data)} octets au lieu de {OAM_SIZE}")
+    return data.reshape(SPRITE_COUNT, 4)
+
+
+def sprite_patterns(oam: np.ndarray, tiles: np.ndarray, tall: bool = False, pattern_table: int = 0) -> np.ndarray:
+    """
+    Motifs (64, h, 8) des sprites, miroirs appliqués, lus en un seul np.take : les miroirs
+    inversent les indices de ligne / colonne au lieu des pixels. En 8×16, le bit 0 du
+    numéro de tuile choisit la table de motifs et la tuile paire / impaire forme le
+    haut / bas ; en 8×8, la table vient de PPUCTRL (pattern_table, bit 3).
+    """
+    height = 16 if tall else 8
+    tile, attr = oam[:, 1].astype(np.intp), oam[:, 2]
+    base = (tile & 0xFE) + 256 * (tile & 1) if tall else tile + 256 * pattern_table
+    rows = np.where((attr & ATTR_VFLIP)[:, None] > 0, np.arange(height - 1, -1, -1), np.arange(height))
+    cols = np.where((attr & ATTR_HFLIP)[:, None] > 0, np.arange(7, -1, -1), np.arange(8))
+    row_start = ((base[:, None] + (rows >> 3)) % len(tiles)) * 64 + (rows & 7) * 8   # (64, h)
+    return np.take(tiles.reshape(-1), row_start[:, :, None] + cols[:, None, :])
+
+
+def render_sprites(oam, tiles: np.ndarray, tall: bool = False, pattern_table: int = 0) -> SpriteFrame:
+    """Rend les 64 sprites de l'OAM en une passe (voir l'en-tête du module)."""
+    oam = parse_oam(oam)
+    height = 16 if tall else 8
+    patterns = sprite_patterns(oam, tiles, tall, pattern_table)
+
+    top = oam[:, 0].astype(np.int16) + 1                         # affiché une ligne sous Y
+    top[oam[:, 0] >= HIDDEN_Y] = SCREEN_H                        # hors écran
+    left = oam[:, 3].astype(np.intp)
+
+    # Limite de 8 sprites par ligne, dans l'ordre OAM : (ligne − haut) non signé < hauteur
+    lines = np.arange(SCREEN_H, dtype=np.int16)
+    present = (lines - top[:, None]).view(np.uint16) < height    # (64, 240)
+    rank = np.cumsum(present, axis=0, dtype=np.uint8)
+    drawn = present & (rank <= SPRITES_PER_LINE)
+    overflow_lines = np.flatnonzero(rank[-1] > SPRITES_PER_LINE)
+    dropped = int(rank[-1].sum()) - int(np.count_nonzero(drawn))
+
+    # Lignes de chaque sprite effectivement dessinées (64, h), puis pixels opaques (64, h, 8)
+    row_y = top[:, None].astype(np.intp) + np.arange(height)
+    row_drawn = np.take_along_axis(drawn, np.minimum(row_y, SCREEN_H - 1), axis=1) & (row_y < SCREEN_H)
+    col_x = left[:, None] + np.arange(8)
+    opaque = (patterns != 0) & row_drawn[:, :, None] & (col_x < SCREEN_W)[:, None, :]
+
+    # Pixels opaques à plat, dans l'ordre (sprite, ligne, colonne)
+    k = np.flatnonzero(opaque)
+    ids = (k // (height * 8)).astype(np.uint8)
+    pos = row_y.reshape(-1)[k >> 3] * SCREEN_W + col_x.reshape(-1)[(ids.astype(np.intp) << 3) | (k & 7)]
+    pix = patterns.reshape(-1)[k]
+
+    # Sprite d'indice OAM le plus bas sur chaque pixel (positions uniques ensuite)
+    owner = np.full(SCREEN_H * SCREEN_W, SPRITE_COUNT, dtype=np.uint8)
+    np.minimum.at(owner, pos, ids)
+    front = owner[pos] == ids
+    pos, ids, pix = pos[front], ids[front], pix[front]
+    attr = oam[ids, 2]
+
+    indices = np.zeros(SCREEN_H * SCREEN_W, dtype=np.uint8)
+    behind = np.zeros(SCREEN_H * SCREEN_W, dtype=bool)
+    indices[pos] = SPRITE_PALETTE_BASE | (attr & ATTR_PALETTE) << 2 | pix
+    behind[pos] = (attr & ATTR_BEHIND) > 0
+    sprite0 = owner == 0                                         # le sprite 0 est toujours devant
+
+    shape = (SCREEN_H, SCREEN_W)
+    return SpriteFrame(indices.reshape(shape), behind.reshape(shape), sprite0.reshape(shape),
+                       overflow_lines, dropped)
+
+
+def composite(background: np.ndarray, sprites: SpriteFrame) -> np.ndarray:
+    """
+    Image d'indices (240, 256) fond + sprites. Un sprite « derrière » n'apparaît que sur
+    les pixels de fond transparents (pixel 0, couleur universelle).
+    """
+    hidden = sprites.behind & ((background & 0x03) > 0)
+    out = np.array(background, dtype=np.uint8)
+    np.copyto(out, sprites.indices, where=(sprites.indices > 0) & ~hidden)
+    return out
+
+
+def sprite0_hit(background: np.ndarray, sprites: SpriteFrame):
+    """
+    (x, y) du premier sprite 0 hit dans l'ordre de balayage, ou None. Comme sur le PPU,
+    la colonne 255 ne déclenche jamais de hit et la priorité du sprite est ignorée.
+    """
+    hits = sprites.sprite0 & ((background & 0x03) > 0)
+    hits[:, SCREEN_W - 1] = False
+    flat = np.flatnonzero(hits)
+    if not len(flat):
+        return None
+    y, x = divmod(int(flat[0]), SCREEN_W)
+    return x, y
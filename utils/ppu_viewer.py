@@ -2,11 +2,52 @@ import numpy as np
 from PIL import Image
 import streamlit as st
 from utils.nes_palette import NES_PALETTE, DEMO_PALETTES, GAME_PALETTES
+from utils.artifacts import ARTIFACT_CACHE, content_key
+from utils.chr import cached_page_mosaic, page_count
+from utils.ppu_render import indexed_image, recolor
+from utils.nes_crt_view import crt_controls, show_frame
 
-def render_chr_mosaic(chr_data: bytes, tiles_per_row: int = 16, zoom: int = 4):
+PAGE_SIZES = {"4 Ko (256 tuiles)": 4096, "8 Ko (512 tuiles)": 8192}
+
+
+def render_page_image(chr_data, page: int, page_size: int, tiles_per_row: int, palette) -> Image.Image:
     """
-    Affiche une mosaïque complète de toutes les tuiles CHR-ROM.
+    Image d'une page de CHR à résolution native, colorisée (l'agrandissement est fait par
+    le navigateur). L'image indexée (mode "P") est mise en cache par (CHR, page, taille,
+    tuiles par ligne) : changer de palette ne fait que lui associer une nouvelle table de
+    couleurs, et revenir sur une page est immédiat.
+    """
+    def build():
+        return indexed_image(cached_page_mosaic(chr_data, page, page_size, tiles_per_row))
+
+    img = ARTIFACT_CACHE.get_or_build(
+        content_key(chr_data), "chr_page_image", build,
+        params=(page, page_size, tiles_per_row),
+    )
+    return recolor(img, palette)
+
+
+def select_chr_page(chr_data, key: str, default_size: str = "4 Ko (256 tuiles)"):
+    """Sélecteurs taille de page / n° de page ; renvoie (page, taille en octets)."""
+    col1, col2 = st.columns([1, 2])
+    size_label = col1.radio(
+        "Taille de page :", list(PAGE_SIZES), index=list(PAGE_SIZES).index(default_size),
+        horizontal=True, key=f"{key}_page_size",
+    )
+    page_size = PAGE_SIZES[size_label]
+    pages = page_count(chr_data, page_size)
+    page = 0
+    if pages > 1:
+        page = col2.slider(f"Banque CHR ({pages} pages) :", 0, pages - 1, 0, key=f"{key}_page")
+    return page, page_size
+
+
+def render_chr_mosaic(chr_data: bytes, tiles_per_row: int = 16, zoom: int = 4, crt=None):
+    """
+    Affiche la CHR-ROM page par page (banques de 4 ou 8 Ko) : seule la page visible
+    est décodée et colorisée, la mémoire reste constante quelle que soit la taille de la CHR.
     Si aucune CHR n’est présente, on crée une mosaïque simulée (CHR-RAM factice).
+    crt : réglages de l'effet CRT (nes_crt_view.CrtSettings) ou None.
     """
     # === Étape 1 : Si pas de CHR-ROM, génération d'une zone graphique simulée ===
     if len(chr_data) == 0:
@@ -26,24 +67,10 @@ def render_chr_mosaic(chr_data: bytes, tiles_per_row: int = 16, zoom: int = 4):
                 fake_chr[i + 8 + j] = ((~v >> (j % 8)) & 0xFF)
         chr_data = fake_chr.tobytes()
 
-    # === Étape 2 : Décodage normal des tuiles ===
+    # === Étape 2 : Choix de la page (décodée à la demande) ===
     total_tiles = len(chr_data) // 16
     tiles_per_row = max(8, tiles_per_row)
-    rows = (total_tiles + tiles_per_row - 1) // tiles_per_row
-    mosaic = np.zeros((rows * 8, tiles_per_row * 8), dtype=np.uint8)
-
-    for i in range(total_tiles):
-        tile_bytes = chr_data[i * 16:(i + 1) * 16]
-        low = np.frombuffer(tile_bytes[:8], dtype=np.uint8)
-        high = np.frombuffer(tile_bytes[8:], dtype=np.uint8)
-        tile = np.zeros((8, 8), dtype=np.uint8)
-        for y in range(8):
-            for x in range(8):
-                lo_bit = (low[y] >> (7 - x)) & 1
-                hi_bit = (high[y] >> (7 - x)) & 1
-                tile[y, x] = lo_bit + (hi_bit << 1)
-        r, c = divmod(i, tiles_per_row)
-        mosaic[r*8:(r+1)*8, c*8:(c+1)*8] = tile
+    page, page_size = select_chr_page(chr_data, "ppu_viewer")
 
     # === Étape 3 : Fusion palettes (démo + jeux réels) ===
     all_palettes = {**DEMO_PALETTES}
@@ -60,14 +87,12 @@ def render_chr_mosaic(chr_data: bytes, tiles_per_row: int = 16, zoom: int = 4):
     indices = all_palettes[palette_name]
     palette = NES_PALETTE[indices]
 
-    # === Étape 5 : Rendu final ===
-    rgb_image = palette[mosaic]
-    img = Image.fromarray(rgb_image, mode="RGB").resize(
-        (mosaic.shape[1] * zoom, mosaic.shape[0] * zoom),
-        Image.NEAREST
-    )
-
-    st.image(img, caption=f"Mosaïque complète des {total_tiles} tuiles CHR", use_container_width=True)
+    # === Étape 5 : Rendu de la page (en cache) ===
+    img = render_page_image(chr_data, page, page_size, tiles_per_row, palette)
+    first = page * page_size // 16
+    last = min(total_tiles, first + page_size // 16) - 1
+    show_frame(img, crt, caption=f"Page {page} — tuiles {first} à {last} sur {total_tiles}", zoom=zoom,
+               area="ppu_viewer")
 
     st.caption(f"💡 Palette active : **{palette_name}** — indices {indices}")
     st.info("""
@@ -86,8 +111,9 @@ def show_ppu_viewer(chr_data: bytes):
 
     tiles_per_row = st.slider("Nombre de tuiles par ligne :", 8, 32, 16, step=4)
     zoom = st.slider("Facteur de zoom :", 1, 10, 4)
+    crt = crt_controls("ppu_viewer")
 
-    render_chr_mosaic(chr_data, tiles_per_row, zoom)
+    render_chr_mosaic(chr_data, tiles_per_row, zoom, crt)
 
     st.info("""
     🎨 Chaque carré représente une tuile 8×8 issue de la mémoire graphique (CHR).  
@@ -0,0 +1,216 @@
+# utils/rom_image.py
+"""
+RomImage : une ROM NES adossée à un unique buffer (mmap du fichier ou bytes).
+
+La ROM peut aussi provenir d'un membre d'archive .zip (décompressé en mémoire).
+Le header, le trainer, la PRG-ROM, la CHR-ROM et chaque banque sont exposés
+sous forme de memoryview (ou de vues NumPy via frombuffer) : aucune section
+n'est recopiée. Un registre de processus partage la même instance entre toutes
+les sessions Streamlit qui ouvrent le même fichier ; il garde les ROMs récemment
+ouvertes (LRU borné en mémoire) pour qu'un retour sur l'une d'elles soit immédiat.
+"""
+import mmap
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from utils import artifacts, hashing, rom_zip
+from utils.ines import HEADER_SIZE, parse_header
+
+PRG_BANK_SIZE = 16 * 1024
+CHR_BANK_SIZE = 8 * 1024
+DEFAULT_REGISTRY_MB = int(os.environ.get("NES_LAB_ROMS_MB", "64"))
+
+
+class RomImage:
+    """ROM iNES en lecture seule, découpée en vues sans copie."""
+
+    def __init__(self, buffer, path: str = None, name: str = None):
+        self._buffer = buffer
+        self._view = memoryview(buffer).toreadonly()
+        self.path = path
+        self.member = None
+        self.name = name or (os.path.basename(path) if path else "ROM")
+        self.size = len(self._view)
+
+        header = self._view[:HEADER_SIZE]
+        self.ines = parse_header(header)
+        self.is_ines = self.ines.valid
+        self.prg_size = self.ines.prg_rom_size
+        self.chr_size = self.ines.chr_rom_size
+        self.has_trainer = self.ines.trainer
+
+        self.trainer_offset = self.ines.trainer_offset
+        self.prg_offset = self.ines.prg_offset
+        self.chr_offset = self.ines.chr_offset
+
+        # Vues créées une seule fois : les mêmes objets sont renvoyés à chaque rerun
+        self.header = header
+        self.trainer = self._view[self.trainer_offset:self.prg_offset]
+        self.prg = self._view[self.prg_offset:self.chr_offset]
+        self.chr = self._view[self.chr_offset:self.chr_offset + self.chr_size]
+        self._digests = None
+
+    # --- Constructeurs ---
+    @classmethod
+    def from_file(cls, path: str, name: str = None) -> "RomImage":
+        """Mappe le fichier en mémoire (lecture seule) ; les fichiers vides sont lus en bytes."""
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls(b"", path=path, name=name)
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, path=path, name=name)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, name: str = None) -> "RomImage":
+        return cls(data, name=name)
+
+    @classmethod
+    def from_zip(cls, path: str, member: str, name: str = None) -> "RomImage":
+        """Charge un membre d'archive .zip (sans extraction sur disque)."""
+        rom = cls(rom_zip.read_member(path, member), name=name or os.path.basename(member))
+        rom.member = member
+        return rom
+
+    # --- Banques ---
+    def prg_bank_count(self, bank_size: int = PRG_BANK_SIZE) -> int:
+        return len(self.prg) // bank_size
+
+    def chr_bank_count(self, bank_size: int = CHR_BANK_SIZE) -> int:
+        return len(self.chr) // bank_size
+
+    def prg_bank(self, index: int, bank_size: int = PRG_BANK_SIZE) -> memoryview:
+        """Vue sur la banque PRG n° index (16 Ko par défaut, ou 8/32 Ko selon le mapper)."""
+        if not 0 <= index < self.prg_bank_count(bank_size):
+            raise IndexError(f"Banque PRG {index} hors limites")
+        return self.prg[index * bank_size:(index + 1) * bank_size]
+
+    def chr_bank(self, index: int, bank_size: int = CHR_BANK_SIZE) -> memoryview:
+        """Vue sur la banque CHR n° index (8 Ko par défaut, ou 1/2/4 Ko selon le mapper)."""
+        if not 0 <= index < self.chr_bank_count(bank_size):
+            raise IndexError(f"Banque CHR {index} hors limites")
+        return self.chr[index * bank_size:(index + 1) * bank_size]
+
+    # --- Vues NumPy (sans copie, lecture seule si mmap) ---
+    def prg_array(self) -> np.ndarray:
+        return np.frombuffer(self.prg, dtype=np.uint8)
+
+    def chr_array(self) -> np.ndarray:
+        return np.frombuffer(self.chr, dtype=np.uint8)
+
+    # --- Empreintes ---
+    @property
+    def digests(self) -> dict:
+        """Empreintes avec/sans header (utils.hashing), calculées une fois."""
+        if self.path and self.member is None:
+            return hashing.hash_file(self.path)
+        if self._digests is None:
+            self._digests = hashing.hash_buffer(self._view)
+        return self._digests
+
+    @property
+    def sha1(self) -> str:
+        return self.digests["headered"]["sha1"]
+
+    @property
+    def nbytes(self) -> int:
+        return self.size
+
+    def anomalies(self) -> list:
+        return self.ines.anomalies(self.size)
+
+    def __repr__(self):
+        return f"RomImage({self.name!r}, PRG={self.prg_size // 1024} Ko, CHR={self.chr_size // 1024} Ko)"
+
+
+# --- Registre LRU des ROMs ouvertes ---
+_REGISTRY = OrderedDict()  # (chemin absolu, membre, taille, mtime) -> RomImage
+_REGISTRY_LOCK = threading.Lock()
+_registry_budget = DEFAULT_REGISTRY_MB * 1024 * 1024
+
+
+def _release(rom: RomImage):
+    """Libère les références d'une ROM évincée (ses artefacts décodés sont laissés au budget LRU)."""
+    for view in (rom.prg, rom.chr):
+        artifacts.release(view)
+
+
+def _evict_locked():
+    # La ROM la plus récente reste toujours chargée, même si elle dépasse seule le budget
+    while len(_REGISTRY) > 1 and sum(r.nbytes for r in _REGISTRY.values()) > _registry_budget:
+        _, rom = _REGISTRY.popitem(last=False)
+        _release(rom)
+
+
+def set_registry_budget(budget_bytes: int):
+    global _registry_budget
+    with _REGISTRY_LOCK:
+        _registry_budget = budget_bytes
+        _evict_locked()
+
+
+def registry_stats() -> dict:
+    with _REGISTRY_LOCK:
+        return {
+            "roms": [rom.name for rom in reversed(_REGISTRY.values())],
+            "used_mb": round(sum(r.nbytes for r in _REGISTRY.values()) / (1024 * 1024), 2),
+            "budget_mb": round(_registry_budget / (1024 * 1024), 2),
+        }
+
+
+def open_rom(path: str, name: str = None, member: str = None) -> RomImage:
+    """
+    Instance partagée par tout le processus pour un fichier ROM, ou pour un membre
+    d'archive .zip si `member` est fourni (rouverte si le fichier change sur disque).
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), member, st.st_size, st.st_mtime_ns)
+    with _REGISTRY_LOCK:
+        rom = _REGISTRY.get(key)
+        if rom is not None:
+            _REGISTRY.move_to_end(key)
+            return rom
+        for old in [k for k in _REGISTRY if k[:2] == key[:2]]:
+            _release(_REGISTRY.pop(old))
+        if member is None:
+            rom = RomImage.from_file(path, name=name)
+        else:
+            rom = RomImage.from_zip(path, member, name=name)
+        _REGISTRY[key] = rom
+        _evict_locked()
+    return rom
+
+
+# --- Catalogue du dossier roms/ ---
+@lru_cache(maxsize=256)
+def _zip_entries(path: str, size: int, mtime_ns: int) -> tuple:
+    return tuple(member.name for member in rom_zip.iter_nes_members(path))
+
+
+def list_roms(root="roms") -> list:
+    """
+    ROMs disponibles sous root : liste de (libellé, chemin, membre) — membre vaut None
+    pour un fichier .nes. Le contenu des archives est mis en cache par (taille, mtime).
+    """
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    catalog = []
+    for path in sorted(p for p in root.rglob("*") if p.is_file()):
+        label = path.relative_to(root).as_posix()
+        ext = path.suffix.lower()
+        if ext == ".nes":
+            catalog.append((label, str(path), None))
+        elif ext == ".zip":
+            st = path.stat()
+            try:
+                members = _zip_entries(str(path), st.st_size, st.st_mtime_ns)
+            except (OSError, zipfile.BadZipFile):
+                continue
+            catalog.extend((f"{label} › {name}", str(path), name) for name in members)
+    return catalog
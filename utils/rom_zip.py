@@ -0,0 +1,83 @@
+# utils/rom_zip.py
+"""
+Lecture des ROMs directement dans les archives .zip, sans extraction sur disque.
+
+- Le répertoire central du zip donne gratuitement la taille et le CRC32 de chaque
+  membre : c'est exactement le CRC « avec header » référencé par No-Intro, ce qui
+  permet une identification sans aucune décompression.
+- Pour savoir si un membre est une image NES, seuls ses 16 premiers octets sont
+  décompressés (signature iNES) ; le reste n'est lu que si la ROM est chargée.
+"""
+import zipfile
+from dataclasses import dataclass
+
+from utils.ines import HEADER_SIZE, INES_MAGIC
+
+
+@dataclass(frozen=True)
+class ZipMember:
+    """Membre d'archive : métadonnées du répertoire central + header iNES éventuel."""
+    archive: str
+    name: str
+    size: int
+    crc32: str          # hexadécimal minuscule, comme dans les .dat No-Intro
+    header: bytes = b""
+
+    @property
+    def is_nes(self) -> bool:
+        return self.header[:4] == INES_MAGIC
+
+
+def list_members(path: str) -> list:
+    """Membres (fichiers) d'une archive, sans rien décompresser."""
+    with zipfile.ZipFile(path) as zf:
+        return [
+            ZipMember(path, info.filename, info.file_size, f"{info.CRC:08x}")
+            for info in zf.infolist() if not info.is_dir()
+        ]
+
+
+def iter_nes_members(path: str):
+    """Membres dont les 16 premiers octets portent la signature iNES (seul ce bloc est décompressé)."""
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or info.file_size < HEADER_SIZE:
+                continue
+            with zf.open(info) as f:
+                header = f.read(HEADER_SIZE)
+            if header[:4] == INES_MAGIC:
+                yield ZipMember(path, info.filename, info.file_size, f"{info.CRC:08x}", header)
+
+
+def identify_members(path: str, index) -> list:
+    """
+    Identification No-Intro par le CRC32 et la taille du répertoire central :
+    liste de (ZipMember, entrée No-Intro ou None), sans aucune décompression.
+    """
+    return [
+        (member, next(iter(index.lookup(crc=member.crc32, size=member.size)), None))
+        for member in list_members(path)
+    ]
+
+
+def read_member(path: str, name: str) -> bytearray:
+    """
+    Décompresse un membre dans un buffer préalloué à sa taille finale.
+    Le header est lu en premier : si ce n'est pas une image NES, rien d'autre n'est lu.
+    """
+    with zipfile.ZipFile(path) as zf:
+        info = zf.getinfo(name)
+        with zf.open(info) as f:
+            header = f.read(HEADER_SIZE)
+            if header[:4] != INES_MAGIC:
+                raise ValueError(f"{name} n'est pas une image NES (signature iNES absente)")
+            buf = bytearray(info.file_size)
+            view = memoryview(buf)
+            view[:len(header)] = header
+            pos = len(header)
+            while pos < info.file_size:
+                n = f.readinto(view[pos:])
+                if not n:
+                    break
+                pos += n
+    return buf